@@ -1,29 +1,46 @@
 """All modules and packages used by morpho
 
 Subpackages:
-  - preprocessing: Process inputs before passing to stan
-  - loader: Load data for use by stan
-  - plot: Create plots from stan outputs
-  - postprocessing: Process stan outputs before or after plotting
+  - processors: Processors acting on the data (IO, sampling, plots...)
+  - utilities: Helpers for logging, parsing and running processors
+
+Processors are accessible as attributes of this module (e.g. morpho.IOJSONProcessor):
+the module defining a processor is only imported when the processor is requested,
+so that unused dependencies (ROOT, pystan...) are not loaded.
 """
 
 from __future__ import absolute_import
 
-import pkg_resources
-__version__ = pkg_resources.require("morpho")[0].version.split('-')[0]
-__commit__ = pkg_resources.require("morpho")[0].version.split('-')[-1]
+from . import processors
+from . import utilities
+from .utilities import registry
+
+__all__ = registry.list_processors()
+
+
+def _get_version():
+    import pkg_resources
+    version = pkg_resources.require("morpho")[0].version
+    return version.split('-')[0], version.split('-')[-1]
+
 
-# from . import processors
-# from . import utilities
+def __getattr__(name):
+    if name in ["__version__", "__commit__"]:
+        version, commit = _get_version()
+        globals().update({"__version__": version, "__commit__": commit})
+        return globals()[name]
+    value = registry.find_processor(name)
+    if value is None:
+        for module in [processors, utilities]:
+            if hasattr(module, name):
+                value = getattr(module, name)
+                break
+        else:
+            raise AttributeError(
+                "module '{}' has no attribute '{}'".format(__name__, name))
+    globals()[name] = value
+    return value
 
-__all__ = []
-import pkgutil
-import inspect
 
-for loader, name, is_pkg in pkgutil.walk_packages(__path__):
-    module = loader.find_module(name).load_module(name)
-    for name, value in inspect.getmembers(module):
-        if name.startswith("__"):
-          continue
-        globals()[name] = value
-        __all__.append(name)
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
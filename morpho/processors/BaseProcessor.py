@@ -6,7 +6,16 @@ Date: 06/26/18
 
 from __future__ import absolute_import
 import abc
+import sys
+import time
+import threading
+import tracemalloc
 import six
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: no RSS measurement
+    resource = None
 
 from morpho.utilities import morphologging
 import logging
@@ -15,6 +24,10 @@ logger = morphologging.getLogger(__name__)
 __all__ = []
 __all__.append(__name__)
 
+# Number of measurements in progress and started, shared by the threads of the process
+_measure_lock = threading.Lock()
+_measure_counts = {"active": 0, "started": 0}
+
 
 @six.add_metaclass(abc.ABCMeta)
 class BaseProcessor():
@@ -31,10 +44,17 @@ class BaseProcessor():
 
     Results:
         None
+
+    The wall time, CPU time (of the calling thread), peak RSS increase and (if
+    tracemalloc is tracing) the memory allocated by Configure and Run are stored
+    in the stats attribute. The memory is measured for the whole process: if
+    other processors were measured at the same time (in other threads), the
+    memory figures are labeled "process_" and include their allocations.
     '''
 
     def __init__(self, name, *args, **kwargs):
         self._procName = name
+        self.stats = dict()
         logger.debug("Creating processor <{}>".format(self._procName))
 
     @property
@@ -45,6 +65,46 @@ class BaseProcessor():
     def delete(self):
         return self._delete_processor
 
+    def _Measure(self, step, method, *args):
+        '''
+        Call method and store its resource usage in self.stats[step]
+        '''
+        with _measure_lock:
+            _measure_counts["active"] += 1
+            _measure_counts["started"] += 1
+            alone = _measure_counts["active"] == 1
+            started = _measure_counts["started"]
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            traced_start = tracemalloc.get_traced_memory()[0]
+            # The peak of another measurement in progress must not be reset
+            if alone:
+                tracemalloc.reset_peak()
+        rss_start = _get_peak_rss()
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            with _measure_lock:
+                _measure_counts["active"] -= 1
+                overlapped = not alone or _measure_counts["started"] != started
+            prefix = "process_" if overlapped else ""
+            stats = {
+                "wall_time": time.perf_counter() - wall_start,
+                "cpu_time": time.thread_time() - cpu_start,
+                prefix+"peak_rss_delta_kb": _get_peak_rss() - rss_start
+            }
+            if tracing:
+                traced_end, traced_peak = tracemalloc.get_traced_memory()
+                stats.update({prefix+"allocated_kb": (traced_end - traced_start)/1024.})
+                if not overlapped:
+                    stats.update({"allocated_peak_kb": (traced_peak - traced_start)/1024.})
+            if not hasattr(self, "stats"):
+                self.stats = dict()
+            self.stats.update({step: stats})
+            logger.debug("{} <{}>: {}".format(step, self.name, stats))
+
     def Configure(self, params):
         '''
         This method will be called by nymph to configure the processor
@@ -54,7 +114,7 @@ class BaseProcessor():
             self._delete_processor = params['delete']
         else:
             self._delete_processor = True
-        if not self.InternalConfigure(params):
+        if not self._Measure("Configure", self.InternalConfigure, params):
             logger.error("Error while configuring <{}>".format(self.name))
             return False
         return True
@@ -72,7 +132,7 @@ class BaseProcessor():
         This method will be called by nymph to run the processor
         '''
         logger.info("Run <{}>...".format(self.name))
-        if not self.InternalRun():
+        if not self._Measure("Run", self.InternalRun):
             logger.error("Error while running <{}>".format(self.name))
             return False
         logger.info("Done with <{}>".format(self.name))
@@ -85,3 +145,16 @@ class BaseProcessor():
         overridden by child class.
         '''
         return
+
+
+def _get_peak_rss():
+    '''
+    Peak resident set size of the process in kB (0 if unknown)
+    '''
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # ru_maxrss is in bytes on macOS
+        return peak/1024.
+    return peak
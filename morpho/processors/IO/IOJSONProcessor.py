@@ -89,6 +89,10 @@ class IOJSONProcessor(IOProcessor):
                 logger.error("Variable {} does not exist in {}".format(
                     self.variables, self.file_name))
                 return False
+        # numpy arrays cannot be serialized
+        for key, value in subData.items():
+            if hasattr(value, "tolist"):
+                subData[key] = value.tolist()
         with open(self.file_name, 'w') as json_file:
             try:
                 self.my_module.dump(subData, json_file, **self.dump_kwargs)
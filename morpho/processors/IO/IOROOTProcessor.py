@@ -7,8 +7,11 @@ Date: 06/26/18
 from __future__ import absolute_import
 
 import os
+import glob
+import itertools
+from concurrent import futures
 
-from morpho.utilities import morphologging, reader
+from morpho.utilities import morphologging, reader, chunks
 logger = morphologging.getLogger(__name__)
 
 from morpho.processors.IO import IOProcessor
@@ -23,96 +26,233 @@ class IOROOTProcessor(IOProcessor):
     The ROOT Reader and Writer
 
     Parameters:
-        filename (required): path/name of file
+        filename (required): path/name of file; when reading, can also be a list of files
+            and/or glob patterns (the trees are concatenated)
         variables (required): variables to extract
         action: read or write (default="read")
         tree_name (required): name of the tree
-        file_option: option for the file (default=Recreate)
+        file_option: option for the file when writing: Recreate, Update, or New/Create
+            (fails if the file exists) (default=Recreate)
+        as_lists: return lists instead of numpy arrays (default=False)
+        writer_backend: library used to write the tree: uproot, root or auto (uproot if possible) (default=auto)
+        basket_size: number of entries per basket when writing (default=None: backend default)
+        compression: compression when writing, as "ALGORITHM:level" (ZLIB, LZMA, LZ4 or ZSTD)
+            or ROOT compression code (default=None: backend default)
+        entry_start: first entry to read in each file (default=None: first entry of the tree)
+        entry_stop: entry after the last one to read in each file (default=None: end of the tree);
+            a range without entries (e.g. entry_start beyond the end of the tree) gives empty columns
+        step_size: number of entries per chunk when reading (default=None: backend default)
+        streaming: instead of reading the whole tree, data is a ChunkStream yielding
+            chunks of step_size entries to the downstream processors (default=False)
+        file_index: name of a column added to the data, containing the index of the file
+            of each entry (default=None: no column)
+        n_threads: number of files read at the same time (default=None: python default)
 
     Input:
         None
 
     Results:
-        data: dictionary containing the data
+        data: dictionary containing the data (ChunkStream in streaming mode)
     '''
 
     def InternalConfigure(self, params):
         super().InternalConfigure(params)
         self.tree_name = reader.read_param(params, "tree_name", "required")
         self.file_option = reader.read_param(params, "file_option", "Recreate")
+        self.as_lists = reader.read_param(params, "as_lists", False)
+        self.writer_backend = reader.read_param(params, "writer_backend", "auto")
+        self.basket_size = reader.read_param(params, "basket_size", None)
+        self.compression = reader.read_param(params, "compression", None)
+        self.entry_start = reader.read_param(params, "entry_start", None)
+        self.entry_stop = reader.read_param(params, "entry_stop", None)
+        self.step_size = reader.read_param(params, "step_size", None)
+        self.streaming = reader.read_param(params, "streaming", False)
+        self.file_index = reader.read_param(params, "file_index", None)
+        self.n_threads = reader.read_param(params, "n_threads", None)
+        if self.streaming and self.as_lists:
+            logger.warning("as_lists is ignored in streaming mode")
         return True
 
     def Reader(self):
         '''
         Read the content of a TTree in a ROOT File.
-        Note the use of the uproot package.
+        Note the use of the uproot package; if uproot fails, ROOT (RDataFrame) is used.
         The variables should be a list of the "variable" to read.
+        The columns are read chunk by chunk into preallocated numpy arrays.
+        With ROOT, the entries of each file are read in one event loop (also in streaming mode).
         '''
-        logger.debug("Reading {}".format(self.file_name))
-        import uproot
-        for key in self.variables:
-            self.data.update({str(key): []})
+        file_names = _expand_file_names(self.file_name)
+        if len(file_names) == 0:
+            logger.error("No file matching {}".format(self.file_name))
+            return False
+        logger.debug("Reading {}".format(", ".join(file_names)))
+        if self.streaming:
+            # Files are opened concurrently to count the entries; they are read
+            # when the downstream processors iterate over the chunks
+            with futures.ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+                n_entries = list(executor.map(self._CountEntries, file_names))
+            if None in n_entries:
+                return False
+            self.data = chunks.ChunkStream(lambda: self._IterateFiles(file_names), sum(n_entries))
+            return True
         try:
-            tree = uproot.open(self.file_name)[self.tree_name]
-            for data in tree.iterate(self.variables):
-                for key, value in data.items():
-                    varName = key.decode("utf-8")
-                    self.data.update({str(varName): self.data[str(varName)] + value.tolist()})
-        except:
-            logger.warning("An uproot related error was encountered. Switching to ROOT.")
-            try:
-                import ROOT
-            except ImportError:
-                logger.warning("Failed importing ROOT")
-                pass
-            infile = ROOT.TFile(self.file_name,"READ")
-            tree = infile.Get(self.tree_name)
-            tree.GetEntry(0)
-            for varName in self.variables:
-                value = getattr(tree, varName)
-                if type(value)==int or type(value)==float:
-                    value = [value]
-                self.data.update(
-                    {str(varName): self.data[str(varName)] + value})
-        
+            # Files are opened (once) and decoded concurrently (decompression releases the GIL)
+            with futures.ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+                files_data = list(executor.map(self._ReadFile, file_names))
+            n_entries = [len(next(iter(a_data.values()), [])) for a_data in files_data]
+            # Files without entries are skipped (unless all of them are empty)
+            non_empty = [a_data for a_data, n in zip(files_data, n_entries) if n > 0] or files_data[:1]
+            if len(non_empty) == 1:
+                self.data = non_empty[0]
+            else:
+                self.data = chunks.fill_columns(non_empty, sum(n_entries))
+            if self.file_index is not None:
+                import numpy
+                self.data[self.file_index] = numpy.repeat(numpy.arange(len(file_names)), n_entries)
+        except Exception as err:
+            logger.error("Error while reading {}:\n{}".format(self.file_name, err))
+            return False
+
+        if self.as_lists:
+            for key, value in self.data.items():
+                if hasattr(value, "dtype") and value.dtype == object:
+                    # Variable-size branches: one array per entry
+                    self.data[key] = [getattr(item, "tolist", lambda: item)() for item in value]
+                elif hasattr(value, "tolist"):
+                    self.data[key] = value.tolist()
         return True
 
+    def _IterateFiles(self, file_names):
+        '''
+        Iterate over the chunks of several files (with the file index column if requested)
+        '''
+        import numpy
+        for i_file, file_name in enumerate(file_names):
+            for chunk in self._OpenChunks(file_name)[1]:
+                if self.file_index is not None:
+                    chunk[self.file_index] = numpy.full(len(next(iter(chunk.values()), [])), i_file)
+                yield chunk
+
+    def _CountEntries(self, file_name):
+        '''
+        Number of entries to read (between entry_start and entry_stop)
+        '''
+        try:
+            import uproot
+            n_entries = _get_num_entries(uproot.open(file_name)[self.tree_name])
+        except Exception as err:
+            logger.debug("Cannot count entries with uproot ({}); using ROOT".format(err))
+            try:
+                n_entries = _get_root_num_entries(file_name, self.tree_name)
+            except Exception as err:
+                logger.error("Cannot read {} from {}:\n{}".format(
+                    self.tree_name, file_name, err))
+                return None
+        start, stop = self._EntryRange(n_entries, file_name)
+        return stop - start
+
+    def _EntryRange(self, n_entries, file_name):
+        '''
+        Entries to read in a file, with a warning if the range selects none of them
+        '''
+        start, stop = _entry_range(n_entries, self.entry_start, self.entry_stop)
+        if start == stop and n_entries > 0:
+            logger.warning("No entry of {} between entry_start={} and entry_stop={} ({} entries)".format(
+                file_name, self.entry_start, self.entry_stop, n_entries))
+        return start, stop
+
+    def _ReadFile(self, file_name):
+        '''
+        Read the whole tree of a file into preallocated numpy arrays
+        '''
+        n_entries, iterator = self._OpenChunks(file_name)
+        return chunks.fill_columns(iterator, n_entries)
+
+    def _OpenChunks(self, file_name):
+        '''
+        Open the tree of a file, using uproot or ROOT if uproot fails
+        Returns:
+            int: number of entries to read
+            iterator: chunks of the tree ({branch name: numpy array of the chunk})
+        '''
+        try:
+            import uproot
+            tree = uproot.open(file_name)[self.tree_name]
+            start, stop = self._EntryRange(_get_num_entries(tree), file_name)
+            iterator = _iterate_uproot(tree, self.variables, start, stop, self.step_size)
+            # Errors of uproot on unsupported branches are raised by the first chunk
+            first_chunk = next(iterator)
+            return stop - start, itertools.chain([first_chunk], iterator)
+        except Exception as err:
+            logger.warning("An uproot related error was encountered ({}). Switching to ROOT.".format(err))
+        try:
+            n_total = _get_root_num_entries(file_name, self.tree_name)
+        except Exception as err:
+            logger.error("Cannot read {} from {} with ROOT:\n{}".format(
+                self.tree_name, file_name, err))
+            raise
+        start, stop = self._EntryRange(n_total, file_name)
+        return stop - start, _iterate_root(file_name, self.tree_name, self.variables,
+                                           start, stop, self.step_size or _root_chunk_size, n_total)
+
     def Writer(self):
         '''
         Write the data into a TTree in a ROOT File.
         The variables should be a list of dictionaries where
             - "variable" is the variable name in the input dictionary,
             - "root_alias" is the name of the branch in the tree,
-            - "type" is the type of data to be saved.
+            - "type" is the type of data to be saved (float, double, int, long or bool).
+        Variables without type are saved as int (32 bits) if they contain integers
+        and as float (32 bits) otherwise: use "long" or "double" to keep 64 bits.
+        Whole columns are given to the backend (uproot or ROOT) at once.
         '''
         logger.debug("Saving data in {}".format(self.file_name))
+        if not isinstance(self.file_name, str):
+            logger.error("Data can only be written in one file: {}".format(self.file_name))
+            return False
 
         rdir = os.path.dirname(self.file_name)
         if not rdir == "" and not os.path.exists(rdir):
             os.makedirs(rdir)
             logger.debug("Creating folder: {}".format(rdir))
 
-        logger.debug("Creating a file and tree")
-        try:
-            import ROOT
-        except ImportError:
-            pass
-
-        f = ROOT.TFile(self.file_name, self.file_option)
-        t = ROOT.TTree(self.tree_name, self.tree_name)
-        info_data = {}
-        numberData = -1
-        hasUpdatedNumberData = False
+        columns = self._GetColumns()
+        if columns is None:
+            return False
+        backend = self.writer_backend
+        if backend == "auto":
+            backend = "uproot" if _uproot_can_write() else "root"
+        logger.debug("Writing {} entries with {}".format(
+            len(columns[0][1]) if len(columns) > 0 else 0, backend))
+        if self.file_option.upper() not in _file_options:
+            logger.error("Unknown file_option <{}>; choose between {}".format(
+                self.file_option, ", ".join(_file_options)))
+            return False
+        if self.file_option.upper() in ["NEW", "CREATE"] and os.path.exists(self.file_name):
+            logger.error("{} already exists (file_option={})".format(self.file_name, self.file_option))
+            return False
+        if backend == "uproot":
+            self._WriteUproot(columns)
+        elif backend == "root":
+            self._WriteROOT(columns)
+        else:
+            logger.error("Unknown writer_backend <{}>; choose between 'auto', 'uproot' and 'root'".format(backend))
+            return False
+        logger.debug("File saved!")
+        return True
 
-        # Determine general properties of the tree: type and size of branches, number of iterations for the tree
-        logger.debug("Defining tree properties")
+    def _GetColumns(self):
+        '''
+        Convert the variables to write into numpy arrays
+        Returns:
+            list: (branch name, numpy array) for each variable, None if the data are inconsistent
+        '''
+        import numpy
+        columns = []
         for a_item in self.variables:
             if isinstance(a_item, dict) and "variable" in a_item.keys():
                 varName = a_item["variable"]
-                if "root_alias" in a_item:
-                    varRootAlias = a_item.get("root_alias")
-                else:
-                    varRootAlias = varName
+                varRootAlias = a_item.get("root_alias", varName)
                 varType = a_item.get("type")
             elif isinstance(a_item, str):
                 varName = a_item
@@ -120,93 +260,321 @@ class IOROOTProcessor(IOProcessor):
                 varType = None
             else:
                 logger.error("Unknown type: {}".format(a_item))
+                return None
+            try:
+                column = numpy.asarray(self.data[varName], dtype=_numpy_type_from_string(varType))
+                if varType is None or _numpy_type_from_string(varType) is None:
+                    column = column.astype(_default_numpy_type(column))
+            except (ValueError, TypeError) as err:
+                logger.error("Cannot convert <{}> into an array (only fixed-size lists can be saved):\n{}".format(
+                    varName, err))
+                return None
+            if column.dtype == object or column.ndim > 2:
+                logger.error("<{}> cannot be saved: only scalars and fixed-size lists are supported".format(varName))
+                return None
+            if len(columns) > 0 and len(column) != len(columns[0][1]):
+                logger.error("<{}> has {} entries but <{}> has {}".format(
+                    varRootAlias, len(column), columns[0][0], len(columns[0][1])))
+                return None
+            columns.append((str(varRootAlias), column))
+        return columns
 
-            if numberData < len(self.data[varName]):
-                if hasUpdatedNumberData:
-                    logger.warning(
-                        "Number of datapoints updated more than once: potential problem with input data")
-                else:
-                    logger.debug("Updating number datapoints")
-                numberData = len(self.data[varName])
-                hasUpdatedNumberData = True
-            if isinstance(self.data[varName][0], list):
-                info_subDict = {
-                    "len": len(self.data[varName][0]),
-                    "type": _branch_element_type_from_string(varType) or _branch_element_type(self.data[varName][0][0]),
-                    "root_alias": varRootAlias
-                }
-            else:
-                info_subDict = {
-                    "len": 0,
-                    "type": _branch_element_type_from_string(varType) or _branch_element_type(self.data[varName][0]),
-                    "root_alias": varRootAlias
-                }
-            info_data.update({str(varName): info_subDict})
-
-        # Create an empty class where the attributes will be used to write the tree
-        class AClass(object):
+    def _WriteUproot(self, columns):
+        '''
+        Write the columns with uproot: each basket is written in one call
+        '''
+        import uproot
+        compression = _parse_compression(self.compression)
+        options = dict()
+        if compression is not None:
+            options["compression"] = getattr(uproot, compression[0])(compression[1])
+        if self.file_option.upper() == "UPDATE" and os.path.exists(self.file_name):
+            f = uproot.update(self.file_name)
+            if compression is not None:
+                f.compression = options["compression"]
+        elif self.file_option.upper() in ["NEW", "CREATE"]:
+            f = uproot.create(self.file_name, **options)
+        else:
+            f = uproot.recreate(self.file_name, **options)
+        with f:
+            tree = f.mktree(self.tree_name,
+                            {name: (column.dtype, column.shape[1:]) if column.ndim > 1 else column.dtype
+                             for name, column in columns},
+                            title=self.tree_name)
+            n_entries = len(columns[0][1]) if len(columns) > 0 else 0
+            step = self.basket_size or max(n_entries, 1)
+            for start in range(0, n_entries, step):
+                tree.extend({name: column[start:start + step] for name, column in columns})
+
+    def _WriteROOT(self, columns):
+        '''
+        Write the columns with ROOT: with RDataFrame when all the branches are scalars,
+        by filling the tree from numpy buffers otherwise
+        '''
+        try:
+            import ROOT
+        except ImportError:
             pass
-        tempObject = AClass()
-
-        logger.debug("Creating branches")
-        from array import array
-        for key in info_data:
-            if info_data[key]["len"] == 0:
-                setattr(tempObject, str(info_data[key]["root_alias"]), array(info_data[key]['type'].lower(), [
-                        _get_zero_with_type(info_data[key]['type'])]))
-                t.Branch(str(str(info_data[key]['root_alias'])), getattr(
-                    tempObject, str(info_data[key]["root_alias"])), '{}/{}'.format(str(info_data[key]['root_alias']), info_data[key]['type']))
+        import numpy
+        compression = _parse_compression(self.compression)
+        from_numpy = getattr(ROOT.RDF, "FromNumpy", None) or getattr(ROOT.RDF, "MakeNumpyDataFrame", None)
+        if from_numpy is not None and all(column.ndim == 1 for _, column in columns):
+            df = from_numpy({name: numpy.ascontiguousarray(column) for name, column in columns})
+            options = ROOT.RDF.RSnapshotOptions()
+            options.fMode = self.file_option.upper()
+            if self.basket_size:
+                options.fAutoFlush = int(self.basket_size)
+            if compression is not None:
+                options.fCompressionAlgorithm = getattr(
+                    ROOT.ROOT.RCompressionSetting.EAlgorithm, "k" + compression[0])
+                options.fCompressionLevel = compression[1]
+            df.Snapshot(self.tree_name, self.file_name, [name for name, _ in columns], options)
+            return
+
+        f = ROOT.TFile(self.file_name, self.file_option)
+        if compression is not None:
+            f.SetCompressionSettings(_root_compression_codes[compression[0]]*100 + compression[1])
+        t = ROOT.TTree(self.tree_name, self.tree_name)
+        if self.basket_size:
+            t.SetAutoFlush(int(self.basket_size))
+        buffers = []
+        for name, column in columns:
+            a_buffer = numpy.zeros(column.shape[1:] or (1,), dtype=column.dtype)
+            if column.ndim == 1:
+                t.Branch(name, a_buffer, '{}/{}'.format(name, _root_type_codes[column.dtype.name]))
             else:
-                setattr(tempObject, str(info_data[key]["root_alias"]), array(info_data[key]['type'].lower(), int(
-                    info_data[key]['len']) * [_get_zero_with_type(info_data[key]['type'])]))
-                t.Branch(str(str(info_data[key]['root_alias'])),
-                         getattr(tempObject, str(info_data[key]['root_alias'])),
-                         '{}[{}]/{}'.format(str(info_data[key]['root_alias']), info_data[key]['len'], info_data[key]['type']))
-
-        logger.debug("Adding data")
-        for i in range(numberData):
-            for key in info_data:
-                temp_var = getattr(tempObject, str(info_data[key]['root_alias']))
-                if info_data[key]["len"] == 0:
-                    temp_var[0] = self.data[str(key)][i]
-                else:
-                    for j in range(info_data[key]["len"]):
-                        temp_var[j] = self.data[str(key)][i][j]
-                setattr(tempObject, str(key), temp_var)
+                t.Branch(name, a_buffer, '{}[{}]/{}'.format(name, column.shape[1], _root_type_codes[column.dtype.name]))
+            buffers.append((a_buffer, column))
+        for i in range(len(columns[0][1]) if len(columns) > 0 else 0):
+            for a_buffer, column in buffers:
+                a_buffer[:] = column[i]
             t.Fill()
         f.cd()
         t.Write()
         f.Close()
-        logger.debug("File saved!")
-        return True
 
 
-def _branch_element_type(element):
-    if isinstance(element, int):
-        return "I"
-    elif isinstance(element, float):
-        return "F"
+def read_trees(file_name, trees):
+    '''
+    Read several trees of a file, opening it only once (with uproot, or ROOT if uproot fails)
+    Args:
+        file_name: path of the ROOT file
+        trees: dictionary {tree name: list of variables}
+    Returns:
+        dict: {tree name: {variable: numpy array}}
+    '''
+    try:
+        import uproot
+        infile = uproot.open(file_name)
+        result = dict()
+        for tree_name, variables in trees.items():
+            tree = infile[tree_name]
+            result[tree_name] = chunks.fill_columns(_iterate_uproot(tree, variables),
+                                                    _get_num_entries(tree))
+        return result
+    except Exception as err:
+        logger.debug("Cannot read {} with uproot ({}); using ROOT".format(file_name, err))
+    return {tree_name: chunks.fill_columns(_iterate_root(file_name, tree_name, variables),
+                                           _get_root_num_entries(file_name, tree_name))
+            for tree_name, variables in trees.items()}
+
+
+def _expand_file_names(file_names):
+    '''
+    Returns:
+        list: files given as a path, a glob pattern or a list of them
+    '''
+    if isinstance(file_names, str):
+        file_names = [file_names]
+    expanded = []
+    for a_name in file_names:
+        if glob.has_magic(a_name):
+            expanded.extend(sorted(glob.glob(a_name)))
+        else:
+            expanded.append(a_name)
+    return expanded
+
+
+def _get_num_entries(tree):
+    '''
+    Number of entries of an uproot tree (uproot 3 and uproot >= 4)
+    '''
+    if hasattr(tree, "num_entries"):
+        return tree.num_entries
+    return tree.numentries
+
+
+def _entry_range(n_entries, entry_start=None, entry_stop=None):
+    '''
+    Entries to read, following the python slicing conventions (negative values count from the end)
+    Returns:
+        (int, int): first entry and entry after the last one
+    '''
+    start, stop, _ = slice(entry_start, entry_stop).indices(n_entries)
+    return start, max(start, stop)
+
+
+def _iterate_uproot(tree, variables, entry_start=None, entry_stop=None, step_size=None):
+    '''
+    Iterate over the chunks of an uproot tree (uproot 3 and uproot >= 4)
+    Yields:
+        dict: {branch name: numpy array of the chunk}; one chunk of empty arrays
+            (typed from the branches) if there is no entry to read
+    '''
+    if hasattr(tree, "num_entries"):
+        options = {"entry_start": entry_start, "entry_stop": entry_stop, "library": "np"}
+        empty_options = {"entry_start": 0, "entry_stop": 0, "library": "np"}
+        if step_size is not None:
+            options["step_size"] = step_size
     else:
-        logger.warning("{} not supported; using float".format(type(element)))
-        return "F"
+        options = {"entrystart": entry_start, "entrystop": entry_stop}
+        empty_options = {"entrystart": 0, "entrystop": 0}
+        if step_size is not None:
+            options["entrysteps"] = step_size
+    n_chunks = 0
+    for chunk in tree.iterate(variables, **options):
+        n_chunks += 1
+        yield _decode_keys(chunk)
+    if n_chunks == 0:
+        yield _decode_keys(tree.arrays(variables, **empty_options))
+
+
+def _decode_keys(chunk):
+    return {(key.decode("utf-8") if isinstance(key, bytes) else str(key)): value
+            for key, value in chunk.items()}
+
 
+# Number of entries per chunk given by the ROOT reader
+_root_chunk_size = 1000000
 
-def _branch_element_type_from_string(string):
-    if string == "float":
-        return "F"
-    elif string == "int":
-        return "I"
 
+def _get_root_num_entries(file_name, tree_name):
+    '''
+    Number of entries of a tree, using ROOT
+    '''
+    import ROOT
+    infile = ROOT.TFile.Open(file_name, "READ")
+    if not infile or infile.IsZombie():
+        raise IOError("Cannot open {}".format(file_name))
+    tree = infile.Get(tree_name)
+    if not tree:
+        infile.Close()
+        raise KeyError("No tree {} in {}".format(tree_name, file_name))
+    n_entries = int(tree.GetEntries())
+    infile.Close()
+    return n_entries
+
+
+def _iterate_root(file_name, tree_name, variables, entry_start=None, entry_stop=None,
+                  step_size=_root_chunk_size, n_entries=None):
+    '''
+    Iterate over the chunks of a tree using ROOT RDataFrame (bulk reads, no python loop).
+    The entry range is read in a single event loop; the chunks are slices of its result.
+    Args:
+        n_entries: number of entries of the tree, if already known (default=None: read from the file)
+    Yields:
+        dict: {branch name: numpy array of the chunk}; one chunk of empty arrays
+            (typed from the scalar branches) if there is no entry to read
+    '''
+    import numpy
+    import ROOT
+    if n_entries is None:
+        n_entries = _get_root_num_entries(file_name, tree_name)
+    entry_start, entry_stop = _entry_range(n_entries, entry_start, entry_stop)
+    df = ROOT.RDataFrame(tree_name, file_name)
+    if entry_start == entry_stop:
+        yield {str(var): numpy.empty(0, dtype=_root_column_types.get(str(df.GetColumnType(str(var))), "float64"))
+               for var in variables}
+        return
+    if entry_start > 0 or entry_stop < n_entries:
+        df = df.Range(entry_start, entry_stop)
+    columns = dict()
+    for key, value in df.AsNumpy([str(var) for var in variables]).items():
+        if value.dtype == object:
+            # Array branches are returned as one RVec per entry
+            value = [numpy.asarray(item) for item in value]
+            if len(set(item.shape for item in value)) == 1:
+                value = numpy.stack(value)
+            else:
+                value = _object_array(value)
+        columns[str(key)] = value
+    for start in range(0, entry_stop - entry_start, step_size):
+        yield {key: value[start:start + step_size] for key, value in columns.items()}
+
+
+def _object_array(items):
+    '''
+    1D numpy array of objects (e.g. arrays of different sizes)
+    '''
+    import numpy
+    array = numpy.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+_numpy_types = {"float": "float32", "double": "float64",
+                "int": "int32", "long": "int64", "bool": "bool"}
+
+_root_type_codes = {"float32": "F", "float64": "D", "int32": "I", "int64": "L",
+                    "uint32": "i", "uint64": "l", "int16": "S", "bool": "O"}
+
+_root_column_types = {"Float_t": "float32", "float": "float32", "Double_t": "float64", "double": "float64",
+                      "Int_t": "int32", "int": "int32", "UInt_t": "uint32", "unsigned int": "uint32",
+                      "Long64_t": "int64", "Long_t": "int64", "long": "int64", "ULong64_t": "uint64",
+                      "Short_t": "int16", "short": "int16", "Bool_t": "bool", "bool": "bool"}
+
+_file_options = ["RECREATE", "UPDATE", "NEW", "CREATE"]
+
+_root_compression_codes = {"ZLIB": 1, "LZMA": 2, "LZ4": 4, "ZSTD": 5}
+
+
+def _default_numpy_type(column):
+    '''
+    Type of the branches without type: int (32 bits) for integers and booleans, float (32 bits) otherwise
+    '''
+    if column.dtype.kind in "biu":
+        return "int32"
+    if column.dtype.kind != "f":
+        logger.warning("{} not supported; using float".format(column.dtype))
+    return "float32"
+
+
+def _numpy_type_from_string(string):
+    if string is None:
+        return None
+    if string in _numpy_types:
+        return _numpy_types[string]
     logger.debug(
         "{} not supported; while use data to determine type".format(string))
     return None
 
 
-def _get_zero_with_type(a_type):
-    if a_type == "F":
-        return 0.
-    elif a_type == "I":
-        return 0
-    else:
-        logger.warning("{} not supported; using float".format(a_type))
-        return 0.
+def _parse_compression(compression):
+    '''
+    Args:
+        compression: "ALGORITHM:level" (e.g. "LZ4:4") or ROOT compression code (e.g. 404)
+    Returns:
+        (str, int): algorithm (ZLIB, LZMA, LZ4 or ZSTD) and level, None for the default compression
+    '''
+    if compression is None:
+        return None
+    if isinstance(compression, int):
+        names = {code: name for name, code in _root_compression_codes.items()}
+        return names.get(compression//100, "ZLIB"), compression % 100
+    algorithm, _, level = str(compression).partition(":")
+    if algorithm.upper() not in _root_compression_codes:
+        logger.warning("Unknown compression {}; using default".format(compression))
+        return None
+    return algorithm.upper(), int(level or 1)
+
+
+def _uproot_can_write():
+    '''
+    uproot can write TTrees from numpy arrays since version 4
+    '''
+    try:
+        import uproot
+    except ImportError:
+        return False
+    return hasattr(uproot, "writing")
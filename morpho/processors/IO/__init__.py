@@ -3,8 +3,13 @@
 
 from __future__ import absolute_import
 
-from .IOProcessor import IOProcessor
-from .IOCVSProcessor import IOCVSProcessor
-from .IOJSONProcessor import IOJSONProcessor, IOYAMLProcessor
-from .IORProcessor import IORProcessor
-from .IOROOTProcessor import IOROOTProcessor
+from morpho.utilities import registry
+
+registry.make_lazy(__name__, {
+    "IOProcessor": ".IOProcessor",
+    "IOCVSProcessor": ".IOCVSProcessor",
+    "IOJSONProcessor": ".IOJSONProcessor",
+    "IOYAMLProcessor": ".IOJSONProcessor",
+    "IORProcessor": ".IORProcessor",
+    "IOROOTProcessor": ".IOROOTProcessor"
+})
@@ -8,11 +8,16 @@ Date: May 2020
 
 from __future__ import absolute_import
 
-import numpy as np
-import math
+import os
+import json
+from hashlib import md5
+from concurrent import futures
 from os.path import exists
 
-from morpho.utilities import morphologging, reader
+import numpy as np
+
+from morpho.utilities import morphologging, reader, credibleIntervals
+from morpho.utilities.accumulators import RunningStats, QuantileSketch, BinomialCounter
 from morpho.processors import BaseProcessor
 from morpho.processors.IO import IOROOTProcessor
 logger = morphologging.getLogger(__name__)
@@ -30,15 +35,21 @@ class CalibrationProcessor(BaseProcessor):
         in_param_names: List of strings naming parameters of interest inputted to the generator.
         
     Optional input:
-        cred_interval: List with float elements between 0 and 1 defining a posterior credible window; defaults to [0.05, 0.95]. If len(cred_interval)==1, this procesor finds the coverage of a limit. If len(cred_interval)==2, it finds the coverage of an interval.
+        cred_interval: List with float elements between 0 and 1 defining a posterior credible window; defaults to [0.05, 0.95]. If len(cred_interval)==1, this procesor finds the coverage of a limit. If len(cred_interval)==2, it finds the coverage of an interval. A list of such lists (e.g. [[0.16, 0.84], [0.05, 0.95], [0.9]]) gives the coverage of each of them: the posteriors are sorted once and all the bounds are derived from them in the same pass over the files.
         root_in_tree: Tree containing data generation input values in each file. Defaults to "input".
         root_post_tree: Tree containing analysis posteriors. Defaults to "analysis".
         post_param_names: List of strings naming posteriors produced by Stan analysis for a parameters of interest. Defaults to self.in_param_names.
         quantile: If True, compute quantile credible intervals. Otherwise, compute highest density intervals.
         check_if_nonzero: If True, check whether posteriors allow the parameters to be distinguished from zero (given some credible interval).
+        n_workers: Number of processes analyzing the files at the same time. Defaults to 1 (no pool).
+        summary_cache: Path of a JSON file where the summary of each file is kept, keyed by the file path and modification time. Files already summarized with the same settings are not read again; files that could not be read are retried. Defaults to None (no cache).
+        report_every: Number of files between two reports of the partial coverages while the files are analyzed. Defaults to None (no partial report).
+        
+    The statistics of the ensemble (coverages, interval widths, averages) are accumulated online, file after file, so that the memory used does not grow with the number of files (except for the optional summary cache). The files are analyzed by batches, and the statistics of the batches are merged.
         
     Results:
-        coverages: dictionary containing coverage of interval given by self.cred_interval, for each parameter in self.in_param_names
+        coverages: dictionary containing coverage of interval given by self.cred_interval, for each parameter in self.in_param_names (a list of coverages, one per interval, if several intervals are given)
+        coverage_table: dictionary containing, for each parameter, the lists "interval", "credibility", "coverage" and "coverage_error" (binomial uncertainty) of the intervals
     '''
     def InternalConfigure(self,params):
         #Required input
@@ -52,238 +63,422 @@ class CalibrationProcessor(BaseProcessor):
         self.post_param_names = reader.read_param(params,'post_param_names',self.in_param_names)
         self.quantile = reader.read_param(params,'quantile',False)
         self.check_if_nonzero = reader.read_param(params,'check_if_nonzero',False)
+        self.n_workers = int(reader.read_param(params,'n_workers',1))
+        self.summary_cache = reader.read_param(params,'summary_cache',None)
+        self.report_every = reader.read_param(params,'report_every',None)
         
         #Other
         self.failed_runs = []
 
+        #A single interval is a list of numbers; several intervals are a list of lists
+        if len(self.cred_interval) > 0 and all(isinstance(interval, list) for interval in self.cred_interval):
+            self.intervals = self.cred_interval
+        else:
+            self.intervals = [self.cred_interval]
+        self.coverage_table = dict()
+
+        #Checking if the credible interval lists define limits or intervals
+        if len(self.intervals) == 0 or any(len(interval) not in [1, 2] for interval in self.intervals):
+            logger.error("Please input a credible interval list of either one or two bounds.")
+            return False
+
         # Checking the existence of files (non blocking if missing file)
         for file in self.files:
             if not exists(file):
                 logger.warning("File {} doesn't exist".format(file))
         return True
-
-        #Checking if the credible interval list defines limit or interval
-        if len(self.cred_interval) not in [1, 2]:
-            logger.error("Please input a credible interval list of either one or two bounds.")
-            return False
     
     
     def perform_calibration(self):
         logger.info("Calibrating credible interval results")
+        statistics = _CalibrationStatistics(self.in_param_names, len(self.intervals))
+        next_report = self.report_every
+        for partial_statistics in self._iter_partial_statistics():
+            statistics.merge(partial_statistics)
+            if next_report is not None and statistics.n_analyzed >= next_report and statistics.n_analyzed < len(self.files):
+                self._report_partial_coverages(statistics)
+                next_report = (statistics.n_analyzed//self.report_every + 1)*self.report_every
+        self.failed_runs = statistics.failed_runs
+
+        if statistics.n_files == 0:
+            logger.error("No file could be calibrated")
+            coverages = {p:[float('nan')]*len(self.intervals) for p in self.in_param_names}
+            return self._format_coverages(coverages)
+
+        #Calculating an interval coverage (and its binomial uncertainty) for each parameter
+        self.n_files = statistics.n_files
+        self.coverage_table = {p:{"interval": self.intervals,
+                                  "credibility": [self._credibility(interval) for interval in self.intervals],
+                                  "coverage": [counter.fraction for counter in statistics.recovered[p]],
+                                  "coverage_error": [counter.error for counter in statistics.recovered[p]]}
+                               for p in self.in_param_names}
+        coverages = {p:self.coverage_table[p]["coverage"] for p in self.in_param_names}
         
-        #Defining credibility
-        if len(self.cred_interval)==1:
-            alpha = self.cred_interval[0]
-        elif len(self.cred_interval)==2:
-            alpha = self.cred_interval[1]-self.cred_interval[0]
-        
-        #Setting up variables before loop
-        calib_bounds = {name:[] for name in self.in_param_names}
-        consistent_with_zero = {name:0 for name in self.in_param_names}
-        n_recovered_inputs = {name:0 for name in self.in_param_names}
-        #Dictionary to keep track of sums of quantities, so that averages can be taken after the loop
-        sums = {name:dict.fromkeys(['median', 'mean', 'lower', 'upper'],0) for name in self.in_param_names}
+        #Reporting calibration results
+        self._report_calibration_results(statistics)
         
-        for i, filename in enumerate(self.files): 
-            #Reading input values and posteriors from root files
-            try:
-                input_vals, posterior_arrays = self._load_inputs_and_posteriors(filename)
-            except AttributeError as error:
-                logger.warning(error)
-                self.failed_runs.append(filename)
-                continue
-            except RuntimeError as error:
-                logger.warning("Caught processor error; passing...")
-                continue
-            
-            #Constructing credible intervals
-            logger.debug("Constructing credible intervals")
-            if self.quantile == True:
-                for param_name in calib_bounds:
-                    calib_bounds[param_name].append(self._get_quantile_bounds(posterior_arrays[param_name]))
+        return self._format_coverages(coverages)
+
+    def _format_coverages(self, coverages):
+        """
+        Coverage of each parameter; a list of coverages (one per interval) if several intervals are given
+        """
+        if len(self.intervals) == 1:
+            return {p:float(c[0]) for p, c in coverages.items()}
+        return {p:[float(value) for value in c] for p, c in coverages.items()}
+
+    def _iter_partial_statistics(self):
+        """
+        Yields the statistics of the files of the summary cache, then the statistics of each batch of files analyzed.
+        The batches are analyzed in a pool of processes if n_workers > 1.
+        """
+        cache = self._load_summary_cache()
+        settings = self._settings_hash()
+        cached_statistics = _CalibrationStatistics(self.in_param_names, len(self.intervals))
+        to_process = []
+        for filename in self.files:
+            entry = cache.get(os.path.abspath(filename))
+            if (entry is not None and entry["settings"] == settings and entry["stamp"] == _file_stamp(filename)
+                    and entry["summary"].get("success", False)):
+                cached_statistics.add(entry["summary"])
             else:
-                for param_name in calib_bounds:
-                    bounds = self._get_highest_density_bounds(posterior_arrays[param_name], alpha)
-                    calib_bounds[param_name].append(bounds)
-                    #Consistency-with-zero checks are only possible for HDIs
-                    if bounds[0] == 0.0:
-                        consistent_with_zero[param_name] += 1
-            
-            #Tracking and optionally printing information about the intervals
-            bs={key:val[i] for key, val in calib_bounds.items()}
-            logger.debug('\n---------------------EXPERIMENT #{}:---------------------'.format(i))
-            self._report_post_param_info(input_vals, posterior_arrays, bs, sums)
-            logger.debug('\n--------------------------------------------------------')
-                
+                to_process.append(filename)
+        logger.info("{} files to analyze ({} summaries from the cache)".format(
+            len(to_process), cached_statistics.n_analyzed))
+        yield cached_statistics
+
+        keep_summaries = self.summary_cache is not None
+        batches = [to_process[i:i+_files_per_batch] for i in range(0, len(to_process), _files_per_batch)]
+        if self.n_workers > 1 and len(batches) > 1:
+            executor = futures.ProcessPoolExecutor(max_workers=self.n_workers)
+            results = executor.map(_calibrate_files, [self]*len(batches), batches, [keep_summaries]*len(batches))
+        else:
+            executor = None
+            results = (self._calibrate_files(batch, keep_summaries) for batch in batches)
+        try:
+            for statistics, summaries in results:
+                for summary in summaries:
+                    if not summary["success"]:
+                        # Files that could not be read are analyzed again at the next run
+                        cache.pop(os.path.abspath(summary["filename"]), None)
+                        continue
+                    cache[os.path.abspath(summary["filename"])] = {"stamp": _file_stamp(summary["filename"]),
+                                                                   "settings": settings,
+                                                                   "summary": summary}
+                yield statistics
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if keep_summaries and len(to_process) > 0:
+            self._save_summary_cache(cache)
+
+    def _calibrate_files(self, filenames, keep_summaries=False):
+        """
+        Analyze a batch of files.
+        Returns the statistics of the batch and, if keep_summaries, the list of the summaries of the files (for the summary cache).
+        """
+        statistics = _CalibrationStatistics(self.in_param_names, len(self.intervals))
+        summaries = []
+        for filename in filenames:
+            summary = self._calibrate_file(filename)
+            statistics.add(summary)
+            if keep_summaries:
+                summaries.append(summary)
+        return statistics, summaries
+
+    def _calibrate_file(self, filename):
+        """
+        Load a file, construct the credible intervals and check whether they contain the inputted values.
+        Returns a (JSON serializable) summary of the file.
+        """
+        #Reading input values and posteriors from root files
+        try:
+            input_vals, posterior_arrays = self._load_inputs_and_posteriors(filename)
+        except Exception as error:
+            logger.warning("Cannot read {}: {}".format(filename, error))
+            return {"filename": filename, "success": False}
+
+        #Constructing credible intervals
+        logger.debug("Constructing credible intervals")
+        summary = {"filename": filename, "success": True, "inputs": {}, "bounds": {}, "median": {}, "mean": {},
+                   "recovered": {}, "consistent_with_zero": {}}
+        all_bounds, all_consistent_with_zero = self._get_bounds(posterior_arrays)
+        for param_name in self.in_param_names:
+            summary["bounds"][param_name] = all_bounds[param_name]
+            summary["consistent_with_zero"][param_name] = all_consistent_with_zero[param_name]
+            summary["inputs"][param_name] = float(input_vals[param_name])
+            summary["median"][param_name] = float(np.median(posterior_arrays[param_name]))
+            summary["mean"][param_name] = float(np.mean(posterior_arrays[param_name]))
+
             #Determining whether intervals contain inputted values
-            for param_name in calib_bounds:
-                if len(self.cred_interval) == 1:
-                    if input_vals[param_name] <= bs[param_name][0]:
-                        n_recovered_inputs[param_name] += 1
-                elif len(self.cred_interval) == 2:
-                    if bs[param_name][0] <= input_vals[param_name] <= bs[param_name][1]:
-                        n_recovered_inputs[param_name] += 1
-            
-        #Calculating an interval coverage for each parameter
-        for run in self.failed_runs:
-            self.files.remove(run)
-        coverages = {p:n_recovered_inputs[p]/float(len(self.files)) for p in self.in_param_names}
-        
-        #Reporting calibration results
-        self._report_calibration_results(calib_bounds, consistent_with_zero, coverages, sums)
-        
-        return coverages
-        
+            recovered = []
+            for bounds in all_bounds[param_name]:
+                if len(bounds) == 1:
+                    recovered.append(bool(input_vals[param_name] <= bounds[0]))
+                else:
+                    recovered.append(bool(bounds[0] <= input_vals[param_name] <= bounds[1]))
+            summary["recovered"][param_name] = recovered
+
+        #Tracking and optionally printing information about the intervals
+        logger.debug('\n---------------------EXPERIMENT {}:---------------------'.format(filename))
+        self._report_post_param_info(summary)
+        logger.debug('\n--------------------------------------------------------')
+        return summary
+
+    def _credibility(self, interval):
+        if len(interval)==1:
+            return interval[0]
+        return interval[1]-interval[0]
+
+    def _settings_hash(self):
+        """
+        Hash of the settings changing the summary of a file
+        """
+        settings = [self.in_param_names, self.post_param_names, self.cred_interval, self.quantile,
+                    self.root_in_tree, self.root_post_tree]
+        return md5(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _load_summary_cache(self):
+        if self.summary_cache is None or not exists(self.summary_cache):
+            return dict()
+        try:
+            with open(self.summary_cache, 'r') as cache_file:
+                return json.load(cache_file)
+        except Exception as error:
+            logger.warning("Cannot read summary cache {}: {}".format(self.summary_cache, error))
+            return dict()
+
+    def _save_summary_cache(self, cache):
+        cache_dir = os.path.dirname(self.summary_cache)
+        if cache_dir != '' and not exists(cache_dir):
+            os.makedirs(cache_dir)
+        # Write then rename, so that a partially written file is never read
+        tmp_name = "{}.{}.tmp".format(self.summary_cache, os.getpid())
+        with open(tmp_name, 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_name, self.summary_cache)
+        logger.debug("Summary cache saved in {}".format(self.summary_cache))
 
     def _load_inputs_and_posteriors(self, filename):
         """
-        For a given root file, returns two dictionaries, one containing inputted values and the other containing posterior arrays.
+        For a given root file, returns two dictionaries, one containing inputted values and the other containing posterior arrays (keyed by the names of the inputted parameters).
+        The file is opened only once.
         """
         logger.debug("Reading input values and posterior arrays")
-        in_reader_config = {
-            "action": "read",
-            "tree_name": self.root_in_tree,
-            "filename": filename,
-            "variables": self.in_param_names
-        }
-        post_reader_config = {
-            "action": "read",
-            "tree_name": self.root_post_tree,
-            "filename": filename,
-            "variables": self.post_param_names
-        }
-        rin, rpost = IOROOTProcessor("reader"), IOROOTProcessor("reader2")
-        if not rin.Configure(in_reader_config):
-            logger.warning("Failed to Configure <{}> processor".format(rin.name))
-            raise RuntimeError
-        if not rpost.Configure(post_reader_config):
-            logger.warning("Failed to Configure <{}> processor".format(rpost.name))
-            raise RuntimeError
-        if not rin.Run():
-            logger.warning("Failed to Run <{}> processor".format(rin.name))
-            raise RuntimeError
-        if not rpost.Run():
-            logger.warning("Failed to run <{}> processor".format(rpost.name))
-            raise RuntimeError
-        input_vals = {key:val[0] for key, val in rin.data.items()}
-        posterior_arrays = rpost.data
+        from morpho.processors.IO.IOROOTProcessor import read_trees
+        if self.root_in_tree == self.root_post_tree:
+            trees = {self.root_in_tree: list(set(self.in_param_names) | set(self.post_param_names))}
+        else:
+            trees = {self.root_in_tree: self.in_param_names,
+                     self.root_post_tree: self.post_param_names}
+        data = read_trees(filename, trees)
+        input_vals = {key:data[self.root_in_tree][key][0] for key in self.in_param_names}
+        posterior_arrays = {in_name:data[self.root_post_tree][post_name]
+                            for in_name, post_name in zip(self.in_param_names, self.post_param_names)}
         return input_vals, posterior_arrays
 
 
-    def _get_quantile_bounds(self, posterior_array):
+    def _get_bounds(self, posterior_arrays):
         """
         Input:
-            posterior_array: a list or array of posterior values
-        
-        From self:
-            self.cred_interval: a list [a, b] for 0<=a,b<=1. For example, a 90% credible interval would be defined [0.05, 0.95].
+            posterior_arrays: dictionary of posterior arrays (all of the same length), keyed by parameter name. The arrays are replaced by sorted copies.
 
         Returns:
-            bound_values: a list [p_a, p_b] containing values that bound a credible interval, such that a fraction cred_interval[0] of the posterior mass falls below p_a and a fraction cred_interval[1] falls below p_b.
+            bounds: dictionary of the credible bounds of each parameter, with one list [p_limit] or [p_a, p_b] per interval of self.intervals. The posteriors of all parameters are sorted once and bounded for all the intervals at once.
+            consistent_with_zero: dictionary of lists (one boolean per interval) telling whether the HDI of each parameter starts at zero (always False for quantile intervals)
         """
-        posterior_array.sort()
-        interval = []
-        for interval_frac in self.cred_interval:
-            interval.append(self._get_interval_val(posterior_array, interval_frac))
-        return interval
-        
-        
-    def _get_interval_val(self, array, fraction):
+        names = list(posterior_arrays.keys())
+        sorted_posteriors = credibleIntervals.sort_samples(np.column_stack([posterior_arrays[name] for name in names]))
+        for i, name in enumerate(names):
+            posterior_arrays[name] = sorted_posteriors[:, i]
+        if self.quantile == True:
+            #All the quantiles at once, then split per interval: array (n_params, n_fractions)
+            values = self._get_quantile_bounds(sorted_posteriors, sum(self.intervals, []), is_sorted=True).T
+            splits = np.cumsum([len(interval) for interval in self.intervals])[:-1]
+            bounds = {name:[[float(bound) for bound in interval_bounds] for interval_bounds in np.split(values[i], splits)] for i, name in enumerate(names)}
+            #Consistency-with-zero checks are only possible for HDIs
+            consistent_with_zero = {name:[False]*len(self.intervals) for name in names}
+            return bounds, consistent_with_zero
+        #Array of HDIs (n_intervals, n_params, 2)
+        HDIs = self._get_highest_density_bounds(sorted_posteriors, [self._credibility(interval) for interval in self.intervals], is_sorted=True)
+        bounds = {name:[] for name in names}
+        consistent_with_zero = {name:[] for name in names}
+        for interval, HDI in zip(self.intervals, HDIs):
+            for i, name in enumerate(names):
+                #A limit is the upper bound of the HDI
+                bounds[name].append([float(HDI[i][1])] if len(interval) == 1 else [float(HDI[i][0]), float(HDI[i][1])])
+                consistent_with_zero[name].append(bool(HDI[i][0] == 0.0))
+        return bounds, consistent_with_zero
+
+
+    def _get_quantile_bounds(self, posterior_array, fractions, is_sorted=False):
         """
-        Returns the posterior value below which some fraction of posterior mass falls (could be the upper or lower bound of a credible interval).
+        Input:
+            posterior_array: a list or array of posterior values, or an array (n_draws, n_params)
+            fractions: a list [a, b] for 0<=a,b<=1. For example, a 90% credible interval would be defined [0.05, 0.95].
+            is_sorted: if True, posterior_array is already sorted
 
-        array: a posterior array or list
-        fraction: fraction of posterior mass below the returned value
+        Returns:
+            bound_values: an array [p_a, p_b] containing values that bound a credible interval, such that a fraction a of the posterior mass falls below p_a and a fraction b falls below p_b.
         """
-        n_pts_below = int(round(fraction*(len(array))))
-        return 0.5*(array[n_pts_below]+array[n_pts_below-1])
+        return credibleIntervals.quantiles(posterior_array, fractions, is_sorted=is_sorted)
 
 
-    def _get_highest_density_bounds(self, posterior_array, credibility):
+    def _get_highest_density_bounds(self, posterior_array, credibility, is_sorted=False):
         """
         Required input:
-            posterior_array: a list or array of posterior values
+            posterior_array: a list or array of posterior values, or an array (n_draws, n_params)
             credibility: float between 0 and 1, denoting the credibility of the HDI.
 
+        Optional input:
+            is_sorted: if True, posterior_array is already sorted
+
         Returns:
-            HDI: a list [p_a, p_b] containing the lower and upper value of the minimum width Bayesian credible interval
+            HDI: an array [p_a, p_b] (one per parameter for 2D input) containing the lower and upper value of the minimum width Bayesian credible interval. The lower bound is set to 0 if the interval starts at the smallest value and this value is close to zero.
         """
         check_near_zero = 10
-        posterior_array.sort()
-        #Number of samples generated
-        nSample = len(posterior_array)
-        #Number of samples included in the HDI
-        nSampleCred = int(math.ceil(nSample*credibility))
-        #Number of intervals to be compared
-        nCI = nSample - nSampleCred
-        #Width of every proposed interval
-        best_width = max(posterior_array)
-        
-        best_index = 0
-        for i in range(nCI):
-            if i == 0:
-                width = posterior_array[i+nSampleCred-1] - posterior_array[i]
-            else:
-                width = posterior_array[i+nSampleCred-1] - posterior_array[i]
-            if width<best_width:
-                best_width = width
-                best_index = i
-
-        #Index of lower bound of shortest interval (the HDI)
-        if (best_index == 0 and posterior_array[0]<posterior_array[check_near_zero]-posterior_array[0]):
-            HDI = [0.0, posterior_array[best_index+nSampleCred]]
-        else:
-            HDI = [posterior_array[best_index], posterior_array[best_index+nSampleCred]]
+        if not is_sorted:
+            posterior_array = credibleIntervals.sort_samples(posterior_array)
+        HDI = credibleIntervals.highest_density_intervals(posterior_array, credibility, is_sorted=True)
+        near_zero = posterior_array[0] < posterior_array[min(check_near_zero, len(posterior_array)-1)]-posterior_array[0]
+        HDI[..., 0] = np.where((HDI[..., 0] == posterior_array[0]) & near_zero, 0.0, HDI[..., 0])
         return HDI
 
 
-    def _report_post_param_info(self, input_vals, posterior_arrays, calib_bounds, sums):
+    def _report_post_param_info(self, summary):
+        """
+        For a given run in a sensitivity analysis, for some posterior credibility, prints the posterior median and mean, the credible bounds on all parameters, the parameter value inputted to the generator and the posterior window (width of the C.I.)
+        """
+        for param_name in self.in_param_names:
+            median = summary["median"][param_name]
+            mean = summary["mean"][param_name]
+            input_val = summary["inputs"][param_name]
+            for b in summary["bounds"][param_name]:
+                if len(b) == 1:
+                    logger.debug("{} < {}. Input: {}".format(param_name, b[0], input_val))
+                elif len(b) == 2:
+                    logger.debug("{} < {} < {}, Median={}, Mean={}. Input value: {}. Window: {}".format(b[0], param_name, b[1], median, mean, input_val, b[1]-b[0]))
+
+
+    def _report_partial_coverages(self, statistics):
         """
-        For a given run in a sensitivity analysis, for some posterior credibility, determines and optionally prints the posterior median and mean.
-        Also optionally prints:
-        - Credible bounds on all parameters
-        - The parameter value inputted to the generator
-        - The posterior window (width of the C.I.)
+        Prints the coverages of the files analyzed so far
         """
-        for param_name in posterior_arrays:
-            b = calib_bounds[param_name]
-            median = np.median(posterior_arrays[param_name])
-            sums[param_name]['median'] += median
-            mean = np.mean(posterior_arrays[param_name])
-            sums[param_name]['mean'] += mean
-
-            if len(self.cred_interval) == 1:
-                logger.debug("{} < {}. Input: {}".format(param_name, b[0], input_vals[param_name]))
-            elif len(self.cred_interval) == 2:
-                sums[param_name]['lower'] += b[0]
-                sums[param_name]['upper'] += b[1]
-                logger.debug("{} < {} < {}, Median={}, Mean={}. Input value: {}. Window: {}".format(b[0], param_name, b[1], median, mean, input_vals[param_name], b[1]-b[0]))
-
-
-    def _report_calibration_results(self, calib_bounds, consistent_with_zero, coverages, sums):
+        coverages = ["{}: {}".format(p, ", ".join("{:.4f} +/- {:.4f}".format(counter.fraction, counter.error) for counter in statistics.recovered[p]))
+                     for p in self.in_param_names]
+        logger.info("Partial coverages ({}/{} files): {}".format(statistics.n_analyzed, len(self.files), "; ".join(coverages)))
+
+
+    def _report_calibration_results(self, statistics):
         """
         Prints coverages and summary interval information
         """
-        for param_name in calib_bounds:
-            #Optionally reporting how often each parameter is consistent with zero
-            if self.check_if_nonzero == True:
-                zero_frac = float(consistent_with_zero[param_name])/len(self.files)
-                logger.info('{} CALIBRATION: {}% of inputted values are consistent with zero.'.format(param_name, zero_frac*100))
-                
-            #Printing coverages and summary interval information
-            if len(self.cred_interval) == 1:
-                logger.info('{}% of inputted {} values fell below a {}% posterior limit.'.format(coverages[param_name]*100, param_name, alpha*100))
-                widths = [i[0] for i in calib_bounds[param_name]]
-            elif len(self.cred_interval) == 2:
-                logger.info('{} CALIBRATION: {}% of inputted values fell in a {}-{}% posterior interval.'.format(param_name, coverages[param_name]*100, self.cred_interval[0]*100, self.cred_interval[1]*100))
-                avgs = {key:val/float(len(self.files)) for key, val in sums[param_name].items()}
-                logger.info("{} AVERAGES: {} < {} < {}; Median val={}; Mean val={}".format(param_name, avgs['lower'], param_name, avgs['upper'], avgs['median'], avgs['mean']))
-                widths = [i[1]-i[0] for i in calib_bounds[param_name]]
-                
-            logger.info("{} Mean interval width: {}; Median: {}".format(param_name, np.mean(widths), np.median(widths)))
-            logger.info("{} Minumum width: {}; Maximum: {}\n--------------------------------------------------------".format(param_name, np.amin(widths), np.amax(widths)))
+        for param_name in self.in_param_names:
+            table = self.coverage_table[param_name]
+            for i, interval in enumerate(self.intervals):
+                coverage = table["coverage"][i]
+                error = table["coverage_error"][i]
+                #Optionally reporting how often each parameter is consistent with zero
+                if self.check_if_nonzero == True:
+                    zero_frac = statistics.consistent_with_zero[param_name][i].fraction
+                    logger.info('{} CALIBRATION: {}% of inputted values are consistent with zero (at {}% credibility).'.format(param_name, zero_frac*100, self._credibility(interval)*100))
+
+                #Printing coverages and summary interval information
+                if len(interval) == 1:
+                    logger.info('{}% (+/- {}%) of inputted {} values fell below a {}% posterior limit.'.format(coverage*100, error*100, param_name, self._credibility(interval)*100))
+                elif len(interval) == 2:
+                    logger.info('{} CALIBRATION: {}% (+/- {}%) of inputted values fell in a {}-{}% posterior interval.'.format(param_name, coverage*100, error*100, interval[0]*100, interval[1]*100))
+                    logger.info("{} AVERAGES: {} < {} < {}; Median val={}; Mean val={}".format(param_name, statistics.lower[param_name][i].mean, param_name, statistics.upper[param_name][i].mean, statistics.median[param_name].mean, statistics.mean[param_name].mean))
+
+                widths = statistics.widths[param_name][i]
+                logger.info("{} Mean interval width: {}; Median: {}".format(param_name, widths.mean, statistics.width_quantiles[param_name][i].median))
+                logger.info("{} Minumum width: {}; Maximum: {}\n--------------------------------------------------------".format(param_name, widths.min, widths.max))
+
+            #Coverage-vs-credibility table
+            if len(self.intervals) > 1:
+                lines = ["{:>16} {:>12} {:>10} {:>10}".format("interval", "credibility", "coverage", "error")]
+                for interval, credibility, coverage, error in zip(table["interval"], table["credibility"], table["coverage"], table["coverage_error"]):
+                    lines.append("{:>16} {:>12.4f} {:>10.4f} {:>10.4f}".format(str(interval), credibility, coverage, error))
+                logger.info("{} coverage vs credibility ({} files):\n{}".format(param_name, self.n_files, "\n".join(lines)))
 
     def InternalRun(self):
         self.results = self.perform_calibration()
         return True
 
+
+
+_files_per_batch = 20
+
+
+def _file_stamp(filename):
+    """
+    Modification time and size of a file (None if missing)
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+
+def _calibrate_files(calibrator, filenames, keep_summaries):
+    """
+    Statistics of a batch of files (function used by the pool of processes)
+    """
+    return calibrator._calibrate_files(filenames, keep_summaries)
+
+
+class _CalibrationStatistics(object):
+    """
+    Online statistics of the calibration of an ensemble, in constant memory.
+    The statistics of different batches of files can be merged.
+    """
+    def __init__(self, param_names, n_intervals):
+        self.n_analyzed = 0
+        self.n_files = 0
+        self.failed_runs = []
+        per_interval = lambda accumulator: {name:[accumulator() for i in range(n_intervals)] for name in param_names}
+        self.recovered = per_interval(BinomialCounter)
+        self.consistent_with_zero = per_interval(BinomialCounter)
+        self.lower = per_interval(RunningStats)
+        self.upper = per_interval(RunningStats)
+        self.widths = per_interval(RunningStats)
+        self.width_quantiles = per_interval(QuantileSketch)
+        self.median = {name:RunningStats() for name in param_names}
+        self.mean = {name:RunningStats() for name in param_names}
+
+    def add(self, summary):
+        self.n_analyzed += 1
+        if not summary["success"]:
+            self.failed_runs.append(summary["filename"])
+            return
+        self.n_files += 1
+        for name in self.recovered:
+            self.median[name].add(summary["median"][name])
+            self.mean[name].add(summary["mean"][name])
+            for i, bounds in enumerate(summary["bounds"][name]):
+                self.recovered[name][i].add(summary["recovered"][name][i])
+                self.consistent_with_zero[name][i].add(summary["consistent_with_zero"][name][i])
+                if len(bounds) == 1:
+                    width = bounds[0]
+                else:
+                    width = bounds[1]-bounds[0]
+                    self.lower[name][i].add(bounds[0])
+                    self.upper[name][i].add(bounds[1])
+                self.widths[name][i].add(width)
+                self.width_quantiles[name][i].add(width)
+
+    def merge(self, other):
+        self.n_analyzed += other.n_analyzed
+        self.n_files += other.n_files
+        self.failed_runs.extend(other.failed_runs)
+        for name in self.recovered:
+            self.median[name].merge(other.median[name])
+            self.mean[name].merge(other.mean[name])
+            for accumulators, other_accumulators in [(self.recovered, other.recovered), (self.consistent_with_zero, other.consistent_with_zero),
+                                                     (self.lower, other.lower), (self.upper, other.upper),
+                                                     (self.widths, other.widths), (self.width_quantiles, other.width_quantiles)]:
+                for accumulator, other_accumulator in zip(accumulators[name], other_accumulators[name]):
+                    accumulator.merge(other_accumulator)
+        return self
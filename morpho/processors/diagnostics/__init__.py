@@ -3,5 +3,9 @@
 
 from __future__ import absolute_import
 
-from .CalibrationProcessor import CalibrationProcessor
-from .StanDiagnostics import StanDiagnostics
+from morpho.utilities import registry
+
+registry.make_lazy(__name__, {
+    "CalibrationProcessor": ".CalibrationProcessor",
+    "StanDiagnostics": ".StanDiagnostics"
+})
@@ -3,5 +3,8 @@
 
 from __future__ import absolute_import
 
-from .ProcessorAssistant import ProcessorAssistant
+from morpho.utilities import registry
 
+registry.make_lazy(__name__, {
+    "ProcessorAssistant": ".ProcessorAssistant"
+})
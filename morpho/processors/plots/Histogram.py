@@ -6,7 +6,9 @@ Date: 06/26/18
 
 from __future__ import absolute_import
 
-from morpho.utilities import morphologging, reader
+import numpy
+
+from morpho.utilities import morphologging, reader, chunks
 from morpho.processors import BaseProcessor
 from .RootCanvas import RootCanvas
 from .RootHistogram import RootHistogram
@@ -37,7 +39,7 @@ class Histogram(BaseProcessor):
         output_pformat: plot format (default=pdf)
 
     Input:
-        data: dictionary containing model input data
+        data: dictionary containing model input data (or ChunkStream, filled chunk by chunk)
 
     Results:
         None
@@ -72,16 +74,36 @@ class Histogram(BaseProcessor):
     def InternalRun(self):
         self.rootcanvas.cd()
         if self.multipleHistos:
-            for i, (var, histo) in enumerate(zip(self.namedata, self.histos)):
-                histo.Fill(self.data.get(var))
-                if i ==0:
-                    histo.Draw("hist")
-                    histo.SetLineColor(i, len(self.histos))
-                else:
-                    histo.Draw("sameHist")
-                    histo.SetLineColor(i, len(self.histos))
+            histos = list(zip(self.namedata, self.histos))
         else:
-            self.histo.Fill(self.data.get(self.namedata))
-            self.histo.Draw("hist")
+            histos = [(self.namedata, self.histo)]
+        if chunks.is_stream(self.data):
+            # The range must be known before filling the first chunk:
+            # it is computed for all the variables in one pass over the stream
+            unset = [(var, histo) for var, histo in histos if histo.x_min > histo.x_max]
+            ranges = dict()
+            if len(unset) > 0:
+                for chunk in chunks.iter_chunks(self.data):
+                    for var, _ in unset:
+                        if len(chunk[var]) == 0:
+                            continue
+                        x_min, x_max = numpy.min(chunk[var]), numpy.max(chunk[var])
+                        if var in ranges:
+                            x_min = min(x_min, ranges[var][0])
+                            x_max = max(x_max, ranges[var][1])
+                        ranges[var] = (x_min, x_max)
+            for var, histo in unset:
+                if var in ranges:
+                    histo.SetRange(*ranges[var])
+        for chunk in chunks.iter_chunks(self.data):
+            for var, histo in histos:
+                histo.Fill(chunk.get(var))
+        for i, (var, histo) in enumerate(histos):
+            if i == 0:
+                histo.Draw("hist")
+            else:
+                histo.Draw("sameHist")
+            if self.multipleHistos:
+                histo.SetLineColor(i, len(self.histos))
         self.rootcanvas.Save()
         return True
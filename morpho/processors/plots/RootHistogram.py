@@ -42,19 +42,25 @@ class RootHistogram(object):
         self.ytitle = reader.read_param(input_dict, "y_title", "")
         self._createHisto()
 
+    def SetRange(self, x_min, x_max):
+        '''
+        Set the range of x and recreate the (empty) histogram
+        '''
+        self.x_min = x_min
+        self.x_max = x_max
+        self._createHisto()
+
     def GetNbinsX(self):
         return self.histo.GetNbinsX()
 
     def Fill(self, input_data):
-        if not isinstance(input_data, list):
+        if not isinstance(input_data, list) and not hasattr(input_data, "__array__"):
             logger.error("Data given <{}> not a list".format(input_data))
             raise
         if self.x_min > self.x_max:
             logger.warning("Inappropriate x range: {}>{}".format(
                 self.x_min, self.x_max))
-            self.x_min = min(input_data)
-            self.x_max = max(input_data)
-            self._createHisto()
+            self.SetRange(min(input_data), max(input_data))
         for value in input_data:
             self.histo.Fill(value)
 
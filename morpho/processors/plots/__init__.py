@@ -3,11 +3,14 @@
 
 from __future__ import absolute_import
 
-from .APosterioriDistribution import APosterioriDistribution
-from .Histo2dDivergence import Histo2dDivergence
-from .TimeSeries import TimeSeries
-from .Histogram import Histogram
+from morpho.utilities import registry
 
-# Objects
-from .RootCanvas import RootCanvas
-from .RootHistogram import RootHistogram
+registry.make_lazy(__name__, {
+    "APosterioriDistribution": ".APosterioriDistribution",
+    "Histo2dDivergence": ".Histo2dDivergence",
+    "TimeSeries": ".TimeSeries",
+    "Histogram": ".Histogram",
+    # Objects
+    "RootCanvas": ".RootCanvas",
+    "RootHistogram": ".RootHistogram"
+})
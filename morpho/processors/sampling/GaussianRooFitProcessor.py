@@ -10,7 +10,7 @@ except ImportError:
     pass
 
 from morpho.utilities import morphologging, reader
-from morpho.processors.sampling.RooFitInterfaceProcessor import RooFitInterfaceProcessor
+from morpho.processors.sampling.RooFitInterfaceProcessor import RooFitInterfaceProcessor, numpy_to_dataset
 from morpho.processors.BaseProcessor import BaseProcessor
 logger = morphologging.getLogger(__name__)
 
@@ -56,10 +56,7 @@ class GaussianRooFitProcessor(RooFitInterfaceProcessor):
 
     def _defineDataset(self, wspace):
         varX = ROOT.RooRealVar("x", "x", min(self._data["x"]), max(self._data["x"]))
-        data = ROOT.RooDataSet(self.datasetName, self.datasetName, ROOT.RooArgSet(varX))
-        for x in self._data["x"]:
-            varX.setVal(x)
-            data.add(ROOT.RooArgSet(varX))
+        data = numpy_to_dataset(self.datasetName, [varX], self._data)
         getattr(wspace, 'import')(data)
         return wspace
 
@@ -11,6 +11,7 @@ except ImportError:
 
 from morpho.utilities import morphologging, reader
 from morpho.processors.sampling import RooFitInterfaceProcessor
+from morpho.processors.sampling.RooFitInterfaceProcessor import numpy_to_dataset
 logger = morphologging.getLogger(__name__)
 
 __all__ = []
@@ -58,11 +59,7 @@ class LinearFitRooFitProcessor(RooFitInterfaceProcessor):
     def _defineDataset(self, wspace):
         varX = ROOT.RooRealVar("x", "x", min(self._data["x"]), max(self._data["x"]))
         varY = ROOT.RooRealVar("y", "y", min(self._data["y"]), max(self._data["y"]))
-        data = ROOT.RooDataSet(self.datasetName, self.datasetName, ROOT.RooArgSet(varX, varY))
-        for x, y in zip(self._data["x"], self._data["y"]):
-            varX.setVal(x)
-            varY.setVal(y)
-            data.add(ROOT.RooArgSet(varX, varY))
+        data = numpy_to_dataset(self.datasetName, [varX, varY], self._data)
         getattr(wspace, 'import')(data)
         return wspace
 
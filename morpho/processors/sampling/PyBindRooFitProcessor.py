@@ -1,5 +1,5 @@
 from morpho.processors.BaseProcessor import BaseProcessor
-from morpho.processors.sampling.RooFitInterfaceProcessor import RooFitInterfaceProcessor
+from morpho.processors.sampling.RooFitInterfaceProcessor import RooFitInterfaceProcessor, numpy_to_datahist
 from morpho.utilities import morphologging, reader
 '''
 Processor for  linear fitting
@@ -11,6 +11,8 @@ try:
     import ROOT
 except ImportError:
     pass
+import numpy
+
 value = ROOT.gSystem.Load("libRooFit")
 if value < 0:
     print("Failed loading", value)
@@ -43,12 +45,29 @@ class PyBindRooFitProcessor(RooFitInterfaceProcessor):
     We redefine the _defineDataset method as this analysis requires datapoints in a 2D space.
     Users should feel free to change this method as they see fit.
 
+    The function is given either as a C++ expression of the variables, compiled
+    by cling (no Python call during the evaluations), or as a Python function of
+    the variables (in the order of paramRange). A vectorized Python function
+    (taking numpy arrays) is evaluated once on a grid of the observables and
+    interpolated; otherwise it is called for each evaluation.
+    The grid is not recomputed when the parameters change: the vectorized mode
+    requires all the variables except (at most 2) observables to be fixed. It
+    speeds up the generation of data from a fixed shape, but cannot be used to
+    fit, scan or sample floating parameters (use an expression instead).
+
     Parameters:
         varName (required): name(s) of the variable in the data
         nuisanceParams (required): parameters to be discarded at end of sampling
         interestParams (required): parameters to be saved in the results variable
         paramRange (required): range of parameters (defined as <{'a': [a_min, a_max]}>)
         initValues: initial value (defined as <{'a': a_init}>)
+        expression: C++ expression of the variables (e.g. <'abs(cos(b*x)+c)'>), replaces module_name and function_name
+        module_name (required without expression): name of the python module containing the function
+        function_name (required without expression): name of the function
+        vectorized: the function takes numpy arrays and is interpolated on a grid of the observables;
+            only with fixed parameters (default=False)
+        n_grid: number of grid points per observable (int or <{'x': n_x}>, default=1000)
+        interpolation: interpolation order on the grid (default=1)
         iter (required): total number of iterations (warmup and sampling)
         warmup: number of warmup iterations (default=iter/2)
         chain: number of chains (default=1)
@@ -73,6 +92,25 @@ class PyBindRooFitProcessor(RooFitInterfaceProcessor):
         self.ranges = reader.read_param(config_dict, "paramRange", "required")
         self.initParamValues = reader.read_param(
             config_dict, "initValues", dict())
+        self.expression = reader.read_param(config_dict, "expression", None)
+        self.vectorized = reader.read_param(config_dict, "vectorized", False)
+        self.n_grid = reader.read_param(config_dict, "n_grid", 1000)
+        self.interpolation = int(reader.read_param(config_dict, "interpolation", 1))
+        if self.vectorized and self.expression is None:
+            # The generated variables are the observables of the generate mode
+            if self.mode == "generate":
+                observables = self.paramOfInterestNames
+            else:
+                observables = self.observableNames if self.mode == "toys" else self.varNames
+            gridNames = [aName for aName in self.ranges if aName not in self.fixedParameters]
+            if len(gridNames) > 2 or any(aName not in observables for aName in gridNames):
+                logger.error("The vectorized function is tabulated on the observables only: "
+                             "at most 2 observables {} can be free, got {}; "
+                             "use an expression to fit floating parameters".format(observables, gridNames))
+                return False
+        if self.expression is not None:
+            logger.info("Using expression {}".format(self.expression))
+            return True
         self.module_name = reader.read_param(
             config_dict, "module_name", "required")
         self.function_name = reader.read_param(
@@ -146,10 +184,7 @@ class PyBindRooFitProcessor(RooFitInterfaceProcessor):
                 rooVarSet.append(aVarSampling)
                 logger.info(aVarName)
 
-        self.func = getattr(self.module, self.function_name)
-        self.f = PyFunctionObject(self.func, len(rooVarSet))
-        self.bindFunc = ROOT.RooFit.bindFunction(
-            "test", self.f, ROOT.RooArgList(*rooVarSet))
+        self.bindFunc = self._bindFunction(rooVarSet)
 
         a0 = ROOT.RooRealVar("a0", "a0", 0)
         a0.setConstant()
@@ -166,6 +201,37 @@ class PyBindRooFitProcessor(RooFitInterfaceProcessor):
 
         return wspace
 
+    def _bindFunction(self, rooVarSet):
+        '''
+        Create the RooFit function from the expression or the python function
+        '''
+        if self.expression is not None:
+            # RooFormulaVar expressions are compiled by cling
+            return ROOT.RooFormulaVar("test", "test", str(self.expression), ROOT.RooArgList(*rooVarSet))
+        self.func = getattr(self.module, self.function_name)
+        if not self.vectorized:
+            self.f = PyFunctionObject(self.func, len(rooVarSet))
+            return ROOT.RooFit.bindFunction(
+                "test", self.f, ROOT.RooArgList(*rooVarSet))
+
+        # Evaluate the function in one call on the grid of bin centers of the observables
+        # (the only non-fixed variables)
+        gridVars = [var for var in rooVarSet if not var.isConstant()]
+        centers = []
+        for var in gridVars:
+            n_grid = self.n_grid.get(var.GetName(), 1000) if isinstance(self.n_grid, dict) else self.n_grid
+            var.setBins(int(n_grid))
+            edges = numpy.linspace(var.getMin(), var.getMax(), int(n_grid)+1)
+            centers.append(0.5*(edges[:-1]+edges[1:]))
+        grid = dict(zip([var.GetName() for var in gridVars], numpy.meshgrid(*centers, indexing='ij')))
+        shape = grid[gridVars[0].GetName()].shape
+        logger.info("Evaluating {} on a grid of {} points".format(self.function_name, int(numpy.prod(shape))))
+        funcValues = numpy.broadcast_to(self.func(*[grid.get(var.GetName(), var.getVal()) for var in rooVarSet]), shape)
+        self.gridData = numpy_to_datahist(
+            "grid_"+self.function_name, gridVars,
+            {aName: values.ravel() for aName, values in grid.items()}, weights=funcValues.ravel())
+        return ROOT.RooHistFunc("test", "test", ROOT.RooArgSet(*gridVars), self.gridData, self.interpolation)
+
 
 if __name__ == "__main__":
     rose = RosenBrock()
@@ -9,9 +9,7 @@ from __future__ import absolute_import
 import os
 import random
 import re
-from hashlib import md5
 from inspect import getargspec
-from datetime import datetime
 import numpy
 
 try:
@@ -19,7 +17,7 @@ try:
 except ImportError:
     pass
 
-from morpho.utilities import morphologging, reader, pystanLoader, stanConvergenceChecker
+from morpho.utilities import morphologging, reader, pystanLoader, convergenceDiagnostics, stanModelCache
 from morpho.processors import BaseProcessor
 from morpho.processors.plots import Histo2dDivergence
 logger = morphologging.getLogger(__name__)
@@ -47,10 +45,14 @@ class PyStanSamplingProcessor(BaseProcessor):
         interestParams: parameters to be saved in the results variable
         no_cache: don't create cache
         force_recreate: force the cache regeneration
+        cache_max_entries: maximum number of models in the cache folder; the least recently used are removed (default=None)
+        cache_max_size: maximum size in MB of the cache folder; the least recently used are removed (default=None)
         init: initial values for the parameters
+        seed: seed of the sampling (default: random)
         control: PyStan sampling settings
         no_diagnostics: Prevent diagnostics plots from being generated (default=False)
         diagnostics_folder: Path to folder to store diagnostics (default=".")
+        as_lists: store the results as lists instead of numpy arrays (default=False)
 
     Input:
         data: dictionary containing model input data
@@ -58,6 +60,7 @@ class PyStanSamplingProcessor(BaseProcessor):
     Results:
         results: dictionary containing the result of the sampling of the parameters of interest
         results_c: dictionary containing the result of the sampling of the parameters of interest (without the warmup chain)
+        diagnostics: ConvergenceDiagnostics object (R-hat, effective sample sizes, divergences, tree depth, E-BFMI)
     '''
     @property
     def data(self):
@@ -86,6 +89,7 @@ class PyStanSamplingProcessor(BaseProcessor):
     def __init__(self, name):
         super().__init__(name)
         self._data = {}
+        self.diagnostics = None
 
     def gen_arg_dict(self):
         '''
@@ -174,39 +178,18 @@ class PyStanSamplingProcessor(BaseProcessor):
                     'A function <{}> to import is missing'.format(matches))
         logger.debug('Import function files: complete')
 
-        code_hash = md5(theModel.encode('ascii')).hexdigest()
-        if self.model_name is None:
-            cache_fn = '{}/cached-model-{}.pkl'.format(
-                self.cache_dir, code_hash)
-        else:
-            cache_fn = '{}/cached-{}-{}.pkl'.format(
-                self.cache_dir, self.model_name, code_hash)
-        # Cache creation and saving?
+        code_hash = stanModelCache.get_code_hash(theModel)
+        cache = stanModelCache.StanModelCache(self.cache_dir,
+                                              max_entries=self.cache_max_entries,
+                                              max_size=self.cache_max_size)
+        cache_fn = cache.get_filename(code_hash, self.model_name)
         if self.force_recreate:
             logger.debug("Forced to recreate Stan cache!")
-            self._create_and_save_model(theModel, cache_fn)
-        else:
-            import pickle
-            try:
-                logger.debug("Trying to load cached StanModel")
-                self.stanModel = pickle.load(open(cache_fn, 'rb'))
-            except:
-                logger.debug("None exists -> creating Stan cache")
-                self._create_and_save_model(theModel, cache_fn)
-            else:
-                logger.debug("Using cached StanModel: {}".format(cache_fn))
-
-    def _create_and_save_model(self, theModel, cache_fn):
-        self.stanModel = pystan.StanModel(model_code=theModel)
-        if not self.no_cache:
-            cdir = os.path.dirname(cache_fn)
-            if not os.path.exists(cdir):
-                os.makedirs(cdir)
-                logger.info("Creating 'cache' folder: {}".format(cdir))
-            logger.debug("Saving Stan cache in {}".format(cache_fn))
-            import pickle
-            with open(cache_fn, 'wb') as f:
-                pickle.dump(self.stanModel, f)
+        # Models already loaded by a previous processor are reused
+        self.stanModel = cache.get_shared(code_hash, cache_fn,
+                                          lambda: pystan.StanModel(model_code=theModel),
+                                          force_recreate=self.force_recreate,
+                                          save=not self.no_cache)
 
     def _run_stan(self, *args, **kwargs):
         logger.info("Starting the sampling")
@@ -223,16 +206,17 @@ class PyStanSamplingProcessor(BaseProcessor):
 
     def _store_diagnostics(self, stan_results):
         # Print diagnostics
-        convergence_diagnostics = stanConvergenceChecker.check_all_diagnostics(
-            stan_results)
-        if convergence_diagnostics[0]:
-            logger.warn("\n"+convergence_diagnostics[1])
+        control = getattr(self, "control", None) or {}
+        self.diagnostics = convergenceDiagnostics.diagnose_fit(
+            stan_results, max_depth=control.get("max_treedepth", 10))
+        if self.diagnostics.warn:
+            logger.warn("\n"+self.diagnostics.summary())
         else:
-            logger.info("\n"+convergence_diagnostics[1])
+            logger.info("\n"+self.diagnostics.summary())
         if not os.path.exists(self.diagnostics_folder):
             os.makedirs(self.diagnostics_folder)
         f = open(self.diagnostics_folder+"/divergence_checks.txt", 'w')
-        f.write(convergence_diagnostics[1])
+        f.write(self.diagnostics.summary() + "\n\n" + self.diagnostics.table())
         f.close()
 
         # Plot 2D grid of divergence plots
@@ -270,11 +254,16 @@ class PyStanSamplingProcessor(BaseProcessor):
         # number of jobs to run (-1: all, 1: good for debugging)
         self.n_jobs = int(reader.read_param(params, 'n_jobs', -1))
         self.interestParams = reader.read_param(params, 'interestParams', [])
+        self.as_lists = reader.read_param(params, 'as_lists', False)
         self.no_cache = reader.read_param(params, 'no_cache', False)
         self.force_recreate = reader.read_param(
             params, 'force_recreate', False)
-        self.seed = random.seed(datetime.now())
-        # logger.debug("Autoseed activated")
+        self.cache_max_entries = reader.read_param(
+            params, 'cache_max_entries', None)
+        self.cache_max_size = reader.read_param(
+            params, 'cache_max_size', None)
+        # Default seed drawn from the python generator (seeded by the toolbox seed if any)
+        self.seed = int(reader.read_param(params, 'seed', random.randint(0, 2**31 - 1)))
         logger.debug("seed = {}".format(self.seed))
 
         # self.thin = reader.read_param(params, 'thin', 1)
@@ -10,14 +10,177 @@ except ImportError:
     pass
 
 import random
+import multiprocessing
+from concurrent import futures
+
+import numpy
 
 from morpho.utilities import morphologging, reader
+from morpho.utilities.ensemble import get_run_seed
 from morpho.processors import BaseProcessor
 logger = morphologging.getLogger(__name__)
 
 __all__ = []
 __all__.append(__name__)
 
+# C++ functions filling RooFit datasets from numpy arrays (compiled by cling
+# when RooDataSet.from_numpy/RooDataHist.from_numpy are not available)
+_fill_helpers_code = """
+#include <stdexcept>
+#include <string>
+#include <vector>
+#include "RooAbsData.h"
+#include "RooArgList.h"
+#include "RooArgSet.h"
+#include "RooDataHist.h"
+#include "RooDataSet.h"
+#include "RooRealVar.h"
+namespace morpho {
+// values: row-major array (nEntries, number of variables)
+void FillDataSet(RooDataSet &data, RooArgList &vars, const double *values, std::size_t nEntries) {
+    const std::size_t nVars = vars.getSize();
+    RooArgSet varSet(vars);
+    for (std::size_t i = 0; i < nEntries; ++i) {
+        for (std::size_t j = 0; j < nVars; ++j) static_cast<RooRealVar &>(vars[j]).setVal(values[i * nVars + j]);
+        data.add(varSet);
+    }
+}
+// values: row-major array (nBins, number of variables) of bin centers
+// sumw2: sums of the squared weights of the bins (the weights for counts)
+void FillDataHist(RooDataHist &data, RooArgList &vars, const double *values, const double *weights,
+                  const double *sumw2, std::size_t nBins) {
+    const std::size_t nVars = vars.getSize();
+    RooArgSet varSet(vars);
+    for (std::size_t i = 0; i < nBins; ++i) {
+        for (std::size_t j = 0; j < nVars; ++j) static_cast<RooRealVar &>(vars[j]).setVal(values[i * nVars + j]);
+        data.add(varSet, weights[i], sumw2[i]);
+    }
+}
+// out: array (number of names, number of entries), one contiguous row per variable
+void FillArray(const RooAbsData &data, const std::vector<std::string> &names, double *out) {
+    const RooArgSet *row = data.get();
+    std::vector<RooAbsReal *> vars;
+    for (const auto &name : names) {
+        RooAbsReal *var = row == nullptr ? nullptr : dynamic_cast<RooAbsReal *>(row->find(name.c_str()));
+        if (var == nullptr) throw std::runtime_error("No variable " + name + " in the dataset");
+        vars.push_back(var);
+    }
+    const std::size_t nEntries = data.numEntries();
+    for (std::size_t i = 0; i < nEntries; ++i) {
+        data.get(i);
+        for (std::size_t j = 0; j < vars.size(); ++j) out[j * nEntries + i] = vars[j]->getVal();
+    }
+}
+}
+"""
+_fill_helpers_declared = False
+
+
+# Processor used by the worker processes. The workers are forked: they inherit
+# the processor, its data and its ROOT objects, which cannot be pickled.
+_worker_processor = None
+
+
+def _call_worker(method_name, *args):
+    return getattr(_worker_processor, method_name)(*args)
+
+
+def _declare_fill_helpers():
+    global _fill_helpers_declared
+    if not _fill_helpers_declared:
+        if not ROOT.gInterpreter.Declare(_fill_helpers_code):
+            raise RuntimeError("Cannot compile the dataset filling functions")
+        _fill_helpers_declared = True
+
+
+def _arg_collections(variables):
+    argSet, argList = ROOT.RooArgSet(), ROOT.RooArgList()
+    for var in variables:
+        argSet.add(var)
+        argList.add(var)
+    return argSet, argList
+
+
+def numpy_to_dataset(name, variables, columns):
+    '''
+    Create an unbinned RooDataSet from numpy arrays in one bulk operation
+    (RooDataSet.from_numpy if available, a compiled filling loop otherwise)
+
+    Args:
+        name: name (and title) of the dataset
+        variables: list of RooRealVar
+        columns: dictionary {variable name: array of values}
+    '''
+    names = [var.GetName() for var in variables]
+    argSet, argList = _arg_collections(variables)
+    arrays = [numpy.asarray(columns[aName], dtype=numpy.float64) for aName in names]
+    if hasattr(ROOT.RooDataSet, "from_numpy"):
+        return ROOT.RooDataSet.from_numpy(dict(zip(names, arrays)), argSet, name=name, title=name)
+    _declare_fill_helpers()
+    values = numpy.ascontiguousarray(numpy.column_stack(arrays))
+    data = ROOT.RooDataSet(name, name, argSet)
+    ROOT.morpho.FillDataSet(data, argList, values, len(values))
+    return data
+
+
+def dataset_to_numpy(data, names):
+    '''
+    Extract columns of a RooDataSet in one bulk operation
+    (RooDataSet.to_numpy if available, a compiled loop otherwise)
+
+    Args:
+        data: RooDataSet (or any RooAbsData)
+        names: names of the variables to extract
+    Returns:
+        dict: {name: numpy array}
+    '''
+    if hasattr(data, "to_numpy"):
+        columns = data.to_numpy()
+        return {aName: numpy.asarray(columns[aName], dtype=numpy.float64) for aName in names}
+    _declare_fill_helpers()
+    values = numpy.empty((len(names), data.numEntries()))
+    ROOT.morpho.FillArray(data, [str(aName) for aName in names], values)
+    return {aName: values[i] for i, aName in enumerate(names)}
+
+
+def numpy_to_datahist(name, variables, columns, weights=None):
+    '''
+    Create a binned RooDataHist from numpy arrays: the histogram is computed
+    by numpy with the binning of the variables, then imported in bulk
+    (RooDataHist.from_numpy if available, a compiled filling loop otherwise)
+
+    Args:
+        name: name (and title) of the dataset
+        variables: list of RooRealVar
+        columns: dictionary {variable name: array of values}
+        weights: array of weights of the values (default: 1)
+    '''
+    names = [var.GetName() for var in variables]
+    argSet, argList = _arg_collections(variables)
+    edges = []
+    for var in variables:
+        binning = var.getBinning()
+        edges.append(numpy.array([binning.binLow(i) for i in range(binning.numBins())] +
+                                 [binning.binHigh(binning.numBins()-1)]))
+    values = numpy.column_stack([numpy.asarray(columns[aName], dtype=numpy.float64) for aName in names])
+    counts, edges = numpy.histogramdd(values, bins=edges, weights=weights)
+    if weights is None:
+        sumw2 = counts
+    else:
+        sumw2, _ = numpy.histogramdd(values, bins=edges, weights=numpy.square(weights))
+    if hasattr(ROOT.RooDataHist, "from_numpy"):
+        return ROOT.RooDataHist.from_numpy(counts, argSet, bins=list(edges), weights_squared_sum=sumw2,
+                                           name=name, title=name)
+    _declare_fill_helpers()
+    filled = numpy.nonzero(counts)
+    centers = numpy.ascontiguousarray(numpy.column_stack(
+        [0.5*(someEdges[:-1]+someEdges[1:])[index] for someEdges, index in zip(edges, filled)]))
+    weights = numpy.ascontiguousarray(counts[filled], dtype=numpy.float64)
+    data = ROOT.RooDataHist(name, name, argSet)
+    ROOT.morpho.FillDataHist(data, argList, centers, weights,
+                             numpy.ascontiguousarray(sumw2[filled], dtype=numpy.float64), len(weights))
+    return data
+
 
 class RooFitInterfaceProcessor(BaseProcessor):
     '''
@@ -27,14 +190,22 @@ class RooFitInterfaceProcessor(BaseProcessor):
     The input data are given via the attribute "data".
 
     Parameters:
-        varName (required): name(s) of the variable in the data
+        varName (required): name of the variable in the data, or list of names of the observables
         nuisanceParams (required): parameters to be discarded at end of sampling
         interestParams (required): parameters to be saved in the results variable
-        iter (required): total number of iterations (warmup and sampling)
+        iter (required): total number of iterations (warmup and sampling), or number of events per toy
         warmup: number of warmup iterations (default=iter/2)
-        chain: number of chains (default=1)
+        chain: number of independent chains, run in parallel processes (default=1)
         n_jobs: number of parallel cores running (default=1)
+        seed: seed of the random generator (default: random); each chain gets its own seed derived from it
         binned: should do binned analysis (default=false)
+        n_toys (toys mode, required): number of toy datasets generated and fitted
+        observables (toys mode): names of the generated variables (default=varName)
+        trueValues (toys mode): values of the parameters used to generate the toys,
+            like {'varName': value} (default: initial values of the pdf)
+        scanParams (scan mode, required): one or two parameters for the profile likelihood scan,
+            like {'varName': [min, max, n_points]}
+        as_lists: store the results as lists instead of numpy arrays (default=False)
         options: other options
 
     Input:
@@ -42,31 +213,35 @@ class RooFitInterfaceProcessor(BaseProcessor):
 
     Results:
         results: dictionary containing the result of the sampling of the parameters of interest
+        (toys mode: fitted value, error_<param> and pull_<param> of the parameters of interest,
+        toy, status, cov_qual and min_nll for each toy;
+        scan mode: scanned and interest parameters, nll, delta_nll (relative to the minimum of the scan)
+        and status for each grid point)
     '''
 
     def _defineDataset(self, wspace):
         '''
         Define our dataset given our data and add it to the workspace..
-        Note that we only import one variable in the RooWorkspace.
-        TODO:
-         - Implement the import of several variables in the RooWorkspace
-           -> might need to redefine this method when necessary
+        All the variables of varName are imported in the RooWorkspace, with
+        ranges given by the minimum and maximum of the data.
+        The data are imported in bulk from numpy arrays (binned data are
+        histogrammed by numpy with the default binning of the variables).
         '''
-        var = ROOT.RooRealVar(self.varName, self.varName, min(
-            self._data[self.varName]), max(self._data[self.varName]))
-        # Needed for being able to do convolution products on this variable (don't touch!)
-        var.setBins(10000, "cache")
+        values = numpy.column_stack([numpy.asarray(self._data[aName], dtype=numpy.float64)
+                                     for aName in self.varNames])
+        variables = []
+        for aName, minimum, maximum in zip(self.varNames, values.min(axis=0), values.max(axis=0)):
+            var = ROOT.RooRealVar(str(aName), str(aName), minimum, maximum)
+            # Needed for being able to do convolution products on this variable (don't touch!)
+            var.setBins(10000, "cache")
+            variables.append(var)
+        columns = {aName: values[:, i] for i, aName in enumerate(self.varNames)}
         if self.binned:
-            logger.debug("Binned dataset {}".format(self.varName))
-            data = ROOT.RooDataHist(
-                self.datasetName, self.datasetName, ROOT.RooArgSet(var))
+            logger.debug("Binned dataset {}".format(self.varNames))
+            data = numpy_to_datahist(self.datasetName, variables, columns)
         else:
-            logger.debug("Unbinned dataset {}".format(self.varName))
-            data = ROOT.RooDataSet(
-                self.datasetName, self.datasetName, ROOT.RooArgSet(var))
-        for value in self._data[self.varName]:
-            var.setVal(value)
-            data.add(ROOT.RooArgSet(var))
+            logger.debug("Unbinned dataset {}".format(self.varNames))
+            data = numpy_to_dataset(self.datasetName, variables, columns)
         getattr(wspace, 'import')(data)
         logger.info("Workspace after dataset:")
         wspace.Print()
@@ -98,24 +273,40 @@ class RooFitInterfaceProcessor(BaseProcessor):
 
     def InternalConfigure(self, config_dict):
         self.varName = reader.read_param(config_dict, "varName", "required")
+        self.varNames = list(self.varName) if isinstance(self.varName, list) else [self.varName]
         self.mode = reader.read_param(config_dict, "mode", "generate")
         logger.debug("Mode {}".format(self.mode))
-        if self.mode == "lsampling" or self.mode == "generate":
+        if self.mode in ["lsampling", "generate", "toys"]:
             self.iter = int(reader.read_param(config_dict, "iter", "required"))
-        if self.mode == "fit" or self.mode == "lsampling":
+        if self.mode in ["fit", "lsampling", "toys"]:
             self.binned = int(reader.read_param(config_dict, "binned", False))
+        if self.mode == "toys":
+            self.n_toys = int(reader.read_param(config_dict, "n_toys", "required"))
+            self.observableNames = reader.read_param(
+                config_dict, "observables", self.varNames)
+            self.trueValues = reader.read_param(config_dict, "trueValues", dict())
+        if self.mode == "scan":
+            self.scanParameters = reader.read_param(config_dict, "scanParams", "required")
+            if not isinstance(self.scanParameters, dict) or len(self.scanParameters) not in [1, 2]:
+                logger.error(
+                    "scanParams should be a dictionary of one or two parameters like {'varName': [min, max, n_points]}")
+                return False
         if self.mode == "lsampling":
             self.nuisanceParametersNames = reader.read_param(
                 config_dict, "nuisanceParams", "required")
             self.warmup = int(reader.read_param(
                 config_dict, "warmup", self.iter/2.))
+            self.n_chains = int(reader.read_param(config_dict, "chain", 1))
         self.numCPU = int(reader.read_param(config_dict, "n_jobs", 1))
+        self.as_lists = reader.read_param(config_dict, "as_lists", False)
+        # Default seed drawn from the python generator (seeded by the toolbox seed if any)
+        self.seed = int(reader.read_param(config_dict, "seed", random.randint(1, 2**31 - 1)))
         self.options = reader.read_param(config_dict, "options", dict())
-        if self.mode not in ['generate', 'lsampling', 'fit']:
+        if self.mode not in ['generate', 'lsampling', 'fit', 'toys', 'scan']:
             logger.error(
-                "Mode '{}' is not valid; choose between 'mode' and 'lsampling'".format(self.mode))
+                "Mode '{}' is not valid; choose between 'generate', 'lsampling', 'fit', 'toys' and 'scan'".format(self.mode))
             return False
-        self.datasetName = "data_"+self.varName
+        self.datasetName = "data_"+"_".join(str(aName) for aName in self.varNames)
         self.paramOfInterestNames = reader.read_param(
             config_dict, "interestParams", "required")
         self.fixedParameters = reader.read_param(
@@ -135,6 +326,10 @@ class RooFitInterfaceProcessor(BaseProcessor):
             return self._LikelihoodSampling()
         elif self.mode == 'fit':
             return self._Fit()
+        elif self.mode == 'toys':
+            return self._Toys()
+        elif self.mode == 'scan':
+            return self._Scan()
         else:
             logger.error("Unknown mode <{}>".format(self.mode))
             return False
@@ -159,7 +354,7 @@ class RooFitInterfaceProcessor(BaseProcessor):
 
         if self.make_fit_plot:
             can = ROOT.TCanvas("can", "can", 600, 400)
-            var = wspace.var(self.varName)
+            var = wspace.var(str(self.varNames[0]))
             frame = var.frame()
             dataset.plotOn(frame)
             pdf.plotOn(frame)
@@ -174,12 +369,14 @@ class RooFitInterfaceProcessor(BaseProcessor):
                 {"error_"+str(varName): wspace.var(str(varName)).getErrorHi()})
         return True
 
-    def _FixParams(self, wspace):
-        '''Fix the variables inside a workspace'''
-        if len(self.fixedParameters) == 0:
+    def _FixParams(self, wspace, parameters=None):
+        '''Fix the variables inside a workspace (the fixedParams by default)'''
+        if parameters is None:
+            parameters = self.fixedParameters
+        if len(parameters) == 0:
             logger.debug("No fixed parameters given")
             return wspace
-        for varName, value in self.fixedParameters.items():
+        for varName, value in parameters.items():
             wspace.var(str(varName)).setVal(float(value))
             wspace.var(str(varName)).setConstant()
             logger.debug("Value of {} set to {}".format(
@@ -191,7 +388,7 @@ class RooFitInterfaceProcessor(BaseProcessor):
         Generate the data by sampling the pdf defined in the workspace
         '''
         # Setting a random seed
-        ROOT.RooRandom.randomGenerator().SetSeed(random.randint(0, 121212111121212))
+        ROOT.RooRandom.randomGenerator().SetSeed(self.seed)
 
         wspace = ROOT.RooWorkspace()
         wspace = self.definePdf(wspace)
@@ -204,38 +401,56 @@ class RooFitInterfaceProcessor(BaseProcessor):
         data = pdf.generate(paramOfInterest, self.iter)
         data.Print()
 
-        self.data = {}
-        for name in self.paramOfInterestNames:
-            self.data.update({name: []})
-
-        for i in range(0, data.numEntries()):
-            for item in self.data:
-                self.data[item].append(
-                    data.get(i).getRealValue(item))
-        self.data.update({"is_sample": [1]*(self.iter)})
+        self.data = dataset_to_numpy(data, self.paramOfInterestNames)
+        self.data.update({"is_sample": numpy.ones(data.numEntries(), dtype=int)})
+        if self.as_lists:
+            self.data = {key: value.tolist() for key, value in self.data.items()}
 
         return True
 
-    def _LikelihoodSampling(self):
+    def _MapInWorkers(self, method_name, arguments, n_workers):
+        '''
+        Call a method of the processor for each tuple of arguments, in a pool
+        of n_workers forked processes (in this process if n_workers is 1)
+        Returns:
+            list: the values returned by the method, in the order of the arguments
+        '''
+        global _worker_processor
+        if n_workers <= 1 or len(arguments) <= 1:
+            return [getattr(self, method_name)(*args) for args in arguments]
+        logger.info("Running {} tasks in {} processes".format(len(arguments), n_workers))
+        _worker_processor = self
+        try:
+            with futures.ProcessPoolExecutor(max_workers=n_workers,
+                                             mp_context=multiprocessing.get_context("fork")) as executor:
+                return list(executor.map(_call_worker, [method_name]*len(arguments), *zip(*arguments)))
+        finally:
+            _worker_processor = None
+
+    def _BuildLikelihoodWorkspace(self):
         '''
-        Sample the pdf defined in the workspace
+        Create the workspace with the dataset and the pdf
         '''
         wspace = ROOT.RooWorkspace()
         wspace = self._defineDataset(wspace)
         wspace = self.definePdf(wspace)
         wspace = self._FixParams(wspace)
+        return wspace
+
+    def _LikelihoodSampling(self):
+        '''
+        Sample the pdf defined in the workspace.
+        The proposal function of all the chains is built from the covariance
+        matrix of the same fit; the chains are run in parallel processes,
+        each with its own seed and its own likelihood.
+        '''
+        wspace = self._BuildLikelihoodWorkspace()
         logger.debug("Workspace content:")
         wspace.Print()
-        paramOfInterest = self._getArgSet(wspace, self.paramOfInterestNames)
-        nuisanceParams = self._getArgSet(wspace, self.nuisanceParametersNames)
-        allParams = ROOT.RooArgSet(paramOfInterest, nuisanceParams)
 
         dataset = wspace.data(self.datasetName)
         pdf = wspace.pdf("pdf")
 
-        logger.debug("Creating likelihood")
-        nll = pdf.createNLL(dataset, ROOT.RooFit.NumCPU(self.numCPU))
-
         logger.debug("Estimating best fits for proposal function...")
         result = pdf.fitTo(dataset, ROOT.RooFit.Save(),
                            ROOT.RooFit.NumCPU(self.numCPU))
@@ -244,13 +459,43 @@ class RooFitInterfaceProcessor(BaseProcessor):
         logger.debug("Covariance matrix:")
         result.covarianceMatrix().Print()
 
-        # can = ROOT.TCanvas("can","can",600,400)
-        # var = wspace.var(self.varName)
-        # frame = var.frame()
-        # dataset.plotOn(frame)
-        # pdf.plotOn(frame)
-        # frame.Draw()
-        # can.SaveAs("plots/results_fit.pdf")
+        # The forked workers use the workspace and the fit result of this process
+        self._chainWorkspace, self._proposalFitResult = wspace, result
+        seeds = [get_run_seed(self.seed, chain_id) for chain_id in range(self.n_chains)]
+        n_workers = min(self.n_chains, multiprocessing.cpu_count())
+        chains = self._MapInWorkers("_RunChain", list(enumerate(seeds)), n_workers)
+        self._chainWorkspace, self._proposalFitResult = None, None
+
+        self.results = {key: numpy.concatenate([chain[key] for chain in chains]) for key in chains[0]}
+        if self.as_lists:
+            self.results = {key: value.tolist() for key, value in self.results.items()}
+
+        return True
+
+    def _RunChain(self, chain_id, seed):
+        '''
+        Run one Metropolis-Hastings chain, starting from the best fit
+        Args:
+            chain_id: number of the chain
+            seed: seed of the chain
+        Returns:
+            dict: numpy columns of the chain (parameters of interest, lp_prob, is_sample, chain)
+        '''
+        ROOT.RooRandom.randomGenerator().SetSeed(seed)
+        wspace, result = self._chainWorkspace, self._proposalFitResult
+        floatPars = result.floatParsFinal()
+        for i in range(floatPars.getSize()):
+            wspace.var(floatPars.at(i).GetName()).setVal(floatPars.at(i).getVal())
+        paramOfInterest = self._getArgSet(wspace, self.paramOfInterestNames)
+        nuisanceParams = self._getArgSet(wspace, self.nuisanceParametersNames)
+        allParams = ROOT.RooArgSet(paramOfInterest, nuisanceParams)
+
+        dataset = wspace.data(self.datasetName)
+        pdf = wspace.pdf("pdf")
+
+        logger.debug("Creating likelihood (chain {})".format(chain_id))
+        nllCPU = max(1, self.numCPU//self.n_chains)
+        nll = pdf.createNLL(dataset, ROOT.RooFit.NumCPU(nllCPU))
 
         logger.debug("Define Proposal function")
         ph = ROOT.RooStats.ProposalHelper()
@@ -268,26 +513,190 @@ class RooFitInterfaceProcessor(BaseProcessor):
         mh.SetProposalFunction(pdfProp)
         mh.SetNumIters(self.iter)
         mh.SetNumBurnInSteps(self.warmup)
-        logger.debug("Starting Markov Chain...")
+        logger.debug("Starting Markov Chain {} (seed {})...".format(chain_id, seed))
         chain = mh.ConstructChain()
-        logger.debug("Markov Chain complete!")
+        logger.debug("Markov Chain {} complete!".format(chain_id))
 
         chainData = chain.GetAsDataSet()
 
-        self.results = {}
-        for name in self.paramOfInterestNames:
-            self.results.update({name: []})
-        self.results.update({"lp_prob": []})
-
-        for i in range(0, chainData.numEntries()):
-            for item in self.results:
-                if item == "lp_prob":
-                    self.results[item].append(-chainData.get(
-                        i).getRealValue("nll_MarkovChain_local_"))
-                else:
-                    self.results[item].append(
-                        chainData.get(i).getRealValue(item))
-        self.results.update(
-            {"is_sample": [0]*self.warmup + [1]*(int(chainData.numEntries())-self.warmup)})
+        results = dataset_to_numpy(
+            chainData, list(self.paramOfInterestNames) + ["nll_MarkovChain_local_"])
+        results.update({"lp_prob": -results.pop("nll_MarkovChain_local_")})
+        is_sample = numpy.ones(chainData.numEntries(), dtype=int)
+        is_sample[:self.warmup] = 0
+        results.update({"is_sample": is_sample})
+        results.update({"chain": numpy.full(chainData.numEntries(), chain_id, dtype=int)})
+        return results
+
+    def _Toys(self):
+        '''
+        Generate toy datasets with the pdf defined in the workspace and fit them.
+        The workspace is built once; the toys are split in batches
+        run in parallel processes, each toy with its own seed.
+        '''
+        wspace = ROOT.RooWorkspace()
+        wspace = self.definePdf(wspace)
+        logger.debug("Workspace content:")
+        wspace.Print()
+        wspace = self._FixParams(wspace)
+        for varName, value in self.trueValues.items():
+            wspace.var(str(varName)).setVal(float(value))
+        # All the parameters of the pdf are reset to these values before each toy
+        pdf = wspace.pdf("pdf")
+        wspace.saveSnapshot("toy_truth", pdf.getParameters(self._getArgSet(wspace, self.observableNames)), True)
+        self._trueValues = {str(varName): wspace.var(str(varName)).getVal()
+                            for varName in self.paramOfInterestNames}
+        logger.info("Generating {} toys with {}".format(self.n_toys, self._trueValues))
+
+        # The forked workers use the workspace of this process
+        self._toyWorkspace = wspace
+        n_workers = min(self.n_toys, multiprocessing.cpu_count())
+        batches = [(int(toys[0]), int(toys[-1]) + 1)
+                   for toys in numpy.array_split(numpy.arange(self.n_toys), 4*n_workers) if len(toys) > 0]
+        toys = self._MapInWorkers("_RunToys", batches, n_workers)
+        self._toyWorkspace = None
+
+        self.results = {key: numpy.concatenate([batch[key] for batch in toys]) for key in toys[0]}
+        n_failed = int(numpy.count_nonzero(self.results["status"]))
+        if n_failed > 0:
+            logger.warning("{} fits out of {} did not converge".format(n_failed, self.n_toys))
+        for varName in self.paramOfInterestNames:
+            pulls = self.results["pull_"+str(varName)]
+            logger.info("Pull of {}: mean={:.3f}, std={:.3f}".format(
+                varName, numpy.nanmean(pulls), numpy.nanstd(pulls)))
+        if self.as_lists:
+            self.results = {key: value.tolist() for key, value in self.results.items()}
+
+        return True
+
+    def _RunToys(self, first_toy, last_toy):
+        '''
+        Generate and fit a batch of toys: all the parameters are reset to the
+        true values before generating each toy and fitting it
+        Args:
+            first_toy, last_toy: range of the toy numbers
+        Returns:
+            dict: numpy columns of the fit results of the toys
+        '''
+        wspace = self._toyWorkspace
+        pdf = wspace.pdf("pdf")
+        observables = self._getArgSet(wspace, self.observableNames)
+        n_toys = last_toy - first_toy
+        nllCPU = max(1, self.numCPU//min(self.n_toys, multiprocessing.cpu_count()))
+
+        results = {"toy": numpy.arange(first_toy, last_toy)}
+        for varName in self.paramOfInterestNames:
+            for key in [str(varName), "error_"+str(varName), "pull_"+str(varName)]:
+                results[key] = numpy.empty(n_toys)
+        results.update({"status": numpy.empty(n_toys, dtype=int),
+                        "cov_qual": numpy.empty(n_toys, dtype=int),
+                        "min_nll": numpy.empty(n_toys)})
+
+        for i, toy in enumerate(range(first_toy, last_toy)):
+            wspace.loadSnapshot("toy_truth")
+            ROOT.RooRandom.randomGenerator().SetSeed(get_run_seed(self.seed, toy))
+            data = pdf.generate(observables, self.iter)
+            if self.binned:
+                data = data.binnedClone()
+            result = pdf.fitTo(data, ROOT.RooFit.Save(), ROOT.RooFit.PrintLevel(-1),
+                               ROOT.RooFit.NumCPU(nllCPU))
+            for varName, value in self._trueValues.items():
+                var = wspace.var(varName)
+                error = var.getError()
+                results[varName][i] = var.getVal()
+                results["error_"+varName][i] = error
+                results["pull_"+varName][i] = (var.getVal() - value)/error if error > 0 else numpy.nan
+            results["status"][i] = result.status()
+            results["cov_qual"][i] = result.covQual()
+            results["min_nll"][i] = result.minNll()
+        logger.debug("Toys {} to {} done".format(first_toy, last_toy - 1))
+        return results
+
+    def _ScanGrid(self):
+        '''
+        Returns:
+            list: names of the scanned parameters
+            list: numpy arrays of the values of each parameter on the grid (flattened)
+            numpy array: indices of the grid points along a path going from each
+            point to a neighbouring one (reversing the direction at each row)
+        '''
+        names = [str(varName) for varName in self.scanParameters]
+        axes = [numpy.linspace(float(lower), float(upper), int(n_points))
+                for lower, upper, n_points in self.scanParameters.values()]
+        grid = numpy.meshgrid(*axes, indexing='ij')
+        indices = numpy.arange(grid[0].size).reshape(grid[0].shape)
+        if indices.ndim == 2:
+            indices[1::2] = indices[1::2, ::-1]
+        return names, [values.ravel() for values in grid], indices.ravel()
+
+    def _Scan(self):
+        '''
+        Profile likelihood scan of one or two parameters on a grid.
+        The grid is cut in segments of neighbouring points run in parallel
+        processes; in each segment, the minimization at each point starts from
+        the minimum found at the previous one.
+        '''
+        wspace = self._BuildLikelihoodWorkspace()
+        logger.debug("Workspace content:")
+        wspace.Print()
+        dataset = wspace.data(self.datasetName)
+        pdf = wspace.pdf("pdf")
+
+        logger.debug("Estimating best fit...")
+        result = pdf.fitTo(dataset, ROOT.RooFit.Save(), ROOT.RooFit.PrintLevel(-1),
+                           ROOT.RooFit.NumCPU(self.numCPU))
+        result.Print()
+
+        names, grid, path = self._ScanGrid()
+        n_workers = min(len(path), multiprocessing.cpu_count())
+        segments = [(segment,) for segment in numpy.array_split(path, n_workers) if len(segment) > 0]
+        # The forked workers use the workspace of this process, at the best fit values
+        self._scanWorkspace, self._scanGrid = wspace, (names, grid)
+        profiles = self._MapInWorkers("_RunScan", segments, n_workers)
+        self._scanWorkspace, self._scanGrid = None, None
+
+        self.results = {name: values for name, values in zip(names, grid)}
+        for key in profiles[0]:
+            if key in self.results:
+                continue
+            self.results[key] = numpy.empty(len(path), dtype=profiles[0][key].dtype)
+            for (segment,), profile in zip(segments, profiles):
+                self.results[key][segment] = profile[key]
+        # The reference is the minimum of the scan: the NLL of fitTo may have a different offset
+        self.results["delta_nll"] = self.results["nll"] - numpy.nanmin(self.results["nll"])
+        n_failed = int(numpy.count_nonzero(self.results["status"]))
+        if n_failed > 0:
+            logger.warning("{} minimizations out of {} did not converge".format(n_failed, len(path)))
+        if self.as_lists:
+            self.results = {key: value.tolist() for key, value in self.results.items()}
 
         return True
+
+    def _RunScan(self, segment):
+        '''
+        Minimize the likelihood over the floating parameters at each point of a segment of the grid
+        Args:
+            segment: indices of the grid points, in the order of the scan
+        Returns:
+            dict: numpy columns of the profile (interest parameters, nll, status) along the segment
+        '''
+        wspace = self._scanWorkspace
+        names, grid = self._scanGrid
+        dataset = wspace.data(self.datasetName)
+        pdf = wspace.pdf("pdf")
+        nllCPU = max(1, self.numCPU//min(len(grid[0]), multiprocessing.cpu_count()))
+        nll = pdf.createNLL(dataset, ROOT.RooFit.NumCPU(nllCPU))
+
+        profile = {str(varName): numpy.empty(len(segment)) for varName in self.paramOfInterestNames}
+        profile.update({"nll": numpy.empty(len(segment)),
+                        "status": numpy.empty(len(segment), dtype=int)})
+        for i, point in enumerate(segment):
+            wspace = self._FixParams(wspace, {name: values[point] for name, values in zip(names, grid)})
+            minimizer = ROOT.RooMinimizer(nll)
+            minimizer.setPrintLevel(-1)
+            profile["status"][i] = minimizer.migrad()
+            profile["nll"][i] = nll.getVal()
+            for varName in self.paramOfInterestNames:
+                profile[str(varName)][i] = wspace.var(str(varName)).getVal()
+        logger.debug("Scan of {} points done".format(len(segment)))
+        return profile
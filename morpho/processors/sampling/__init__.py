@@ -3,11 +3,14 @@
 
 from __future__ import absolute_import
 
-from .GaussianSamplingProcessor import GaussianSamplingProcessor
-from .GaussianRooFitProcessor import GaussianRooFitProcessor
+from morpho.utilities import registry
 
-from .PyStanSamplingProcessor import PyStanSamplingProcessor
-from .RooFitInterfaceProcessor import RooFitInterfaceProcessor
-from .PyBindRooFitProcessor import PyBindRooFitProcessor
-from .LinearFitRooFitProcessor import LinearFitRooFitProcessor
-from .PriorSamplingProcessor import PriorSamplingProcessor
+registry.make_lazy(__name__, {
+    "GaussianSamplingProcessor": ".GaussianSamplingProcessor",
+    "GaussianRooFitProcessor": ".GaussianRooFitProcessor",
+    "PyStanSamplingProcessor": ".PyStanSamplingProcessor",
+    "RooFitInterfaceProcessor": ".RooFitInterfaceProcessor",
+    "PyBindRooFitProcessor": ".PyBindRooFitProcessor",
+    "LinearFitRooFitProcessor": ".LinearFitRooFitProcessor",
+    "PriorSamplingProcessor": ".PriorSamplingProcessor"
+})
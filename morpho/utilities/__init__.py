@@ -6,6 +6,5 @@ from __future__ import absolute_import
 from .morphologging import *
 from .reader import *
 from .pystanLoader import *
-from .plots import *
 from .toolbox import *
 from .parser import *
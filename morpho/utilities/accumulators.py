@@ -0,0 +1,222 @@
+'''
+Online accumulators of statistics, in constant memory
+Date: 10/18/26
+
+The values are added one by one (or by arrays) and never stored; two
+accumulators filled with different values (e.g. by different workers) can be
+merged into one, giving the same result as if all the values had been added
+to the same accumulator:
+  - RunningStats: count, mean and variance (Welford/Chan), minimum and maximum
+  - QuantileSketch: approximate quantiles (merging t-digest)
+  - BinomialCounter: exact number of successes among trials (e.g. coverage)
+'''
+
+from __future__ import absolute_import
+
+import math
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+class RunningStats(object):
+    '''
+    Count, mean, variance, minimum and maximum of a stream of values
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self._m2 = 0.
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta/self.count
+        self._m2 += delta*(value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_many(self, values):
+        values = numpy.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        other = RunningStats()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other._m2 = float(((values - other.mean)**2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other):
+        '''
+        Add the values of another RunningStats
+        '''
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta*other.count/count
+        self._m2 += other._m2 + delta**2*self.count*other.count/count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        '''
+        Unbiased variance (nan if less than 2 values)
+        '''
+        return self._m2/(self.count - 1) if self.count > 1 else float('nan')
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class QuantileSketch(object):
+    '''
+    Approximate quantiles of a stream of values (merging t-digest)
+
+    The values are summarized by at most about "compression" weighted
+    centroids, smaller near the tails of the distribution.
+
+    Args:
+        compression: accuracy parameter (default=100)
+    '''
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = numpy.empty(0)
+        self.weights = numpy.empty(0)
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self._buffer = []
+        self._buffer_size = 5*compression
+
+    def add(self, value):
+        self._buffer.append(float(value))
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+
+    def add_many(self, values):
+        values = numpy.asarray(values, dtype=float).ravel()
+        if len(values) > 0:
+            self._compress(values, numpy.ones(len(values)))
+
+    def merge(self, other):
+        '''
+        Add the values of another QuantileSketch
+        '''
+        other._compress()
+        if other.count > 0:
+            self._compress(other.means, other.weights, other.min, other.max)
+        return self
+
+    def _scale(self, q):
+        return self.compression/(2*math.pi)*math.asin(2*q - 1)
+
+    def _inverse_scale(self, k):
+        return (math.sin(2*math.pi*k/self.compression) + 1)/2
+
+    def _compress(self, means=None, weights=None, minimum=None, maximum=None):
+        buffer = numpy.array(self._buffer)
+        self._buffer = []
+        if means is None:
+            means, weights = numpy.empty(0), numpy.empty(0)
+        # The minimum and maximum of merged centroids are given by the other sketch
+        for values in [buffer, means]:
+            if len(values) > 0:
+                self.min = min(self.min, float(values.min()))
+                self.max = max(self.max, float(values.max()))
+        if minimum is not None:
+            self.min = min(self.min, minimum)
+            self.max = max(self.max, maximum)
+        means = numpy.concatenate([self.means, buffer, means])
+        weights = numpy.concatenate([self.weights, numpy.ones(len(buffer)), weights])
+        if len(means) == 0:
+            return
+        order = numpy.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Greedy merge of the neighbouring centroids while the merged centroid
+        # spans less than one unit of the scale function
+        new_means, new_weights = [], []
+        cumulated = 0.
+        q_limit = self._inverse_scale(self._scale(0.) + 1)
+        current_sum, current_weight = means[0]*weights[0], weights[0]
+        for mean, weight in zip(means[1:], weights[1:]):
+            if (cumulated + current_weight + weight)/total <= q_limit:
+                current_sum += mean*weight
+                current_weight += weight
+            else:
+                new_means.append(current_sum/current_weight)
+                new_weights.append(current_weight)
+                cumulated += current_weight
+                q_limit = self._inverse_scale(self._scale(min(cumulated/total, 1.)) + 1)
+                current_sum, current_weight = mean*weight, weight
+        new_means.append(current_sum/current_weight)
+        new_weights.append(current_weight)
+        self.means = numpy.array(new_means)
+        self.weights = numpy.array(new_weights)
+        self.count = int(round(total))
+
+    def quantile(self, q):
+        '''
+        Args:
+            q: float or array of floats between 0 and 1
+        Returns:
+            approximate quantile(s) (nan if no value was added)
+        '''
+        self._compress()
+        if self.count == 0:
+            return numpy.full(numpy.shape(q), numpy.nan)[()]
+        centers = numpy.cumsum(self.weights) - self.weights/2.
+        positions = numpy.concatenate([[0.], centers, [self.count]])
+        values = numpy.concatenate([[self.min], self.means, [self.max]])
+        return numpy.interp(numpy.asarray(q)*self.count, positions, values)[()]
+
+    @property
+    def median(self):
+        return float(self.quantile(0.5))
+
+
+class BinomialCounter(object):
+    '''
+    Number of successes among a number of trials
+    '''
+
+    def __init__(self):
+        self.n_trials = 0
+        self.n_successes = 0
+
+    def add(self, success):
+        self.n_trials += 1
+        self.n_successes += int(bool(success))
+
+    def merge(self, other):
+        self.n_trials += other.n_trials
+        self.n_successes += other.n_successes
+        return self
+
+    @property
+    def fraction(self):
+        return self.n_successes/float(self.n_trials) if self.n_trials > 0 else float('nan')
+
+    @property
+    def error(self):
+        '''
+        Binomial uncertainty on the fraction
+        '''
+        if self.n_trials == 0:
+            return float('nan')
+        fraction = self.fraction
+        return math.sqrt(fraction*(1 - fraction)/self.n_trials)
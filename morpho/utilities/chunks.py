@@ -0,0 +1,114 @@
+'''
+Chunks of columns given from a processor to another
+Date: 10/18/26
+
+A processor reading large data (e.g. IOROOTProcessor in streaming mode) can
+give a ChunkStream instead of a dictionary of columns: the downstream
+processors iterate over fixed-size chunks ({name: numpy array}) and never hold
+the whole data in memory.
+'''
+
+from __future__ import absolute_import
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+class ChunkStream(object):
+    '''
+    Re-iterable stream of chunks of columns
+
+    Args:
+        make_iterator: function without argument returning an iterator over the chunks
+        n_entries: total number of entries, if known (default=None)
+    '''
+
+    def __init__(self, make_iterator, n_entries=None):
+        self.make_iterator = make_iterator
+        self.n_entries = n_entries
+
+    def __iter__(self):
+        return iter(self.make_iterator())
+
+    def read_all(self):
+        '''
+        Read all the chunks into one dictionary of columns
+        '''
+        return fill_columns(self, self.n_entries or 0)
+
+
+def is_stream(data):
+    return isinstance(data, ChunkStream)
+
+
+def iter_chunks(data):
+    '''
+    Iterate over the chunks of the data: a ChunkStream yields its chunks,
+    a dictionary of columns is a single chunk
+    '''
+    if is_stream(data):
+        for chunk in data:
+            yield chunk
+    else:
+        yield data
+
+
+def read_all(data):
+    '''
+    Returns:
+        dict: all the columns (the stream is read entirely if needed)
+    '''
+    if is_stream(data):
+        logger.debug("Reading the whole stream in memory")
+        return data.read_all()
+    return data
+
+
+def fill_columns(chunks, n_entries):
+    '''
+    Concatenate chunks of columns into numpy arrays allocated once
+    Args:
+        chunks: iterable of dictionaries {name: numpy array}
+        n_entries: total number of entries (used for the allocation)
+    Returns:
+        dict: {name: numpy array}
+    Raises:
+        ValueError: if a chunk does not have the columns, the dtypes or the
+            lengths of the first chunk
+    '''
+    import numpy
+    columns = None
+    position = 0
+    for chunk in chunks:
+        chunk = {key: numpy.asarray(value) for key, value in chunk.items()}
+        lengths = set(len(value) for value in chunk.values())
+        if len(lengths) > 1:
+            logger.error("Columns of different lengths in the same chunk: {}".format(
+                {key: len(value) for key, value in chunk.items()}))
+            raise ValueError("Columns of different lengths in the same chunk")
+        n_chunk = lengths.pop() if lengths else 0
+        if columns is None:
+            columns = {key: numpy.empty((max(n_entries, n_chunk),) + value.shape[1:], dtype=value.dtype)
+                       for key, value in chunk.items()}
+        elif set(chunk.keys()) != set(columns.keys()):
+            logger.error("Chunk columns {} differ from the first chunk columns {}".format(
+                sorted(chunk.keys()), sorted(columns.keys())))
+            raise ValueError("Chunk columns differ from the first chunk columns")
+        for key, value in chunk.items():
+            if value.dtype != columns[key].dtype or value.shape[1:] != columns[key].shape[1:]:
+                logger.error("Chunk column <{}> of type {}{} differs from the first chunk ({}{})".format(
+                    key, value.dtype, value.shape[1:], columns[key].dtype, columns[key].shape[1:]))
+                raise ValueError("Chunk column <{}> differs from the first chunk".format(key))
+            if position + n_chunk > len(columns[key]):
+                # More entries than expected: grow the array
+                columns[key] = numpy.concatenate(
+                    [columns[key], numpy.empty((position + n_chunk - len(columns[key]),) + value.shape[1:],
+                                               dtype=columns[key].dtype)])
+            columns[key][position:position + n_chunk] = value
+        position += n_chunk
+    if columns is None:
+        return dict()
+    for key, value in columns.items():
+        if len(value) > position:
+            columns[key] = value[:position]
+    return columns
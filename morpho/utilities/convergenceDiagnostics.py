@@ -0,0 +1,346 @@
+'''
+Vectorized MCMC convergence diagnostics
+Date: 10/18/26
+
+The draws and the sampler parameters are read once and all the diagnostics
+are computed on numpy arrays, for all the parameters at the same time:
+  - rank-normalized split R-hat
+  - bulk and tail effective sample sizes (autocorrelations computed with FFT)
+  - number of divergent transitions
+  - number of transitions saturating the maximum tree depth
+  - energy Bayesian fraction of missing information (E-BFMI) of each chain
+
+Reference: Vehtari et al., "Rank-normalization, folding, and localization:
+An improved R-hat for assessing convergence of MCMC" (2021)
+'''
+
+from __future__ import absolute_import
+
+import math
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+def _inv_normal_cdf(p):
+    '''
+    Inverse of the standard normal cumulative distribution function
+    '''
+    try:
+        from scipy.special import ndtri
+        return ndtri(p)
+    except ImportError:
+        pass
+    # Rational approximation by P. J. Acklam (relative error < 1.2e-9)
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    p = numpy.asarray(p, dtype=float)
+    x = numpy.empty_like(p)
+    low = p < 0.02425
+    high = p > 1 - 0.02425
+    central = ~(low | high)
+    q = numpy.sqrt(-2*numpy.log(p[low]))
+    x[low] = (((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / \
+        ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+    q = numpy.sqrt(-2*numpy.log(1-p[high]))
+    x[high] = -(((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / \
+        ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+    q = p[central] - 0.5
+    r = q*q
+    x[central] = (((((a[0]*r+a[1])*r+a[2])*r+a[3])*r+a[4])*r+a[5])*q / \
+        (((((b[0]*r+b[1])*r+b[2])*r+b[3])*r+b[4])*r+1)
+    return x
+
+
+def split_chains(draws):
+    '''
+    Split each chain in two halves (the middle draw is dropped if needed)
+    Args:
+        draws: array of shape (chains, draws, parameters)
+    Returns:
+        array of shape (2*chains, draws//2, parameters)
+    '''
+    half = draws.shape[1]//2
+    return numpy.concatenate([draws[:, :half], draws[:, draws.shape[1]-half:]], axis=0)
+
+
+def _average_ranks(values):
+    '''
+    Ranks (starting from 1, ties get their average rank) of each column
+    Args:
+        values: array of shape (n, parameters)
+    '''
+    # Sorting along the last (contiguous) axis is much faster
+    values = numpy.ascontiguousarray(values.T)
+    n = values.shape[1]
+    order = numpy.argsort(values, axis=1)
+    sorted_values = numpy.take_along_axis(values, order, axis=1)
+    index = numpy.broadcast_to(numpy.arange(n), values.shape)
+    # Tied values form groups: average the first and last positions of each group
+    new_group = numpy.ones(values.shape, dtype=bool)
+    new_group[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    last_of_group = numpy.ones(values.shape, dtype=bool)
+    last_of_group[:, :-1] = new_group[:, 1:]
+    first = numpy.maximum.accumulate(numpy.where(new_group, index, 0), axis=1)
+    last = numpy.minimum.accumulate(
+        numpy.where(last_of_group, index, n-1)[:, ::-1], axis=1)[:, ::-1]
+    ranks = numpy.empty(values.shape)
+    numpy.put_along_axis(ranks, order, (first + last)/2. + 1, axis=1)
+    return ranks.T
+
+
+def rank_normalize(draws):
+    '''
+    Replace the draws by the normal scores of their ranks (all chains pooled)
+    Args:
+        draws: array of shape (chains, draws, parameters)
+    '''
+    n_chains, n_draws, n_params = draws.shape
+    ranks = _average_ranks(draws.reshape(n_chains*n_draws, n_params))
+    size = n_chains*n_draws
+    return _inv_normal_cdf((ranks - 0.375)/(size + 0.25)).reshape(draws.shape)
+
+
+def rhat(draws):
+    '''
+    Potential scale reduction factor of each parameter
+    Args:
+        draws: array of shape (chains, draws, parameters) (usually split chains)
+    '''
+    n_draws = draws.shape[1]
+    chain_means = draws.mean(axis=1)
+    within = draws.var(axis=1, ddof=1).mean(axis=0)
+    between = n_draws*chain_means.var(axis=0, ddof=1)
+    var_plus = (n_draws - 1.)/n_draws*within + between/n_draws
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.sqrt(var_plus/within)
+
+
+def ess(draws):
+    '''
+    Effective sample size of each parameter, using Geyer's initial monotone sequence
+    Args:
+        draws: array of shape (chains, draws, parameters) (usually split chains)
+    '''
+    n_chains, n_draws, n_params = draws.shape
+    # Autocovariance of each chain with FFT (zero-padded to avoid circular correlations)
+    centered = draws - draws.mean(axis=1, keepdims=True)
+    n_fft = 2**int(math.ceil(math.log(2*n_draws, 2)))
+    spectrum = numpy.fft.rfft(centered, n=n_fft, axis=1)
+    acov = numpy.fft.irfft(spectrum*numpy.conjugate(spectrum), n=n_fft, axis=1)[:, :n_draws]/n_draws
+    chain_vars = acov[:, 0]*n_draws/(n_draws - 1.)
+    mean_var = chain_vars.mean(axis=0)
+    var_plus = mean_var*(n_draws - 1.)/n_draws
+    if n_chains > 1:
+        var_plus = var_plus + draws.mean(axis=1).var(axis=0, ddof=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rho = 1. - (mean_var - acov.mean(axis=0))/var_plus
+    rho[0] = 1.
+    # Sums of consecutive pairs of autocorrelations, truncated at the first negative one
+    n_pairs = n_draws//2
+    pairs = rho[0:2*n_pairs:2] + rho[1:2*n_pairs:2]
+    positive = numpy.cumprod(pairs > 0, axis=0).astype(bool)
+    # Monotone sequence
+    pairs = numpy.minimum.accumulate(numpy.where(positive, pairs, numpy.inf), axis=0)
+    tau = -1. + 2.*numpy.where(positive, pairs, 0.).sum(axis=0)
+    tau = numpy.maximum(tau, 1./math.log10(n_chains*n_draws))
+    result = n_chains*n_draws/tau
+    # Constant parameters have no meaningful effective sample size
+    result[~numpy.isfinite(rho).all(axis=0)] = numpy.nan
+    return result
+
+
+class ConvergenceDiagnostics(object):
+    '''
+    Result of the convergence diagnostics
+
+    Attributes:
+        names: names of the parameters
+        rhat: rank-normalized split R-hat of each parameter
+        ess_bulk: bulk effective sample size of each parameter
+        ess_tail: tail effective sample size of each parameter
+        n_draws: total number of draws (all chains)
+        n_divergent: number of divergent transitions
+        n_max_treedepth: number of transitions saturating the maximum tree depth
+        max_depth: maximum tree depth
+        ebfmi: E-BFMI of each chain
+        warnings: list of the issues found
+    '''
+
+    def __init__(self, names, n_draws):
+        self.names = list(names)
+        self.n_draws = n_draws
+        self.rhat = numpy.full(len(self.names), numpy.nan)
+        self.ess_bulk = numpy.full(len(self.names), numpy.nan)
+        self.ess_tail = numpy.full(len(self.names), numpy.nan)
+        self.n_divergent = None
+        self.n_max_treedepth = None
+        self.max_depth = None
+        self.ebfmi = None
+        self.messages = []
+        self.warnings = []
+
+    @property
+    def warn(self):
+        return len(self.warnings) > 0
+
+    def _add(self, warn, message):
+        self.messages.append(message)
+        if warn:
+            self.warnings.append(message)
+
+    def table(self):
+        '''
+        Returns:
+            str: table of the diagnostics of each parameter
+        '''
+        text = "{:<30}{:>10}{:>12}{:>12}\n".format("parameter", "Rhat", "ESS_bulk", "ESS_tail")
+        for name, a_rhat, bulk, tail in zip(self.names, self.rhat, self.ess_bulk, self.ess_tail):
+            text += "{:<30}{:>10.4f}{:>12.1f}{:>12.1f}\n".format(name, a_rhat, bulk, tail)
+        return text
+
+    def summary(self):
+        '''
+        Returns:
+            str: results of the checks
+        '''
+        return "\n".join(self.messages)
+
+    def to_dict(self):
+        '''
+        Returns:
+            dict: diagnostics (numpy arrays converted into lists)
+        '''
+        return {"names": self.names,
+                "rhat": self.rhat.tolist(),
+                "ess_bulk": self.ess_bulk.tolist(),
+                "ess_tail": self.ess_tail.tolist(),
+                "n_draws": self.n_draws,
+                "n_divergent": self.n_divergent,
+                "n_max_treedepth": self.n_max_treedepth,
+                "max_depth": self.max_depth,
+                "ebfmi": None if self.ebfmi is None else self.ebfmi.tolist(),
+                "warnings": self.warnings}
+
+
+def compute_diagnostics(draws, names, sampler_params=None, max_depth=10,
+                        rhat_threshold=1.1, ess_ratio_threshold=0.001, ebfmi_threshold=0.2):
+    '''
+    Compute all the diagnostics
+    Args:
+        draws: array of shape (chains, draws, parameters) (without warmup)
+        names: names of the parameters
+        sampler_params: dictionary of arrays of shape (chains, draws)
+                        (divergent__, treedepth__, energy__)
+        max_depth: maximum tree depth used by the sampler
+        rhat_threshold: warn if R-hat is above this value
+        ess_ratio_threshold: warn if ESS/draws is below this value
+        ebfmi_threshold: warn if E-BFMI is below this value
+    Returns:
+        ConvergenceDiagnostics
+    '''
+    draws = numpy.asarray(draws, dtype=float)
+    n_chains, n_draws, n_params = draws.shape
+    result = ConvergenceDiagnostics(names, n_chains*n_draws)
+
+    if n_draws >= 4:
+        split = split_chains(draws)
+        # Rank-normalized split R-hat: worst of the bulk and of the folded (tail) draws
+        folded = numpy.abs(draws - numpy.median(draws.reshape(-1, n_params), axis=0))
+        with numpy.errstate(invalid='ignore'):
+            normalized = rank_normalize(split)
+            result.rhat = numpy.fmax(rhat(normalized),
+                                     rhat(rank_normalize(split_chains(folded))))
+            result.ess_bulk = ess(normalized)
+            quantiles = numpy.quantile(draws.reshape(-1, n_params), [0.05, 0.95], axis=0)
+            result.ess_tail = numpy.fmin(ess((split <= quantiles[0]).astype(float)),
+                                         ess((split <= quantiles[1]).astype(float)))
+
+        bad = ~(result.rhat <= rhat_threshold)
+        for name, a_rhat in zip(numpy.asarray(result.names)[bad], result.rhat[bad]):
+            logger.debug('Rhat for parameter {} is {}!'.format(name, a_rhat))
+        if bad.any():
+            result._add(True, 'Rhat above {} for {} parameters indicates that the chains very likely have not mixed.'.format(
+                rhat_threshold, numpy.count_nonzero(bad)))
+        else:
+            result._add(False, 'Rhat looks reasonable for all parameters.')
+
+        ess_min = numpy.fmin(result.ess_bulk, result.ess_tail)
+        bad = ess_min/result.n_draws < ess_ratio_threshold
+        for name, an_ess in zip(numpy.asarray(result.names)[bad], ess_min[bad]):
+            logger.debug('n_eff / iter for parameter {} is {}!'.format(name, an_ess/result.n_draws))
+        if bad.any():
+            result._add(True, 'n_eff / iter below {} for {} parameters indicates that the effective sample size has likely been overestimated.'.format(
+                ess_ratio_threshold, numpy.count_nonzero(bad)))
+        else:
+            result._add(False, 'n_eff / iter looks reasonable for all parameters.')
+    else:
+        logger.warning("Not enough draws to compute Rhat and effective sample sizes")
+
+    if sampler_params is None:
+        return result
+
+    if "divergent__" in sampler_params:
+        divergent = numpy.asarray(sampler_params["divergent__"])
+        n = int(numpy.count_nonzero(divergent))
+        result.n_divergent = n
+        message = '{} of {} iterations ended with a divergence ({}%).'.format(
+            n, divergent.size, 100 * n / divergent.size)
+        if n > 0:
+            message += ' Try running with larger adapt_delta to remove the divergences.'
+        result._add(n > 0, message)
+
+    if "treedepth__" in sampler_params:
+        depths = numpy.asarray(sampler_params["treedepth__"])
+        n = int(numpy.count_nonzero(depths >= max_depth))
+        result.n_max_treedepth = n
+        result.max_depth = max_depth
+        message = ('{} of {} iterations saturated the maximum tree depth of {}.'
+                   + ' ({}%)').format(n, depths.size, max_depth, 100 * n / depths.size)
+        if n > 0:
+            message += ' Run again with max_depth set to a larger value to avoid saturation.'
+        result._add(n > 0, message)
+
+    if "energy__" in sampler_params:
+        energies = numpy.asarray(sampler_params["energy__"], dtype=float)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            result.ebfmi = numpy.sum(numpy.diff(energies, axis=1)**2, axis=1) / \
+                energies.shape[1] / numpy.var(energies, axis=1)
+        bad = result.ebfmi < ebfmi_threshold
+        for chain_num in numpy.flatnonzero(bad):
+            logger.debug('Chain {}: E-BFMI = {}'.format(chain_num, result.ebfmi[chain_num]))
+        if bad.any():
+            result._add(True, 'E-BFMI below {} indicates you may need to reparameterize your model.'.format(
+                ebfmi_threshold))
+        else:
+            result._add(False, 'E-BFMI indicated no pathological behavior.')
+    return result
+
+
+def diagnose_fit(fit, max_depth=10, **kwargs):
+    '''
+    Compute the diagnostics of a PyStan fit, reading the draws and the
+    sampler parameters only once
+    Args:
+        fit: StanFit4Model object
+        max_depth: maximum tree depth used by the sampler
+        kwargs: thresholds (see compute_diagnostics)
+    Returns:
+        ConvergenceDiagnostics
+    '''
+    # Array of shape (draws, chains, flatnames + lp__)
+    draws = numpy.transpose(fit.extract(permuted=False, inc_warmup=False), (1, 0, 2))
+    names = list(fit.flatnames) + ["lp__"]
+    sampler_params = {}
+    chains_params = fit.get_sampler_params(inc_warmup=False)
+    for key in ["divergent__", "treedepth__", "energy__"]:
+        sampler_params[key] = numpy.array([chain_params[key] for chain_params in chains_params])
+    return compute_diagnostics(draws, names, sampler_params, max_depth=max_depth, **kwargs)
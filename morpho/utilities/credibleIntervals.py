@@ -0,0 +1,79 @@
+'''
+Vectorized credible intervals of posterior draws
+Date: 10/18/26
+
+The draws are sorted once (in a copy, or not at all if already sorted) and the
+bounds of all the parameters (columns) and all the credibility levels are
+derived from the sorted array:
+  - highest density intervals (HDI): the widths of all the candidate windows
+    are computed with one subtraction and the shortest one is found with argmin
+  - quantiles, using the same convention as the CalibrationProcessor
+'''
+
+from __future__ import absolute_import
+
+import math
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+def sort_samples(samples):
+    '''
+    Returns:
+        numpy array: sorted copy of the draws (along the first axis)
+    '''
+    return numpy.sort(numpy.asarray(samples, dtype=float), axis=0)
+
+
+def _n_in_interval(n_draws, credibility):
+    # Rounding first, so that e.g. 1000*0.9 gives 900 draws and not 901
+    return min(n_draws, max(1, int(math.ceil(round(n_draws*credibility, 9)))))
+
+
+def highest_density_intervals(samples, credibility, is_sorted=False):
+    '''
+    Shortest intervals containing a fraction credibility of the draws
+    Args:
+        samples: draws, array of shape (n_draws,) or (n_draws, n_params)
+        credibility: float between 0 and 1, or list of floats
+        is_sorted: the draws are already sorted along the first axis
+    Returns:
+        numpy array of shape ([n_levels,] [n_params,] 2): lower and upper bounds
+        (the n_levels axis is present if credibility is a list, the n_params
+        axis if samples is 2D)
+    '''
+    sorted_samples = numpy.asarray(samples, dtype=float) if is_sorted else sort_samples(samples)
+    if sorted_samples.ndim not in [1, 2] or len(sorted_samples) == 0:
+        raise ValueError("Expected a non-empty array of shape (n_draws,) or (n_draws, n_params)")
+    n_draws = len(sorted_samples)
+    levels = numpy.atleast_1d(credibility)
+    columns = (numpy.arange(sorted_samples.shape[1]),) if sorted_samples.ndim == 2 else ()
+    intervals = numpy.empty((len(levels),) + sorted_samples.shape[1:] + (2,))
+    for i_level, level in enumerate(levels):
+        n_in = _n_in_interval(n_draws, level)
+        widths = sorted_samples[n_in - 1:] - sorted_samples[:n_draws - n_in + 1]
+        best = numpy.argmin(widths, axis=0)
+        intervals[i_level, ..., 0] = sorted_samples[(best,) + columns]
+        intervals[i_level, ..., 1] = sorted_samples[(best + n_in - 1,) + columns]
+    return intervals if numpy.ndim(credibility) > 0 else intervals[0]
+
+
+def quantiles(samples, fractions, is_sorted=False):
+    '''
+    Values below which a given fraction of the draws fall: average of the two
+    draws around the fraction (same convention as the CalibrationProcessor)
+    Args:
+        samples: draws, array of shape (n_draws,) or (n_draws, n_params)
+        fractions: float between 0 and 1, or list of floats
+        is_sorted: the draws are already sorted along the first axis
+    Returns:
+        numpy array of shape ([n_fractions,] [n_params]): quantiles
+    '''
+    sorted_samples = numpy.asarray(samples, dtype=float) if is_sorted else sort_samples(samples)
+    n_draws = len(sorted_samples)
+    n_below = numpy.clip(numpy.round(numpy.atleast_1d(fractions)*n_draws).astype(int), 1, n_draws - 1)
+    values = 0.5*(sorted_samples[n_below] + sorted_samples[n_below - 1])
+    return values if numpy.ndim(fractions) > 0 else values[0]
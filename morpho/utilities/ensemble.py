@@ -0,0 +1,147 @@
+'''
+Ensemble runner: execute the same configuration many times
+Date: 10/18/26
+
+The runs are distributed over a pool of worker processes. The workers are
+persistent: modules (ROOT, pystan...) and the compiled Stan models loaded by a
+run are reused by the next runs of the same worker.
+Each run gets its own seed, derived from the ensemble seed and the run number,
+so that any run of the ensemble can be reproduced.
+The tokens "{run}" and "{seed}" (with an optional format, e.g. "{run:04d}")
+in the string values of the configuration are replaced by the run number and
+the seed of the run, for example to give a different output file to each run.
+'''
+
+from __future__ import absolute_import
+
+import re
+import time
+from concurrent import futures
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+_template_pattern = re.compile(r'\{(run|seed)(:[^{}]*)?\}')
+
+
+def get_run_seed(ensemble_seed, run):
+    '''
+    Returns:
+        int: seed of a run, independent of the seeds of the other runs
+    '''
+    return int(numpy.random.SeedSequence(ensemble_seed, spawn_key=(run,)).generate_state(1)[0])
+
+
+def fill_template(value, run, seed):
+    '''
+    Replace the "{run}" and "{seed}" tokens in the strings contained in value
+    Args:
+        value: dictionary, list or value of the configuration
+        run: run number
+        seed: seed of the run
+    Returns:
+        A copy of value; a string made of one token only is replaced by an int
+    '''
+    if isinstance(value, dict):
+        return {key: fill_template(item, run, seed) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill_template(item, run, seed) for item in value]
+    if not isinstance(value, str):
+        return value
+    tokens = {"run": run, "seed": seed}
+    match = _template_pattern.fullmatch(value)
+    if match is not None and match.group(2) is None:
+        return tokens[match.group(1)]
+    return _template_pattern.sub(
+        lambda match: ("{" + (match.group(2) or "") + "}").format(tokens[match.group(1)]), value)
+
+
+def _has_template(value, token):
+    if isinstance(value, dict):
+        return any(_has_template(item, token) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_template(item, token) for item in value)
+    return isinstance(value, str) and any(
+        match.group(1) == token for match in _template_pattern.finditer(value))
+
+
+def _run_one(config_dict, run, seed):
+    '''
+    Run the toolbox once (in a worker)
+    Returns:
+        dict: run number, seed, status and duration of the run
+    '''
+    from morpho.utilities import toolbox
+    start = time.perf_counter()
+    config = fill_template(config_dict, run, seed)
+    config.setdefault("processors-toolbox", {})["seed"] = seed
+    try:
+        success = bool(toolbox.ToolBox(None, config_dict=config).Run())
+        error = None
+    except Exception as err:
+        success = False
+        error = "{}: {}".format(type(err).__name__, err)
+    return {"run": run, "seed": seed, "success": success, "error": error,
+            "wall_time": time.perf_counter() - start}
+
+
+class EnsembleRunner(object):
+    '''
+    Run a configuration n_runs times with a pool of n_workers processes
+
+    Args:
+        config_dict: configuration of the toolbox (with the CLI parameters applied)
+        n_runs: number of runs
+        n_workers: number of worker processes (1: the runs are executed in this process)
+        seed: seed of the ensemble (default: random, printed in the log)
+        first_run: number of the first run (to split an ensemble in several jobs)
+    '''
+
+    def __init__(self, config_dict, n_runs, n_workers=1, seed=None, first_run=0):
+        self.config_dict = config_dict
+        self.n_runs = int(n_runs)
+        self.n_workers = max(1, int(n_workers))
+        if seed is None:
+            seed = int(numpy.random.SeedSequence().entropy % 2**32)
+        self.seed = int(seed)
+        self.first_run = int(first_run)
+        self.results = []
+
+    def Run(self):
+        runs = range(self.first_run, self.first_run + self.n_runs)
+        logger.info("Running an ensemble of {} runs with {} workers (ensemble seed: {})".format(
+            self.n_runs, self.n_workers, self.seed))
+        if self.n_runs > 1 and not _has_template(self.config_dict, "run") and \
+                not _has_template(self.config_dict, "seed"):
+            logger.warning("No '{run}' in the configuration: the runs might overwrite their outputs")
+        start = time.perf_counter()
+        self.results = []
+        if self.n_workers == 1:
+            for run in runs:
+                self._AddResult(_run_one(self.config_dict, run, get_run_seed(self.seed, run)))
+        else:
+            with futures.ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                submitted = [executor.submit(_run_one, self.config_dict, run, get_run_seed(self.seed, run))
+                             for run in runs]
+                for a_future in futures.as_completed(submitted):
+                    self._AddResult(a_future.result())
+        self.results.sort(key=lambda result: result["run"])
+        failed = [result["run"] for result in self.results if not result["success"]]
+        logger.info("Ensemble done in {:.1f} s: {} runs succeeded, {} failed".format(
+            time.perf_counter() - start, self.n_runs - len(failed), len(failed)))
+        if len(failed) > 0:
+            logger.error("Failed runs: {}".format(failed))
+            return False
+        return True
+
+    def _AddResult(self, result):
+        self.results.append(result)
+        if result["success"]:
+            logger.info("Run {} (seed {}) done in {:.1f} s".format(
+                result["run"], result["seed"], result["wall_time"]))
+        else:
+            logger.error("Run {} (seed {}) failed{}".format(
+                result["run"], result["seed"],
+                "" if result["error"] is None else ":\n" + result["error"]))
@@ -38,6 +38,26 @@ def parse_args(req_config_file=True):
     #                default=True,
     #                help='Generate the seed based on the current time in ms',
     #                required=False)
+    p.add_argument('--ensemble',
+                   metavar='<n_runs>',
+                   type=int,
+                   default=None,
+                   help='Run the configuration n_runs times; "{run}" and "{seed}" in the configuration are replaced for each run')
+    p.add_argument('--workers',
+                   metavar='<n_workers>',
+                   type=int,
+                   default=1,
+                   help='Number of processes running the ensemble (Default: 1)')
+    p.add_argument('--seed',
+                   metavar='<seed>',
+                   type=int,
+                   default=None,
+                   help='Seed of the ensemble, from which the seed of each run is derived (Default: random)')
+    p.add_argument('--first-run',
+                   metavar='<first_run>',
+                   type=int,
+                   default=0,
+                   help='Number of the first run of the ensemble (Default: 0)')
     p.add_argument('param', nargs='*',
                    default=False,
                    help='Manualy change of a parameter and its value')
@@ -60,6 +80,36 @@ def parse_args(req_config_file=True):
     return p.parse_args()
 
 
+def parse_cache_args(args=None):
+    '''Parse the command line arguments of "morpho cache"
+    Args:
+        args: list of arguments (default: sys.argv[2:])
+    Returns:
+        namespace: Namespace containing the arguments
+    '''
+    import sys
+    if args is None:
+        args = sys.argv[2:]
+    p = ArgumentParser(prog='morpho cache',
+                       description='List and prune the cached Stan models')
+    p.add_argument('action',
+                   choices=['list', 'prune', 'clear'],
+                   help='list the cached models, remove the least recently used ones or remove all of them')
+    p.add_argument('-d', '--cache-dir',
+                   default='.',
+                   metavar='<cache folder>',
+                   help='Location of the cache folder (Default: .)')
+    p.add_argument('-n', '--max-entries',
+                   type=int,
+                   default=None,
+                   help='Maximum number of models kept by prune')
+    p.add_argument('-s', '--max-size',
+                   type=float,
+                   default=None,
+                   help='Maximum size (in MB) of the cache kept by prune')
+    return p.parse_args(args)
+
+
 def update_from_arguments(the_dict, args):
     '''Update a dictionary
     Args:
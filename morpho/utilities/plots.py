@@ -4,6 +4,8 @@ Authors: J. Johnston, M. Guigue, T. Weiss
 Date: 06/26/18
 '''
 
+import numpy
+
 from morpho.utilities import morphologging, stanConvergenceChecker
 logger = morphologging.getLogger(__name__)
 
@@ -187,7 +189,7 @@ def _fill_hist_grid(input_dict, name_grid,
     '''
     rows, cols = len(name_grid), len(name_grid[0])
     hist_grid = [[None]*cols for i in range(rows)]
-    warmup = input_dict["is_sample"].count(0)
+    warmup = len(input_dict["is_sample"]) - numpy.count_nonzero(input_dict["is_sample"])
     # tree = myfile.Get(input_tree)
     # n = tree.GetEntries()
     # n = len(input_dict[list(input_dict.keys())[0]])
@@ -237,7 +239,7 @@ def _fill_hist_grid_divergence(input_dict, name_grid,
     '''
     rows, cols = len(name_grid), len(name_grid[0])
     hist_grid = [[None]*cols for i in range(rows)]
-    warmup = input_dict["is_sample"].count(0)
+    warmup = len(input_dict["is_sample"]) - numpy.count_nonzero(input_dict["is_sample"])
     for r, row in enumerate(name_grid):
         for c, names in enumerate(row):
             if (names is not None and len(names) == 2):
@@ -7,56 +7,58 @@ Date: 06/26/18
 from morpho.utilities import morphologging
 logger = morphologging.getLogger(__name__)
 
+diagnosticVariableName = ['accept_stat__', 'stepsize__',
+                          'n_leapfrog__', 'treedepth__', 'divergent__', 'energy__']
+
 
 def extract_data_from_outputdata(conf, theOutput):
-    # Extract the data into a dictionary
+    '''
+    Extract the samples of the parameters of interest and the sampler
+    diagnostics into a dictionary of columns.
+    Each column contains the draws of all the chains, one chain after the other.
+    Args:
+        conf: dictionary containing inc_warmup, warmup, interestParams
+              and optionally as_lists (return lists instead of numpy arrays)
+        theOutput: StanFit4Model object
+    Returns:
+        dict: dictionary of numpy arrays (or lists)
+    '''
+    import numpy
     logger.debug("Extracting samples from pyStan output")
     theOutputDiagnostics = theOutput.get_sampler_params(inc_warmup=conf['inc_warmup'])
-    diagnosticVariableName = ['accept_stat__', 'stepsize__',
-                              'n_leapfrog__', 'treedepth__', 'divergent__', 'energy__']
+    # Array of shape (draws, chains, flatnames + lp__)
     theOutputData = theOutput.extract(permuted=False, inc_warmup=conf['inc_warmup'])
+    nEventsPerChain, nChains = theOutputData.shape[0], theOutputData.shape[1]
 
     logger.debug("Transformation into a dict")
-    nEventsPerChain = len(theOutputData)
-    # get the variables in the Stan4Model
-    flatnames = theOutput.flatnames
-    # add the diagnostic variable names
-    flatnames.extend(diagnosticVariableName)
-    # make list of desired variables
-    desired_var = []
-    for a_name in flatnames:
-        for a_key in conf['interestParams']:
-            # this means the desired var is a list
-            if a_name.startswith(a_key+'[') or a_name == a_key:
-                desired_var.append(a_name)
-
-    # Clustering the data together
+    # make list of desired variables: a desired var can be a list (name[i])
+    flatnames = list(theOutput.flatnames)
+    interestParams = set(conf['interestParams'])
+    desired_index = [iKey for iKey, a_name in enumerate(flatnames)
+                     if a_name.split('[')[0] in interestParams]
+    # lp__ is stored after the flatnames
+    desired_index.append(len(flatnames))
+
+    # (desired, chains, draws) -> one contiguous row per variable, chains concatenated
+    selectedData = numpy.transpose(
+        theOutputData[:, :, desired_index], (2, 1, 0)).reshape(len(desired_index), -1)
+
     theOutputDataDict = {}
-    for key in desired_var:
-        theOutputDataDict.update({str(key): []})
+    for iRow, iKey in enumerate(desired_index[:-1]):
+        theOutputDataDict.update({str(flatnames[iKey]): selectedData[iRow]})
     for key in diagnosticVariableName:
-        theOutputDataDict.update({str(key): []})
-    theOutputDataDict.update({"lp_prob": []})
-    theOutputDataDict.update({"delta_energy__": []})
-    theOutputDataDict.update({"is_sample": []})
-
-    for iChain in range(0, conf['chains']):
-        for iEvents in range(0, nEventsPerChain):
-            for iKey, key in enumerate(flatnames):
-                if key in diagnosticVariableName:
-                    theOutputDataDict[str(key)].append(
-                        theOutputDiagnostics[iChain][key][iEvents])
-                else:
-                    if key in desired_var:
-                        theOutputDataDict[str(key)].append(
-                            theOutputData[iEvents][iChain][iKey])
-            if iEvents is not 0:
-                theOutputDataDict["delta_energy__"].append(
-                    theOutputDiagnostics[iChain]['energy__'][iEvents]-theOutputDiagnostics[iChain]['energy__'][iEvents-1])
-            else:
-                theOutputDataDict["delta_energy__"].append(0)
-            theOutputDataDict["lp_prob"].append(
-                theOutputData[iEvents][iChain][len(theOutput.flatnames)])
-            theOutputDataDict["is_sample"].append(
-                0 if iEvents < conf['warmup'] else 1)
+        theOutputDataDict.update({str(key): numpy.concatenate(
+            [numpy.asarray(chainDiagnostics[key]) for chainDiagnostics in theOutputDiagnostics])})
+    theOutputDataDict.update({"lp_prob": selectedData[-1]})
+    theOutputDataDict.update({"delta_energy__": numpy.concatenate(
+        [numpy.diff(chainDiagnostics['energy__'], prepend=chainDiagnostics['energy__'][:1])
+         for chainDiagnostics in theOutputDiagnostics])})
+    # Without warmup in the output, all the draws are samples
+    nWarmup = conf['warmup'] if conf['inc_warmup'] else 0
+    theOutputDataDict.update({"is_sample": numpy.tile(
+        (numpy.arange(nEventsPerChain) >= nWarmup).astype(int), nChains)})
+
+    if conf.get('as_lists', False):
+        for key, value in theOutputDataDict.items():
+            theOutputDataDict[key] = value.tolist()
     return theOutputDataDict
@@ -0,0 +1,94 @@
+'''
+Lazy registry of processors: the module defining a processor is only
+imported when the processor class is requested
+Date: 10/18/26
+'''
+
+from __future__ import absolute_import
+
+import importlib
+import sys
+import types
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+# Packages whose processors can be accessed from the top-level morpho module
+processor_packages = ["morpho.processors.IO",
+                      "morpho.processors.diagnostics",
+                      "morpho.processors.misc",
+                      "morpho.processors.plots",
+                      "morpho.processors.sampling"]
+
+
+class LazyPackage(types.ModuleType):
+    '''
+    Module type used by the processor packages.
+    The package holds a registry {"ClassName": ".module"}; the module is
+    imported the first time the class is accessed.
+    '''
+
+    def __getattr__(self, name):
+        # Only called when the attribute has not been loaded yet
+        registry = self.__dict__.get("_lazy_registry", {})
+        if name not in registry:
+            raise AttributeError("module '{}' has no attribute '{}'".format(
+                self.__name__, name))
+        logger.debug("Importing {} from {}{}".format(
+            name, self.__name__, registry[name]))
+        module = importlib.import_module(registry[name], self.__name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        # The import system binds a freshly imported submodule on its package:
+        # keep exposing the processor class rather than its module.
+        registry = self.__dict__.get("_lazy_registry", {})
+        if isinstance(value, types.ModuleType) and name in registry and hasattr(value, name):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self.__dict__.get("_lazy_registry", {})))
+
+
+def make_lazy(package_name, registry):
+    '''
+    Turn an already imported package into a LazyPackage
+    Args:
+        package_name: name of the package (usually __name__)
+        registry: dictionary {"ClassName": ".module"}
+    '''
+    package = sys.modules[package_name]
+    package._lazy_registry = dict(registry)
+    package.__all__ = list(registry.keys())
+    package.__class__ = LazyPackage
+    return package
+
+
+def find_processor(name):
+    '''
+    Look for a processor class in the morpho processor packages.
+    Only the module defining this processor is imported.
+    Args:
+        name: name of the processor class
+    Returns:
+        class: the processor class, or None if unknown
+    '''
+    for package_name in processor_packages:
+        package = importlib.import_module(package_name)
+        if name in package._lazy_registry:
+            return getattr(package, name)
+    return None
+
+
+def list_processors():
+    '''
+    Returns:
+        list: names of all the registered processors
+    '''
+    names = []
+    for package_name in processor_packages:
+        names.extend(importlib.import_module(package_name)._lazy_registry.keys())
+    return names
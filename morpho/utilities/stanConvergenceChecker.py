@@ -9,6 +9,10 @@ Ported to morpho 2 by Joe Johnston, 5-20-19
 These tests are motivated here:
 http://mc-stan.org/users/documentation/case-studies/pystan_workflow.html
 
+check_n_eff and check_rhat use the summary of the fit; check_all_diagnostics
+uses the rank-normalized split R-hat and the bulk/tail effective sample sizes
+of convergenceDiagnostics.
+
 Functions:
   - check_div: Check how many transitions ended with a divergence
   - check_treedepth: Check how many transitions failed due to tree depth
@@ -90,9 +94,8 @@ def check_energy(fit):
     sampler_params = fit.get_sampler_params(inc_warmup=False)
     no_warning = True
     for chain_num, s in enumerate(sampler_params):
-        energies = s['energy__']
-        numer = sum((energies[i] - energies[i - 1]) **
-                    2 for i in range(1, len(energies))) / len(energies)
+        energies = numpy.asarray(s['energy__'])
+        numer = numpy.sum(numpy.diff(energies)**2) / len(energies)
         denom = numpy.var(energies)
         if numer / denom < 0.2:
             print('Chain {}: E-BFMI = {}'.format(chain_num, numer / denom))
@@ -171,16 +174,9 @@ def check_all_diagnostics(fit):
         checks for divergence, treee depth, energy Bayesian fraction
         of missing energy, effective sample size, and Rhat
     '''
-    n_eff_warn, n_eff_str = check_n_eff(fit)
-    rhat_warn, rhat_str = check_rhat(fit)
-    div_warn, div_str = check_div(fit)
-    treedepth_warn, treedepth_str = check_treedepth(fit)
-    energy_warn, energy_str = check_energy(fit)
-    warn = n_eff_warn or rhat_warn or div_warn or \
-        treedepth_warn or energy_warn
-    check_str = n_eff_str + '\n' + rhat_str + '\n' + div_str + \
-        '\n' + treedepth_str + '\n' + energy_str
-    return((warn, check_str))
+    from morpho.utilities import convergenceDiagnostics
+    diagnostics = convergenceDiagnostics.diagnose_fit(fit)
+    return((diagnostics.warn, diagnostics.summary()))
 
 
 def partition_div(fit_results, parameter_name):
@@ -196,7 +192,7 @@ def partition_div(fit_results, parameter_name):
         transitions, the second contains all divergent transitions.
         Warmup iterations are excluded from the returned arrays
     '''
-    warmup = fit_results["is_sample"].count(0)
+    warmup = len(fit_results["is_sample"]) - numpy.count_nonzero(fit_results["is_sample"])
     div = numpy.array(fit_results['divergent__'][warmup:]).astype('int')
     data = numpy.array(fit_results[parameter_name][warmup:])
     nondiv_params = data[div == 0]
@@ -0,0 +1,329 @@
+'''
+Cache of compiled Stan models, safe to use by several processes at the same time
+Date: 10/18/26
+
+The compiled models are pickled in a cache folder.
+- A model is compiled only once: the first process takes an exclusive lock on
+  the entry while compiling, the others wait and then load the pickle.
+- The pickles are written in a temporary file and then renamed, so that a
+  partially written file is never read.
+- The cache key contains the Stan code and the versions of pystan, python and
+  the compilers used (as given by "$CC --version").
+- The number of entries and the total size of the cache can be limited: the
+  least recently used entries are removed first.
+- The models already loaded are kept in memory (per process), so that
+  several processors using the same code do not unpickle it again.
+'''
+
+from __future__ import absolute_import
+
+import os
+import glob
+import time
+import shlex
+import pickle
+import platform
+import sysconfig
+import threading
+import subprocess
+from hashlib import md5
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking (Windows)
+    fcntl = None
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+# Models already loaded by this process: {code_hash: model}
+_loaded_models = {}
+_loaded_models_lock = threading.Lock()
+_code_hash_locks = {}
+# Versions of the compilers: {command: output of "command --version"}
+_compiler_versions = {}
+
+
+def get_loaded_model(code_hash):
+    '''
+    Returns:
+        model: the model with this code hash already loaded in this process, or None
+    '''
+    with _loaded_models_lock:
+        return _loaded_models.get(code_hash)
+
+
+def register_loaded_model(code_hash, model):
+    '''
+    Keep a loaded model in memory for the next processors of this process
+    '''
+    with _loaded_models_lock:
+        _loaded_models[code_hash] = model
+
+
+def clear_loaded_models():
+    '''
+    Forget the models loaded by this process
+    '''
+    with _loaded_models_lock:
+        _loaded_models.clear()
+
+
+def _get_code_hash_lock(code_hash):
+    with _loaded_models_lock:
+        return _code_hash_locks.setdefault(code_hash, threading.Lock())
+
+
+class _FileLock(object):
+    '''
+    Exclusive lock using a lock file (no-op if fcntl is not available)
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __enter__(self):
+        self._file = open(self.filename, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+
+
+def get_compiler_version(command):
+    '''
+    Args:
+        command: compiler command (e.g. "gcc -pthread")
+    Returns:
+        str: command and output of "command --version" (the command only if it fails)
+    '''
+    if command not in _compiler_versions:
+        try:
+            output = subprocess.run(shlex.split(command) + ["--version"], stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, timeout=30).stdout.decode('utf-8', 'replace')
+        except Exception as err:
+            logger.debug("Cannot get the version of {}: {}".format(command, err))
+            output = ""
+        _compiler_versions[command] = "{} ({})".format(command, output.strip())
+    return _compiler_versions[command]
+
+
+def get_build_signature():
+    '''
+    Returns:
+        str: versions of pystan, python and the compilers used to build the models
+    '''
+    try:
+        import pystan
+        pystan_version = pystan.__version__
+    except ImportError:
+        pystan_version = "none"
+    return "pystan={};python={};cc={};cxx={}".format(
+        pystan_version, platform.python_version(),
+        get_compiler_version(str(os.environ.get("CC", sysconfig.get_config_var("CC")))),
+        get_compiler_version(str(os.environ.get("CXX", sysconfig.get_config_var("CXX")))))
+
+
+def get_code_hash(model_code):
+    '''
+    Args:
+        model_code: Stan code of the model (after including the functions)
+    Returns:
+        str: md5 of the code and of the build signature
+    '''
+    return md5((model_code + get_build_signature()).encode('utf-8')).hexdigest()
+
+
+class StanModelCache(object):
+    '''
+    Cache of compiled Stan models
+
+    Args:
+        cache_dir: location of the cache folder
+        max_entries: maximum number of cached models (default=None: no limit)
+        max_size: maximum size of the cache in MB (default=None: no limit)
+    '''
+
+    def __init__(self, cache_dir='.', max_entries=None, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+    def get_filename(self, code_hash, model_name=None):
+        if model_name is None:
+            return os.path.join(self.cache_dir, 'cached-model-{}.pkl'.format(code_hash))
+        return os.path.join(self.cache_dir, 'cached-{}-{}.pkl'.format(model_name, code_hash))
+
+    def _makedirs(self):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            logger.info("Creating 'cache' folder: {}".format(self.cache_dir))
+
+    def _load(self, cache_fn):
+        with open(cache_fn, 'rb') as cache_file:
+            model = pickle.load(cache_file)
+        # The modification time is used as last access time for the LRU eviction
+        os.utime(cache_fn, None)
+        return model
+
+    def _save(self, model, cache_fn):
+        tmp_fn = "{}.{}.tmp".format(cache_fn, os.getpid())
+        with open(tmp_fn, 'wb') as cache_file:
+            pickle.dump(model, cache_file)
+        os.replace(tmp_fn, cache_fn)
+        logger.debug("Saved Stan cache in {}".format(cache_fn))
+
+    def get_shared(self, code_hash, cache_fn, create_model, force_recreate=False, save=True):
+        '''
+        Return the model already loaded by this process, or load/create it
+        with get_or_create and keep it in memory
+        Args:
+            code_hash: hash of the model code (see get_code_hash)
+            other arguments: see get_or_create
+        Returns:
+            model: the compiled model
+        '''
+        # Threads asking for the same model wait for the first one to load it
+        with _get_code_hash_lock(code_hash):
+            model = None if force_recreate else get_loaded_model(code_hash)
+            if model is not None:
+                logger.debug("Using StanModel already loaded: {}".format(code_hash))
+                return model
+            model = self.get_or_create(cache_fn, create_model,
+                                       force_recreate=force_recreate, save=save)
+            register_loaded_model(code_hash, model)
+        return model
+
+    def get_or_create(self, cache_fn, create_model, force_recreate=False, save=True):
+        '''
+        Load a model from the cache or create it (and save it) if missing
+        Args:
+            cache_fn: name of the cache file
+            create_model: function without argument returning the compiled model
+            force_recreate: compile and save the model even if the cache exists
+            save: save the created model in the cache
+        Returns:
+            model: the compiled model
+        '''
+        if not force_recreate and os.path.exists(cache_fn):
+            try:
+                logger.debug("Trying to load cached StanModel")
+                model = self._load(cache_fn)
+                logger.debug("Using cached StanModel: {}".format(cache_fn))
+                return model
+            except Exception as err:
+                logger.warning("Cannot load {}:\n{}".format(cache_fn, err))
+        if not save:
+            logger.debug("Creating Stan model (not cached)")
+            return create_model()
+        self._makedirs()
+        with _FileLock(cache_fn + ".lock"):
+            # Another process might have created the model while we were waiting
+            if not force_recreate and os.path.exists(cache_fn):
+                try:
+                    model = self._load(cache_fn)
+                    logger.debug("Using cached StanModel: {}".format(cache_fn))
+                    return model
+                except Exception as err:
+                    logger.warning("Corrupted cache {}; recreating it:\n{}".format(cache_fn, err))
+            logger.debug("Creating Stan cache")
+            model = create_model()
+            self._save(model, cache_fn)
+        self.prune(keep=[cache_fn])
+        return model
+
+    def list_entries(self):
+        '''
+        Returns:
+            list: dictionaries (filename, size in MB, last_used) of the cached models,
+                  from the most to the least recently used
+        '''
+        entries = []
+        for cache_fn in glob.glob(os.path.join(self.cache_dir, 'cached-*.pkl')):
+            try:
+                stat = os.stat(cache_fn)
+            except OSError:
+                continue
+            entries.append({"filename": cache_fn,
+                            "size": stat.st_size/1024./1024.,
+                            "last_used": stat.st_mtime})
+        return sorted(entries, key=lambda entry: entry["last_used"], reverse=True)
+
+    def prune(self, max_entries=None, max_size=None, keep=None):
+        '''
+        Remove the least recently used models until the cache fits the limits
+        Args:
+            max_entries: maximum number of models (default: limit of the cache)
+            max_size: maximum size in MB (default: limit of the cache)
+            keep: list of files which should not be removed
+        Returns:
+            list: removed files
+        '''
+        if max_entries is None:
+            max_entries = self.max_entries
+        if max_size is None:
+            max_size = self.max_size
+        if (max_entries is None and max_size is None) or not os.path.isdir(self.cache_dir):
+            return []
+        if keep is None:
+            keep = []
+        removed = []
+        with _FileLock(os.path.join(self.cache_dir, '.cache.lock')):
+            entries = self.list_entries()
+            n_entries = len(entries)
+            total_size = sum(entry["size"] for entry in entries)
+            for entry in reversed(entries):
+                too_many = max_entries is not None and n_entries > max_entries
+                too_big = max_size is not None and total_size > max_size
+                if not too_many and not too_big:
+                    break
+                if entry["filename"] in keep:
+                    continue
+                # The lock file is kept: another process might be holding it
+                try:
+                    os.remove(entry["filename"])
+                except OSError as err:
+                    logger.warning("Cannot remove {}: {}".format(entry["filename"], err))
+                    continue
+                logger.info("Removing {} from the Stan cache".format(entry["filename"]))
+                removed.append(entry["filename"])
+                n_entries -= 1
+                total_size -= entry["size"]
+        return removed
+
+    def clear(self):
+        '''
+        Remove all the cached models
+        Returns:
+            list: removed files
+        '''
+        return self.prune(max_entries=0)
+
+
+def cache_command(args):
+    '''
+    Execute the "morpho cache" command
+    Args:
+        args: namespace returned by parser.parse_cache_args
+    '''
+    cache = StanModelCache(args.cache_dir)
+    if args.action == "list":
+        entries = cache.list_entries()
+        for entry in entries:
+            print("{}\t{:.1f} MB\t{}".format(entry["filename"], entry["size"],
+                                              time.strftime('%Y-%m-%d %H:%M:%S',
+                                                            time.localtime(entry["last_used"]))))
+        print("{} models, {:.1f} MB".format(len(entries), sum(entry["size"] for entry in entries)))
+    elif args.action == "prune":
+        removed = cache.prune(max_entries=args.max_entries, max_size=args.max_size)
+        print("{} models removed".format(len(removed)))
+    elif args.action == "clear":
+        removed = cache.clear()
+        print("{} models removed".format(len(removed)))
+    return 0
@@ -6,24 +6,85 @@ Authors: M. Guigue
 Date: 06/26/18
 '''
 import os
+import sys
+import copy
+import time
+import random
 import importlib
+import json
+import pickle
+import tracemalloc
+from hashlib import md5
+from concurrent import futures
 
-from morpho.utilities import morphologging, parser
+from morpho.utilities import morphologging, parser, reader
 logger = morphologging.getLogger(__name__)
 
 
+def _run_processor(proc_object):
+    '''
+    Run a processor and return it (needed when the processor is run in another process)
+    '''
+    return proc_object.Run(), proc_object
+
+
+def _get_size(value):
+    '''
+    Approximate size (in bytes) of a variable given from a processor to another
+    '''
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_get_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_get_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
 class ToolBox:
     '''
     Manages processors requested by the user at run-time.
     Via a configuration file, the user defines which processor to use, how to
     configure them and how to connect them.
+    The connections (and the optional "depends_on" list of each processor)
+    define a dependency graph: processors with no pending dependencies can be run
+    concurrently by setting "n_workers" in the "processors-toolbox" block.
+
+    Parameters (processors-toolbox block):
+        processors (required): list of processors ("type", "name" and optionally "depends_on")
+        connections: list of connections ("signal" and "slot")
+        n_workers: number of processors run at the same time (default=1)
+        executor: use a "thread" or "process" pool for concurrent processors (default="thread")
+        cache_dir: if given, outputs of the processors are cached in this folder and reused
+            when the type, configuration, inputs and seed of a processor are unchanged (default=None).
+            Only processors giving variables to other processors and with "cache: True"
+            in their entry of the processors list are cached; random processors should
+            only be cached if the seed (below, or their own) is fixed.
+            The files of the configuration are identified by their size and modification
+            time before any processor is run: a file written by another processor is not
+            seen as modified, so its reader should list the writer in "depends_on".
+        report: path of a JSON file where the time and memory used by each processor,
+            and the size of the data given between processors are saved (default=None)
+        profile_memory: trace the memory allocations using tracemalloc (slower) (default=False)
+        seed: seed of the python and numpy random generators, used by the processors
+            drawing random numbers (default=None: not seeded)
+
+    Args:
+        args: namespace given by the CLI parser (config file and parameters)
+        config_dict: configuration dictionary used instead of the configuration file
     '''
 
-    def __init__(self, args):
-        self._ReadConfigFile(args.config)
-        self._UpdateConfigFromCLI(args)
+    def __init__(self, args, config_dict=None):
+        if config_dict is None:
+            self._ReadConfigFile(args.config)
+            self._UpdateConfigFromCLI(args)
+        else:
+            self.config_dict = copy.deepcopy(config_dict)
         self._processors_dict = dict()
         self._chain_processors = []
+        self._dependencies = dict()
+        self._cache_keys = dict()
+        self._report = None
 
     def _ReadConfigFile(self, filename):
         if os.path.exists(filename):
@@ -57,6 +118,10 @@ class ToolBox:
                 logger.error(
                     "Could not create processor <{}>; exiting".format(a_dict["name"]))
                 return False
+            self._processors_dict[a_dict["name"]]["dependsOn"] = list(
+                a_dict.get("depends_on", []))
+            self._processors_dict[a_dict["name"]]["type"] = a_dict["type"]
+            self._processors_dict[a_dict["name"]]["cache"] = a_dict.get("cache", False)
         for _, processor in self._processors_dict.items():
             procName = processor["object"].name
             if procName in self.config_dict.keys():
@@ -79,16 +144,24 @@ class ToolBox:
             module_name = "morpho"
             processor_name = procClass
         # importing module (morpho is default)
+        # morpho processors are registered lazily: only the module defining
+        # the requested processor (and its dependencies) is imported here
         try:
             module = importlib.import_module(module_name)
         except:
             logger.error("Cannot import module {}".format(module_name))
             return False
+        try:
+            processor_class = getattr(module, processor_name)
+        except Exception as err:
+            logger.error("Cannot import {} from {}:\n{}".format(
+                processor_name, module_name, err))
+            return False
 
         try:
             self._processors_dict.update({procName:
                                           {
-                                              "object": getattr(module, processor_name)(procName),
+                                              "object": processor_class(procName),
                                               "variableToGive": [],  # -> variable to give after execution
                                               # -> which processor need to give its output to this processor
                                               "procToBeConnectedTo": [],
@@ -99,9 +172,9 @@ class ToolBox:
             logger.info("Processor <{}> ({}:{}) created".format(
                 procName, module_name, processor_name))
             return True
-        except:
-            logger.error("Cannot import {} from {}".format(
-                processor_name, "morpho"))
+        except Exception as err:
+            logger.error("Cannot create {} from {}:\n{}".format(
+                processor_name, module_name, err))
             return False
 
     def _ConnectProcessors(self, nameProc):
@@ -117,6 +190,11 @@ class ToolBox:
             try:
                 val = getattr(proc_object, var_to_give)
                 setattr(proc_object_to_update, var_to_be_connected_to, val)
+                if self._report is not None:
+                    self._report["connections"].append({
+                        "signal": "{}:{}".format(nameProc, var_to_give),
+                        "slot": "{}:{}".format(proc_name_to_update, var_to_be_connected_to),
+                        "size_bytes": _get_size(val)})
             except Exception as err:
                 logger.error("Connection {}:{} -> {}:{} failed:\n{}".format(nameProc,
                                                                             var_to_give, proc_name_to_update, var_to_be_connected_to, err))
@@ -149,10 +227,143 @@ class ToolBox:
         for a_processor in self._processors_dict.keys():
             if a_processor not in self._chain_processors:
                 self._chain_processors.append(a_processor)
+        if not self._DefineDependencies():
+            return False
+        if not self._DefineCacheKeys():
+            return False
         logger.debug("Sequence of processors: {}".format(
             self._sequenceProcessors()))
         return True
 
+    def _DefineDependencies(self):
+        '''
+        Build the dependency graph of the processors from the connections and the
+        "depends_on" lists, and sort the chain of processors accordingly.
+        The order given by the connections is kept when there is no dependency.
+        '''
+        self._dependencies = {name: set() for name in self._chain_processors}
+        for proc_name in self._chain_processors:
+            for a_slot_proc in self._processors_dict[proc_name]["procToBeConnectedTo"]:
+                self._dependencies[a_slot_proc].add(proc_name)
+            for a_dependency in self._processors_dict[proc_name].get("dependsOn", []):
+                if a_dependency not in self._processors_dict:
+                    logger.error("Processor <{}> not defined but used as dependency of <{}>".format(
+                        a_dependency, proc_name))
+                    return False
+                self._dependencies[proc_name].add(a_dependency)
+
+        # Topological sort (Kahn's algorithm)
+        sorted_chain = []
+        remaining = list(self._chain_processors)
+        while len(remaining) > 0:
+            ready = [name for name in remaining if self._dependencies[name].issubset(sorted_chain)]
+            if len(ready) == 0:
+                logger.error("Circular dependency between processors: {}".format(remaining))
+                return False
+            sorted_chain.append(ready[0])
+            remaining.remove(ready[0])
+        self._chain_processors = sorted_chain
+        return True
+
+    def _DefineCacheKeys(self):
+        '''
+        Compute the cache key of each processor from its type, its configuration,
+        the toolbox seed and the keys of the processors it depends on.
+        Files given in the configuration are identified by their path, size and
+        modification time.
+        '''
+        def _file_stamps(value):
+            if isinstance(value, dict):
+                return [_file_stamps(item) for item in value.values()]
+            if isinstance(value, list):
+                return [_file_stamps(item) for item in value]
+            if isinstance(value, str) and os.path.isfile(value):
+                stat = os.stat(value)
+                return [value, stat.st_size, stat.st_mtime]
+            return None
+
+        # Random processors draw their seeds from the generators seeded by the
+        # toolbox: each run of an ensemble has its own seed and its own outputs
+        seed = reader.read_param(
+            self.config_dict, "processors-toolbox.seed", None)
+        self._cache_keys = dict()
+        for proc_name in self._chain_processors:
+            inputs = []
+            for a_proc_name in self._dependencies[proc_name]:
+                a_proc = self._processors_dict[a_proc_name]
+                for var_to_give, slot_proc, slot_var in zip(a_proc["variableToGive"],
+                                                            a_proc["procToBeConnectedTo"],
+                                                            a_proc["varToBeConnectedTo"]):
+                    if slot_proc == proc_name:
+                        inputs.append([self._cache_keys[a_proc_name], var_to_give, slot_var])
+                inputs.append([self._cache_keys[a_proc_name]])
+            config = self.config_dict.get(proc_name, dict())
+            description = json.dumps({"type": self._processors_dict[proc_name]["type"],
+                                      "config": config,
+                                      "seed": seed,
+                                      "files": _file_stamps(config),
+                                      "inputs": sorted(inputs)},
+                                     sort_keys=True, default=str)
+            self._cache_keys[proc_name] = md5(
+                description.encode('utf-8')).hexdigest()
+        return True
+
+    def _CacheFileName(self, a_processor):
+        '''
+        Name of the file where the outputs of a processor are cached;
+        None if the processor should not be cached.
+        '''
+        cache_dir = reader.read_param(
+            self.config_dict, "processors-toolbox.cache_dir", None)
+        proc_dict = self._processors_dict[a_processor]
+        if cache_dir is None or not proc_dict["cache"] or len(proc_dict["variableToGive"]) == 0:
+            return None
+        return os.path.join(cache_dir, "{}-{}.pkl".format(
+            a_processor, self._cache_keys[a_processor]))
+
+    def _LoadFromCache(self, a_processor):
+        '''
+        Set the outputs of a processor from the cache.
+        Returns True if the processor does not need to be run.
+        '''
+        cache_fn = self._CacheFileName(a_processor)
+        if cache_fn is None or not os.path.exists(cache_fn):
+            return False
+        try:
+            with open(cache_fn, 'rb') as cache_file:
+                outputs = pickle.load(cache_file)
+            for var_name, value in outputs.items():
+                setattr(self._processors_dict[a_processor]['object'], var_name, value)
+        except Exception as err:
+            logger.warning("Cannot load cached outputs of <{}> from {}:\n{}".format(
+                a_processor, cache_fn, err))
+            return False
+        logger.info("Outputs of <{}> loaded from {}".format(a_processor, cache_fn))
+        return True
+
+    def _SaveToCache(self, a_processor):
+        '''
+        Save the outputs of a processor (variables given to other processors) in the cache
+        '''
+        cache_fn = self._CacheFileName(a_processor)
+        if cache_fn is None:
+            return
+        proc_object = self._processors_dict[a_processor]['object']
+        try:
+            outputs = {var_name: getattr(proc_object, var_name)
+                       for var_name in set(self._processors_dict[a_processor]["variableToGive"])}
+            cdir = os.path.dirname(cache_fn)
+            if cdir != '' and not os.path.exists(cdir):
+                os.makedirs(cdir)
+                logger.info("Creating cache folder: {}".format(cdir))
+            # Write then rename, so that a partially written file is never read
+            with open(cache_fn + ".tmp", 'wb') as cache_file:
+                pickle.dump(outputs, cache_file)
+            os.replace(cache_fn + ".tmp", cache_fn)
+            logger.debug("Outputs of <{}> saved in {}".format(a_processor, cache_fn))
+        except Exception as err:
+            logger.warning("Cannot cache outputs of <{}>:\n{}".format(a_processor, err))
+
     def _sequenceProcessors(self):
         seqWithArrows = self._chain_processors[0]
         for item in self._chain_processors[1:]:
@@ -163,7 +374,14 @@ class ToolBox:
         '''
         Execute the chain of processors
         '''
+        n_workers = int(reader.read_param(
+            self.config_dict, "processors-toolbox.n_workers", 1))
+        if n_workers > 1:
+            return self._RunGraph(n_workers)
         for a_processor in self._chain_processors:
+            if self._LoadFromCache(a_processor):
+                self._FinalizeProcessor(a_processor)
+                continue
             try:
                 if not self._processors_dict[a_processor]['object'].Run():
                     logger.error("Result <{}> incorrect".format(a_processor))
@@ -172,17 +390,126 @@ class ToolBox:
                 logger.error(
                     "Error while running <{}>:\n{}".format(a_processor, err))
                 raise err
-            self._ConnectProcessors(a_processor)
-            if self._processors_dict[a_processor]['object'].delete:
-                self._processors_dict[a_processor]['deleted'] = True
-                logger.info("Deleting <{}>".format(a_processor))
-                del self._processors_dict[a_processor]['object']
+            self._SaveToCache(a_processor)
+            self._FinalizeProcessor(a_processor)
         return True
 
+    def _RunGraph(self, n_workers):
+        '''
+        Execute the processors following the dependency graph:
+        a processor is submitted to the pool as soon as all the processors it depends on are done.
+        '''
+        executor_type = reader.read_param(
+            self.config_dict, "processors-toolbox.executor", "thread")
+        if executor_type == "process":
+            Executor = futures.ProcessPoolExecutor
+        elif executor_type == "thread":
+            Executor = futures.ThreadPoolExecutor
+        else:
+            logger.error("Unknown executor <{}>; choose between 'thread' and 'process'".format(
+                executor_type))
+            return False
+        logger.info("Running processors with {} {} workers".format(
+            n_workers, executor_type))
+
+        done = set()
+        running = dict()
+        with Executor(max_workers=n_workers) as executor:
+            while len(done) < len(self._chain_processors):
+                for a_processor in self._chain_processors:
+                    if a_processor in done or a_processor in running.values():
+                        continue
+                    if self._dependencies[a_processor].issubset(done):
+                        if self._LoadFromCache(a_processor):
+                            self._FinalizeProcessor(a_processor)
+                            done.add(a_processor)
+                            continue
+                        logger.debug("Submitting <{}>".format(a_processor))
+                        running.update({executor.submit(
+                            _run_processor, self._processors_dict[a_processor]['object']): a_processor})
+                finished, _ = futures.wait(
+                    running.keys(), return_when=futures.FIRST_COMPLETED)
+                for a_future in finished:
+                    a_processor = running.pop(a_future)
+                    try:
+                        success, proc_object = a_future.result()
+                    except Exception as err:
+                        logger.error(
+                            "Error while running <{}>:\n{}".format(a_processor, err))
+                        for a_pending in running:
+                            a_pending.cancel()
+                        raise err
+                    if not success:
+                        logger.error("Result <{}> incorrect".format(a_processor))
+                        for a_pending in running:
+                            a_pending.cancel()
+                        return False
+                    # The processor might have been run in another process
+                    self._processors_dict[a_processor]['object'] = proc_object
+                    self._SaveToCache(a_processor)
+                    self._FinalizeProcessor(a_processor)
+                    done.add(a_processor)
+        return True
+
+    def _FinalizeProcessor(self, a_processor):
+        '''
+        Give the outputs of a processor to the connected processors and delete it if needed
+        '''
+        self._ConnectProcessors(a_processor)
+        if self._report is not None:
+            self._CollectStats(a_processor)
+        if self._processors_dict[a_processor]['object'].delete:
+            self._processors_dict[a_processor]['deleted'] = True
+            logger.info("Deleting <{}>".format(a_processor))
+            del self._processors_dict[a_processor]['object']
+
+    def _CollectStats(self, a_processor):
+        '''
+        Add the resources used by a processor to the report
+        '''
+        proc_object = self._processors_dict[a_processor]['object']
+        proc_stats = {"type": self._processors_dict[a_processor]["type"]}
+        proc_stats.update(getattr(proc_object, "stats", dict()))
+        proc_stats.update({"cached": "Run" not in proc_stats})
+        output_size = sum(item["size_bytes"] for item in self._report["connections"]
+                          if item["signal"].split(":")[0] == a_processor)
+        proc_stats.update({"output_bytes": output_size})
+        if "Run" in proc_stats and proc_stats["Run"]["wall_time"] > 0:
+            proc_stats.update(
+                {"throughput_bytes_per_s": output_size/proc_stats["Run"]["wall_time"]})
+        self._report["processors"].update({a_processor: proc_stats})
+
+    def _WriteReport(self, report_fn):
+        '''
+        Save the report as a JSON file
+        '''
+        rdir = os.path.dirname(report_fn)
+        if rdir != '' and not os.path.exists(rdir):
+            os.makedirs(rdir)
+            logger.debug("Creating folder: {}".format(rdir))
+        with open(report_fn, 'w') as report_file:
+            json.dump(self._report, report_file, indent=4)
+        logger.info("Report saved in {}".format(report_fn))
+
     def Run(self):
-        import json
         logger.debug("Configuration:\n{}".format(
             json.dumps(self.config_dict, indent=4)))
+        report_fn = reader.read_param(
+            self.config_dict, "processors-toolbox.report", None)
+        if report_fn is not None:
+            self._report = {"processors": dict(), "connections": []}
+        profile_memory = reader.read_param(
+            self.config_dict, "processors-toolbox.profile_memory", False)
+        if profile_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        seed = reader.read_param(
+            self.config_dict, "processors-toolbox.seed", None)
+        if seed is not None:
+            logger.info("Random generators seeded with {}".format(seed))
+            random.seed(seed)
+            import numpy
+            numpy.random.seed(int(seed) % 2**32)
+        wall_start = time.perf_counter()
         if not self._CreateAndConfigureProcessors():
             logger.error("Error while creating and configuring processors!")
             return False
@@ -192,6 +519,13 @@ class ToolBox:
         if not self._RunChain():
             logger.error("Error while running processors!")
             return False
+        if report_fn is not None:
+            self._report.update({"wall_time": time.perf_counter() - wall_start})
+            if profile_memory:
+                self._report.update(
+                    {"allocated_peak_kb": tracemalloc.get_traced_memory()[1]/1024.})
+            self._WriteReport(report_fn)
+        return True
 
     def GetProcessor(procName):
         if self._processors_dict[str(procName)]['deleted']:
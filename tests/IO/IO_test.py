@@ -111,6 +111,259 @@ class IOTests(unittest.TestCase):
             logger.info("{} -> size = {}".format(key, len(data[key])))
             self.assertEqual(len(data[key]), 6)
 
+    def test_ROOTIOSingleOpen(self):
+        logger.info("IOROOT single open test")
+        from unittest import mock
+        import uproot
+        from morpho.processors.IO import IOROOTProcessor
+        writer_config = {
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myTest.root",
+            "variables": ["x", "y"]
+        }
+        reader_config = {
+            "action": "read",
+            "tree_name": "test",
+            "filename": ["myTest.root", "myTest.root"],
+            "variables": ["x", "y"]
+        }
+        a = IOROOTProcessor("WriterROOT")
+        b = IOROOTProcessor("ReaderROOT")
+        a.Configure(writer_config)
+        b.Configure(reader_config)
+        a.data = input_data
+        a.Run()
+        with mock.patch.object(uproot, "open", wraps=uproot.open) as uproot_open:
+            self.assertTrue(b.Run())
+        # Each file is opened once to count and read its entries
+        self.assertEqual(uproot_open.call_count, 2)
+        self.assertEqual(b.data["x"].dtype.name, "int32")
+        self.assertEqual(b.data["x"].tolist(), input_data["x"]*2)
+
+    def test_ROOTIOFallback(self):
+        logger.info("IOROOT reading with ROOT test")
+        from unittest import mock
+        import uproot
+        from morpho.processors.IO import IOROOTProcessor
+        writer_config = {
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myTest.root",
+            "variables": ["x", "y", {"variable": "list", "root_alias": "myList", "type": "double"}]
+        }
+        reader_config = {
+            "action": "read",
+            "tree_name": "test",
+            "filename": "myTest.root",
+            "variables": ["x", "y", "myList"],
+            "entry_start": 1,
+            "step_size": 2
+        }
+        a = IOROOTProcessor("WriterROOT")
+        b = IOROOTProcessor("ReaderROOT")
+        a.Configure(writer_config)
+        b.Configure(reader_config)
+        a.data = input_data
+        a.Run()
+        # uproot fails: the tree is read with ROOT
+        with mock.patch.object(uproot, "open", side_effect=IOError("uproot failure")):
+            self.assertTrue(b.Run())
+        self.assertEqual(b.data["x"].tolist(), input_data["x"][1:])
+        self.assertEqual(b.data["myList"].shape, (5, 2))
+        self.assertEqual(b.data["myList"].tolist(), input_data["list"][1:])
+
+    def test_ROOTIOMultipleFiles(self):
+        logger.info("IOROOT multiple files test")
+        from morpho.processors.IO import IOROOTProcessor
+        from morpho.utilities import chunks
+        writer_config = {
+            "action": "write",
+            "tree_name": "test",
+            "variables": ["x"]
+        }
+        for i_file in range(2):
+            writer_config["filename"] = "myRun_{}.root".format(i_file)
+            a = IOROOTProcessor("WriterROOT")
+            a.Configure(writer_config)
+            a.data = {"x": input_data["x"][3*i_file:3*i_file + 3]}
+            self.assertTrue(a.Run())
+        reader_config = {
+            "action": "read",
+            "tree_name": "test",
+            "filename": "myRun_*.root",
+            "variables": ["x"],
+            "file_index": "file"
+        }
+        b = IOROOTProcessor("ReaderROOT")
+        b.Configure(reader_config)
+        self.assertTrue(b.Run())
+        self.assertEqual(b.data["x"].tolist(), input_data["x"])
+        self.assertEqual(b.data["file"].tolist(), [0, 0, 0, 1, 1, 1])
+        reader_config.update({"streaming": True, "step_size": 2})
+        b.Configure(reader_config)
+        self.assertTrue(b.Run())
+        self.assertEqual(b.data.n_entries, 6)
+        self.assertEqual(chunks.read_all(b.data)["file"].tolist(), [0, 0, 0, 1, 1, 1])
+        # Empty file among the files
+        writer_config["filename"] = "myRun_empty.root"
+        a.Configure(writer_config)
+        a.data = {"x": []}
+        self.assertTrue(a.Run())
+        for file_names, file_index in [(["myRun_empty.root", "myRun_0.root", "myRun_1.root"], [1, 1, 1, 2, 2, 2]),
+                                       (["myRun_0.root", "myRun_empty.root", "myRun_1.root"], [0, 0, 0, 2, 2, 2])]:
+            reader_config.update({"filename": file_names, "streaming": False})
+            b.Configure(reader_config)
+            self.assertTrue(b.Run())
+            self.assertEqual(b.data["x"].tolist(), input_data["x"])
+            self.assertEqual(b.data["file"].tolist(), file_index)
+
+    def test_ROOTIOFileOption(self):
+        logger.info("IOROOT file option test")
+        from morpho.processors.IO import IOROOTProcessor
+        writer_config = {
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myOptionTest.root",
+            "variables": ["x"],
+            "file_option": "new"
+        }
+        a = IOROOTProcessor("WriterROOT")
+        a.Configure(writer_config)
+        a.data = {"x": input_data["x"]}
+        self.assertTrue(a.Run())
+        # The existing file is not overwritten
+        a.data = {"x": [0]}
+        self.assertFalse(a.Run())
+        writer_config["file_option"] = "create"
+        a.Configure(writer_config)
+        a.data = {"x": [0]}
+        self.assertFalse(a.Run())
+        writer_config["file_option"] = "append"
+        a.Configure(writer_config)
+        a.data = {"x": [0]}
+        self.assertFalse(a.Run())
+        b = IOROOTProcessor("ReaderROOT")
+        b.Configure({
+            "action": "read",
+            "tree_name": "test",
+            "filename": "myOptionTest.root",
+            "variables": ["x"]
+        })
+        self.assertTrue(b.Run())
+        self.assertEqual(b.data["x"].tolist(), input_data["x"])
+        writer_config["file_option"] = "recreate"
+        a.Configure(writer_config)
+        a.data = {"x": [0]}
+        self.assertTrue(a.Run())
+        self.assertTrue(b.Run())
+        self.assertEqual(b.data["x"].tolist(), [0])
+
+    def test_ROOTIOEmptyTree(self):
+        logger.info("IOROOT empty tree test")
+        from morpho.processors.IO import IOROOTProcessor
+        a = IOROOTProcessor("WriterROOT")
+        a.Configure({
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myEmptyTest.root",
+            "variables": ["x", {"variable": "y", "type": "double"}]
+        })
+        a.data = {"x": [], "y": []}
+        self.assertTrue(a.Run())
+        b = IOROOTProcessor("ReaderROOT")
+        b.Configure({
+            "action": "read",
+            "tree_name": "test",
+            "filename": "myEmptyTest.root",
+            "variables": ["x", "y"]
+        })
+        self.assertTrue(b.Run())
+        self.assertEqual(sorted(b.data.keys()), ["x", "y"])
+        self.assertEqual(len(b.data["x"]), 0)
+        self.assertEqual(b.data["y"].dtype.name, "float64")
+        # Range without entries
+        a.Configure({
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myEmptyTest.root",
+            "variables": ["x"]
+        })
+        a.data = {"x": [1, 2, 3]}
+        self.assertTrue(a.Run())
+        b.Configure({
+            "action": "read",
+            "tree_name": "test",
+            "filename": "myEmptyTest.root",
+            "variables": ["x"],
+            "entry_start": 5
+        })
+        self.assertTrue(b.Run())
+        self.assertEqual(b.data["x"].tolist(), [])
+        self.assertEqual(b.data["x"].dtype.name, "int32")
+
+    def test_ROOTIOTypes(self):
+        logger.info("IOROOT typed and compressed writing test")
+        import uproot
+        from morpho.processors.IO import IOROOTProcessor
+        writer_config = {
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myTypedTest.root",
+            "compression": "LZ4:4",
+            "basket_size": 2,
+            "variables": [
+                {"variable": "x", "type": "long"},
+                {"variable": "y", "type": "double"},
+                {"variable": "x", "root_alias": "x_int"},
+                {"variable": "y", "root_alias": "y_float"},
+                {"variable": "list", "root_alias": "myList", "type": "float"}
+            ]
+        }
+        a = IOROOTProcessor("WriterROOT")
+        a.Configure(writer_config)
+        a.data = input_data
+        self.assertTrue(a.Run())
+        infile = uproot.open("myTypedTest.root")
+        tree = infile["test"]
+        # Variables without type keep the historical int/float branches
+        self.assertEqual(tree.typenames(), {"x": "int64_t", "y": "double", "x_int": "int32_t",
+                                            "y_float": "float", "myList": "float[2]"})
+        self.assertEqual(str(infile.file.compression), "LZ4(4)")
+        self.assertEqual(tree["x"].num_baskets, 3)
+        self.assertEqual(tree["x"].array(library="np").tolist(), input_data["x"])
+
+    def test_ROOTIOStreaming(self):
+        logger.info("IOROOT streaming test")
+        from morpho.processors.IO import IOROOTProcessor
+        from morpho.utilities import chunks
+        writer_config = {
+            "action": "write",
+            "tree_name": "test",
+            "filename": "myTest.root",
+            "variables": ["x", "y"]
+        }
+        reader_config = {
+            "action": "read",
+            "tree_name": "test",
+            "filename": "myTest.root",
+            "variables": ["x", "y"],
+            "entry_start": 1,
+            "entry_stop": 5,
+            "step_size": 3,
+            "streaming": True
+        }
+        a = IOROOTProcessor("WriterROOT")
+        b = IOROOTProcessor("ReaderROOT")
+        a.Configure(writer_config)
+        b.Configure(reader_config)
+        a.data = input_data
+        a.Run()
+        b.Run()
+        self.assertTrue(chunks.is_stream(b.data))
+        self.assertEqual([len(chunk["x"]) for chunk in b.data], [3, 1])
+        self.assertEqual(chunks.read_all(b.data)["x"].tolist(), input_data["x"][1:5])
+
     def test_RIO(self):
         logger.info("IOR test")
         from morpho.processors.IO import IORProcessor
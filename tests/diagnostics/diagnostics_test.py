@@ -51,6 +51,61 @@ class DiagnosticsTests(unittest.TestCase):
 
         calibProc.Run()
 
+        # Several intervals in one pass
+        proc_config["cred_interval"] = [[0.16, 0.84], [0.05, 0.95], [0.9]]
+        calibProc.Configure(proc_config)
+        calibProc.Run()
+        self.assertEqual(len(calibProc.results["x"]), 3)
+        self.assertEqual(calibProc.coverage_table["x"]["credibility"], [0.84-0.16, 0.95-0.05, 0.9])
+
+        # Only the files read successfully are kept in the summary cache
+        import json
+        import os
+        proc_config.update({"files": ["calib.root", "missing_calib.root"], "summary_cache": "calib_cache.json"})
+        calibProc.Configure(proc_config)
+        calibProc.Run()
+        with open("calib_cache.json", "r") as cache_file:
+            cache = json.load(cache_file)
+        self.assertIn(os.path.abspath("calib.root"), cache)
+        self.assertNotIn(os.path.abspath("missing_calib.root"), cache)
+
+    def test_ConvergenceDiagnostics(self):
+        logger.info("Convergence diagnostics test")
+        import numpy
+        from morpho.utilities import convergenceDiagnostics
+        rng = numpy.random.RandomState(1)
+        draws = rng.normal(size=(4, 1000, 3))
+        sampler_params = {"divergent__": numpy.zeros((4, 1000)),
+                          "treedepth__": numpy.full((4, 1000), 3),
+                          "energy__": rng.normal(size=(4, 1000))}
+        result = convergenceDiagnostics.compute_diagnostics(draws, ["a", "b", "c"], sampler_params)
+        logger.debug("\n"+result.table())
+        self.assertFalse(result.warn)
+        self.assertTrue(numpy.all(numpy.abs(result.rhat - 1) < 0.01))
+        self.assertTrue(numpy.all(result.ess_bulk > 2000))
+        # Chains not mixed
+        draws[0] += 3
+        result = convergenceDiagnostics.compute_diagnostics(draws, ["a", "b", "c"], sampler_params)
+        self.assertTrue(result.warn)
+        self.assertTrue(numpy.all(result.rhat > 1.1))
+
+    def test_CredibleIntervals(self):
+        logger.info("Credible intervals test")
+        import numpy
+        from morpho.utilities import credibleIntervals
+        rng = numpy.random.RandomState(2)
+        samples = rng.exponential(size=(1000, 2))
+        intervals = credibleIntervals.highest_density_intervals(samples, [0.5, 0.9])
+        self.assertEqual(intervals.shape, (2, 2, 2))
+        # Brute force: shortest window containing 900 draws
+        sorted_x = numpy.sort(samples[:, 1])
+        widths = [sorted_x[i+899] - sorted_x[i] for i in range(101)]
+        best = int(numpy.argmin(widths))
+        self.assertEqual(list(intervals[1, 1]), [sorted_x[best], sorted_x[best+899]])
+        # The input is not modified
+        self.assertFalse(numpy.all(numpy.diff(samples[:, 0]) >= 0))
+        self.assertAlmostEqual(credibleIntervals.quantiles(numpy.arange(10.), 0.5), 4.5)
+
 if __name__ == '__main__':
 
     args = parser.parse_args(False)
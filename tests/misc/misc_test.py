@@ -25,6 +25,345 @@ class MiscTests(unittest.TestCase):
         logger.debug("Assistant processor returned: {}".format(assistantProcessor.results))
         self.assertEqual(assistantProcessor.results,"value=10")
 
+    def test_LazyRegistry(self):
+        logger.info("Lazy processor registry test")
+        import sys
+        import morpho
+        from morpho.processors.misc import ProcessorAssistant
+        self.assertIn("PyBindRooFitProcessor", morpho.__all__)
+        self.assertIs(morpho.ProcessorAssistant, ProcessorAssistant)
+        # Requesting a processor should not import the unrelated ones
+        self.assertNotIn("morpho.processors.sampling.PyBindRooFitProcessor", sys.modules)
+
+    def test_EnsembleTemplate(self):
+        logger.info("Ensemble template test")
+        from morpho.utilities import ensemble
+        config = {"writer": {"filename": "run_{run:03d}_{seed}.json", "seed": "{seed}"}}
+        seed = ensemble.get_run_seed(42, 7)
+        self.assertEqual(seed, ensemble.get_run_seed(42, 7))
+        self.assertNotEqual(seed, ensemble.get_run_seed(42, 8))
+        filled = ensemble.fill_template(config, 7, seed)
+        self.assertEqual(filled["writer"]["filename"], "run_007_{}.json".format(seed))
+        self.assertEqual(filled["writer"]["seed"], seed)
+        self.assertEqual(config["writer"]["seed"], "{seed}")
+
+    def test_EnsembleCache(self):
+        logger.info("Ensemble with cache test")
+        import json
+        import os
+        import tempfile
+        from morpho.utilities import ensemble
+        tmp_dir = tempfile.mkdtemp()
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "PriorSamplingProcessor", "name": "prior", "cache": True},
+                    {"type": "IOJSONProcessor", "name": "writer"}
+                ],
+                "connections": [{"signal": "prior:results", "slot": "writer:data"}],
+                "cache_dir": os.path.join(tmp_dir, "cache")
+            },
+            "prior": {"priors": [{"name": "a", "prior_dist": "normal", "prior_params": [0, 1]}]},
+            "writer": {"action": "write",
+                       "filename": os.path.join(tmp_dir, "run_{run}.json"),
+                       "variables": ["a"]}
+        }
+        self.assertTrue(ensemble.EnsembleRunner(config, 2, seed=1).Run())
+        values = []
+        for run in range(2):
+            with open(os.path.join(tmp_dir, "run_{}.json".format(run))) as json_file:
+                values.append(json.load(json_file)["a"])
+        # Each run has its own seed: the cached outputs of the first run are not reused
+        self.assertNotEqual(values[0], values[1])
+
+    def test_ToolBoxCache(self):
+        logger.info("ToolBox cache test")
+        import json
+        import os
+        import tempfile
+        from morpho.utilities import toolbox
+        tmp_dir = tempfile.mkdtemp()
+        input_fn = os.path.join(tmp_dir, "input.json")
+        with open(input_fn, "w") as json_file:
+            json.dump({"x": [1, 2, 3], "y": [4, 5, 6]}, json_file)
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "IOJSONProcessor", "name": "reader", "cache": True},
+                    {"type": "IOJSONProcessor", "name": "writer"}
+                ],
+                "connections": [{"signal": "reader:data", "slot": "writer:data"}],
+                "cache_dir": os.path.join(tmp_dir, "cache")
+            },
+            "reader": {"filename": input_fn, "variables": ["x"], "delete": False},
+            "writer": {"action": "write", "filename": os.path.join(tmp_dir, "output.json"), "variables": ["x"]}
+        }
+
+        def reader_was_run():
+            myToolBox = toolbox.ToolBox(None, config_dict=config)
+            self.assertTrue(myToolBox.Run())
+            return "Run" in myToolBox._processors_dict["reader"]["object"].stats
+
+        self.assertTrue(reader_was_run())
+        self.assertFalse(reader_was_run())
+        config["reader"]["variables"] = ["x", "y"]
+        self.assertTrue(reader_was_run())
+        self.assertFalse(reader_was_run())
+        mtime = os.stat(input_fn).st_mtime + 10
+        os.utime(input_fn, (mtime, mtime))
+        self.assertTrue(reader_was_run())
+
+    def test_ToolBoxGraph(self):
+        logger.info("ToolBox dependency graph test")
+        import os
+        import tempfile
+        from morpho.utilities import toolbox
+        tmp_dir = tempfile.mkdtemp()
+        data_fn = os.path.join(tmp_dir, "data.json")
+        prior_config = {"priors": [{"name": "a", "prior_dist": "normal", "prior_params": [0, 1]}],
+                        "delete": False}
+        config = {
+            "processors-toolbox": {
+                # The reader is given first but depends on the writer
+                "processors": [
+                    {"type": "IOJSONProcessor", "name": "reader", "depends_on": ["writer"]},
+                    {"type": "IOJSONProcessor", "name": "writer"},
+                    {"type": "PriorSamplingProcessor", "name": "prior"}
+                ],
+                "connections": [{"signal": "prior:results", "slot": "writer:data"}],
+                "n_workers": 2
+            },
+            "prior": prior_config,
+            "writer": {"action": "write", "filename": data_fn, "variables": ["a"]},
+            "reader": {"filename": data_fn, "variables": ["a"], "delete": False}
+        }
+        myToolBox = toolbox.ToolBox(None, config_dict=config)
+        self.assertTrue(myToolBox.Run())
+        self.assertEqual(myToolBox._chain_processors, ["prior", "writer", "reader"])
+        self.assertEqual(myToolBox._processors_dict["reader"]["object"].data["a"],
+                         myToolBox._processors_dict["prior"]["object"].results["a"])
+
+        # Circular dependency
+        cycle_config = dict(config)
+        cycle_config["processors-toolbox"] = dict(config["processors-toolbox"])
+        cycle_config["processors-toolbox"]["processors"] = [
+            {"type": "IOJSONProcessor", "name": "reader", "depends_on": ["writer"]},
+            {"type": "IOJSONProcessor", "name": "writer", "depends_on": ["reader"]},
+            {"type": "PriorSamplingProcessor", "name": "prior"}
+        ]
+        self.assertFalse(toolbox.ToolBox(None, config_dict=cycle_config).Run())
+
+        # A failing processor stops the processors depending on it
+        os.remove(data_fn)
+        failing_config = dict(config)
+        failing_config["processors-toolbox"] = dict(config["processors-toolbox"])
+        failing_config["processors-toolbox"]["connections"] = [
+            {"signal": "prior:results", "slot": "writer:data"},
+            {"signal": "reader:data", "slot": "prior:fixed_inputs"}]
+        failing_config["processors-toolbox"]["processors"] = [
+            {"type": "IOJSONProcessor", "name": "reader"},
+            {"type": "IOJSONProcessor", "name": "writer"},
+            {"type": "PriorSamplingProcessor", "name": "prior"}
+        ]
+        # The reader fails: the variable is not in the file
+        other_fn = os.path.join(tmp_dir, "other.json")
+        with open(other_fn, "w") as json_file:
+            json_file.write('{"x": 1}')
+        failing_config["reader"] = {"filename": other_fn, "variables": ["a"]}
+        self.assertFalse(toolbox.ToolBox(None, config_dict=failing_config).Run())
+        self.assertFalse(os.path.exists(data_fn))
+
+        # Outputs given to the downstream processors by the worker processes
+        process_config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "PriorSamplingProcessor", "name": "first"},
+                    {"type": "PriorSamplingProcessor", "name": "second"}
+                ],
+                "connections": [{"signal": "first:results", "slot": "second:fixed_inputs"}],
+                "n_workers": 2,
+                "executor": "process"
+            },
+            "first": prior_config,
+            "second": {"priors": [{"name": "b", "prior_dist": "normal", "prior_params": [0, 1]}],
+                       "delete": False}
+        }
+        myToolBox = toolbox.ToolBox(None, config_dict=process_config)
+        self.assertTrue(myToolBox.Run())
+        first = myToolBox._processors_dict["first"]["object"].results
+        second = myToolBox._processors_dict["second"]["object"].results
+        self.assertEqual(sorted(second.keys()), ["a", "b"])
+        self.assertEqual(second["a"], first["a"])
+
+    def test_ToolBoxReport(self):
+        logger.info("ToolBox report test")
+        import json
+        import os
+        import tempfile
+        import tracemalloc
+        from morpho.utilities import toolbox
+        tmp_dir = tempfile.mkdtemp()
+        report_fn = os.path.join(tmp_dir, "report.json")
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "PriorSamplingProcessor", "name": "prior"},
+                    {"type": "IOJSONProcessor", "name": "writer"}
+                ],
+                "connections": [{"signal": "prior:results", "slot": "writer:data"}],
+                "report": report_fn,
+                "profile_memory": True
+            },
+            "prior": {"priors": [{"name": "a", "prior_dist": "normal", "prior_params": [0, 1]}]},
+            "writer": {"action": "write", "filename": os.path.join(tmp_dir, "data.json"), "variables": ["a"]}
+        }
+        self.assertTrue(toolbox.ToolBox(None, config_dict=config).Run())
+        tracemalloc.stop()
+        with open(report_fn) as report_file:
+            report = json.load(report_file)
+        self.assertGreaterEqual(report["wall_time"], 0)
+        self.assertEqual(sorted(report["processors"].keys()), ["prior", "writer"])
+        for proc_stats in report["processors"].values():
+            self.assertFalse(proc_stats["cached"])
+            for step in ["Configure", "Run"]:
+                self.assertEqual(sorted(proc_stats[step].keys()),
+                                 ["allocated_kb", "allocated_peak_kb", "cpu_time", "peak_rss_delta_kb", "wall_time"])
+                for key in ["allocated_peak_kb", "cpu_time", "peak_rss_delta_kb", "wall_time"]:
+                    self.assertGreaterEqual(proc_stats[step][key], 0)
+        self.assertGreater(report["processors"]["prior"]["output_bytes"], 0)
+        self.assertEqual(report["connections"][0]["signal"], "prior:results")
+
+    def test_StanModelCache(self):
+        logger.info("Stan model cache test")
+        import multiprocessing
+        import os
+        import tempfile
+        import time
+        from morpho.utilities.stanModelCache import StanModelCache
+        tmp_dir = tempfile.mkdtemp()
+        cache = StanModelCache(tmp_dir)
+        compiled_fn = os.path.join(tmp_dir, "compiled.txt")
+
+        def create_model():
+            # Slow compilation, recorded in a file shared by the processes
+            with open(compiled_fn, "a") as compiled_file:
+                compiled_file.write("compiled\n")
+            time.sleep(0.5)
+            return {"model": "a"}
+
+        # Save and load
+        cache_fn = cache.get_filename("a", "model")
+        self.assertEqual(cache.get_or_create(cache_fn, create_model), {"model": "a"})
+        self.assertEqual(cache.get_or_create(cache_fn, create_model), {"model": "a"})
+        with open(compiled_fn) as compiled_file:
+            self.assertEqual(len(compiled_file.readlines()), 1)
+
+        # Processes asking for the same model at the same time compile it once
+        cache_fn = cache.get_filename("b", "model")
+        os.remove(compiled_fn)
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=cache.get_or_create, args=(cache_fn, create_model))
+                     for _ in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        with open(compiled_fn) as compiled_file:
+            self.assertEqual(len(compiled_file.readlines()), 1)
+        self.assertTrue(os.path.exists(cache_fn))
+
+        # The least recently used models are removed first, the lock files are kept
+        cache_fn = cache.get_filename("c", "model")
+        cache.get_or_create(cache_fn, create_model)
+        for i, code_hash in enumerate(["b", "a", "c"]):
+            os.utime(cache.get_filename(code_hash, "model"), (1000 + i, 1000 + i))
+        removed = cache.prune(max_entries=1)
+        self.assertEqual(sorted(removed), [cache.get_filename("a", "model"), cache.get_filename("b", "model")])
+        self.assertEqual([entry["filename"] for entry in cache.list_entries()], [cache_fn])
+        self.assertTrue(os.path.exists(cache.get_filename("b", "model") + ".lock"))
+
+    def test_SharedStanModels(self):
+        logger.info("Shared Stan models test")
+        import tempfile
+        import threading
+        import time
+        from morpho.utilities import stanModelCache
+        stanModelCache.clear_loaded_models()
+        compiled = []
+
+        def create_model():
+            compiled.append(1)
+            time.sleep(0.2)
+            return object()
+
+        # Two processors using the same model share the loaded object
+        first = stanModelCache.StanModelCache(tempfile.mkdtemp())
+        second = stanModelCache.StanModelCache(tempfile.mkdtemp())
+        model = first.get_shared("hash", first.get_filename("hash"), create_model)
+        self.assertIs(second.get_shared("hash", second.get_filename("hash"), create_model), model)
+        self.assertEqual(len(compiled), 1)
+
+        # Concurrent requests of the same model compile it once
+        models = []
+        threads = [threading.Thread(target=lambda: models.append(
+            first.get_shared("other", first.get_filename("other"), create_model))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(compiled), 2)
+        self.assertEqual(len(models), 4)
+        self.assertTrue(all(other is models[0] for other in models))
+        stanModelCache.clear_loaded_models()
+
+    def test_Accumulators(self):
+        logger.info("Online accumulators test")
+        import numpy
+        from morpho.utilities.accumulators import RunningStats, QuantileSketch, BinomialCounter
+        values = numpy.random.RandomState(3).exponential(size=10000)
+        stats, other_stats = RunningStats(), RunningStats()
+        sketch, other_sketch = QuantileSketch(), QuantileSketch()
+        for value in values[:5000]:
+            stats.add(value)
+            sketch.add(value)
+        other_stats.add_many(values[5000:])
+        other_sketch.add_many(values[5000:])
+        stats.merge(other_stats)
+        sketch.merge(other_sketch)
+        self.assertEqual(stats.count, 10000)
+        self.assertAlmostEqual(stats.mean, values.mean())
+        self.assertAlmostEqual(stats.variance, values.var(ddof=1))
+        self.assertEqual((stats.min, stats.max), (values.min(), values.max()))
+        for q in [0.01, 0.5, 0.99]:
+            self.assertLess(abs((values <= sketch.quantile(q)).mean() - q), 0.005)
+        counter = BinomialCounter()
+        for success in [True, False, True, True]:
+            counter.add(success)
+        self.assertEqual(counter.fraction, 0.75)
+
+    def test_FillColumns(self):
+        logger.info("Chunks concatenation test")
+        import numpy
+        from morpho.utilities import chunks
+        first = {"x": numpy.arange(3), "y": numpy.ones((3, 2))}
+        second = {"x": numpy.arange(3, 5), "y": numpy.zeros((2, 2))}
+        columns = chunks.fill_columns([first, second], 4)
+        self.assertEqual(columns["x"].tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(columns["y"].shape, (5, 2))
+        # Missing or extra column
+        with self.assertRaises(ValueError):
+            chunks.fill_columns([first, {"x": numpy.arange(2)}], 5)
+        with self.assertRaises(ValueError):
+            chunks.fill_columns([{"x": numpy.arange(2)}, first], 5)
+        # Different dtype or shape
+        with self.assertRaises(ValueError):
+            chunks.fill_columns([first, {"x": numpy.ones(2), "y": numpy.zeros((2, 2))}], 5)
+        with self.assertRaises(ValueError):
+            chunks.fill_columns([first, {"x": numpy.arange(2), "y": numpy.zeros((2, 3))}], 5)
+        # Different lengths in the same chunk
+        with self.assertRaises(ValueError):
+            chunks.fill_columns([{"x": numpy.arange(2), "y": numpy.zeros((3, 2))}], 3)
+
 if __name__ == '__main__':
 
     args = parser.parse_args(False)
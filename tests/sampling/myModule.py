@@ -3,9 +3,14 @@ A super simple module for unittest
 '''
 
 from math import cos
+import numpy
 from morpho.utilities import morphologging
 logger = morphologging.getLogger(__name__)
 
 
 def myFunction(x, a, b, c):
     return abs(cos(b*x)+c)
+
+
+def myVectorizedFunction(x, a, b, c):
+    return numpy.abs(numpy.cos(b*x)+c)
@@ -119,6 +119,7 @@ class SamplingTests(unittest.TestCase):
 
     def test_PyBind(self):
         logger.info("PyBind tester")
+        import numpy
         from morpho.processors.sampling.PyBindRooFitProcessor import PyBindRooFitProcessor
         from morpho.processors.plots import Histogram, APosterioriDistribution
         pybind_gene_config = {
@@ -228,6 +229,31 @@ class SamplingTests(unittest.TestCase):
         # lsampler.data = sampler.data
         self.assertTrue(myhisto.Run())
         self.assertTrue(fitter.Run())
+        # Same fit with a compiled expression
+        expression_config = dict(pybind_fit_config)
+        expression_config.update({"expression": "abs(cos(b*x)+c)"})
+        del expression_config["module_name"], expression_config["function_name"]
+        expressionFitter = PyBindRooFitProcessor("expressionFitter")
+        self.assertTrue(expressionFitter.Configure(expression_config))
+        expressionFitter.data = sampler.data
+        self.assertTrue(expressionFitter.Run())
+        for param in ['b', 'c']:
+            self.assertAlmostEqual(expressionFitter.result[param], fitter.result[param], places=2)
+        # Same generation with a vectorized function tabulated on x
+        vectorized_config = dict(pybind_gene_config)
+        vectorized_config.update({"function_name": "myVectorizedFunction",
+                                  "vectorized": True,
+                                  "seed": 3})
+        vectorizedSampler = PyBindRooFitProcessor("vectorizedSampler")
+        self.assertTrue(vectorizedSampler.Configure(vectorized_config))
+        self.assertTrue(vectorizedSampler.Run())
+        x, vectorized_x = numpy.array(sampler.data["x"]), numpy.array(vectorizedSampler.data["x"])
+        self.assertAlmostEqual(vectorized_x.mean(), x.mean(), delta=0.3)
+        self.assertAlmostEqual(vectorized_x.std(), x.std(), delta=0.3)
+        # The grid does not depend on the parameters: they cannot float
+        vectorized_config = dict(pybind_fit_config)
+        vectorized_config.update({"function_name": "myVectorizedFunction", "vectorized": True})
+        self.assertFalse(PyBindRooFitProcessor("vectorizedFitter").Configure(vectorized_config))
         # self.assertTrue(lsampler.Run())
         # aposterioriPlotter.data = lsampler.results
         # timeSeriesPlotter.data = lsampler.results
@@ -336,6 +362,7 @@ class SamplingTests(unittest.TestCase):
                 "width": [0., 5.]
             },
             "n_jobs": 3,
+            "chain": 2,
             "mode": "lsampling"
         }
         aposteriori_config = {
@@ -381,6 +408,7 @@ class SamplingTests(unittest.TestCase):
         # Run lsampler generator and plot timeseries
         self.assertTrue(lsampler.Run())
         aPostPlotter.data = lsampler.results
+        self.assertEqual(sorted(set(lsampler.results["chain"])), [0, 1])
         self.assertTrue(aPostPlotter.Run())
 
         # Run fitter
@@ -388,6 +416,58 @@ class SamplingTests(unittest.TestCase):
         self.assertTrue(fitter.Run())
         logger.info("Fit Results: {}".format(fitter.result))
 
+        # Run toys
+        toys_config = dict(fitter_config)
+        toys_config.update({"mode": "toys",
+                            "iter": 500,
+                            "n_toys": 10,
+                            "seed": 5,
+                            "observables": ['x'],
+                            "trueValues": {'mean': 1., 'width': 0.2}})
+        toys = GaussianRooFitProcessor("toys")
+        self.assertTrue(toys.Configure(toys_config))
+        self.assertTrue(toys.Run())
+        self.assertEqual(list(toys.results["toy"]), list(range(10)))
+        self.assertEqual(len(toys.results["pull_mean"]), 10)
+        # The width is floating but not a parameter of interest: the toys should not depend
+        # on the fits of the previous toys, whatever the number of toys per batch
+        toys_config.update({"interestParams": ['mean'], "n_toys": 4})
+        fewToys = GaussianRooFitProcessor("fewToys")
+        self.assertTrue(fewToys.Configure(toys_config))
+        self.assertTrue(fewToys.Run())
+        self.assertNotIn("pull_width", fewToys.results)
+        self.assertEqual(list(fewToys.results["mean"]), list(toys.results["mean"][:4]))
+
+        # Run profile likelihood scan
+        scan_config = dict(fitter_config)
+        scan_config.update({"mode": "scan",
+                            "scanParams": {'mean': [0.9, 1.1, 11]}})
+        scanner = GaussianRooFitProcessor("scanner")
+        self.assertTrue(scanner.Configure(scan_config))
+        scanner.data = sampler.data
+        self.assertTrue(scanner.Run())
+        self.assertEqual(len(scanner.results["delta_nll"]), 11)
+        self.assertEqual(min(scanner.results["delta_nll"]), 0)
+        best = list(scanner.results["delta_nll"]).index(0)
+        nearest = min(range(11), key=lambda i: abs(scanner.results["mean"][i] - fitter.result["mean"]))
+        self.assertEqual(best, nearest)
+
+    def test_NumpyToDatahist(self):
+        logger.info("Bulk RooDataHist import test")
+        import ROOT
+        from morpho.processors.sampling.RooFitInterfaceProcessor import numpy_to_datahist
+        x = ROOT.RooRealVar("x", "x", 0, 4)
+        x.setBins(4)
+        data = numpy_to_datahist("counts", [x], {"x": [0.5, 1.5, 1.5, 3.5, 3.5, 3.5]})
+        for i, count in enumerate([1, 2, 0, 3]):
+            data.get(i)
+            self.assertEqual(data.weight(), count)
+            # Sum of the squared weights of the events, not the squared count
+            self.assertEqual(data.weightSquared(), count)
+        data = numpy_to_datahist("weighted", [x], {"x": [0.5, 0.5]}, weights=[2., 3.])
+        data.get(0)
+        self.assertEqual((data.weight(), data.weightSquared()), (5., 13.))
+
 
 if __name__ == '__main__':
     args = parser.parse_args(False)